@@ -1,6 +1,13 @@
 import json
+import threading
+from pathlib import Path
 import gradio as gr
-from outcome_switch import OutcomeSwitchingDetector, get_sections_text
+from outcome_switch import get_sections_text
+from outcome_switch.cache import DiskCache
+from outcome_switch.ctgov import registry_outcomes_tuples, set_registry_cache
+from outcome_switch.entrez import set_xml_cache
+from outcome_switch.metrics import MetricsRegistry, RequestProfiler, add_metrics_hook, serve_health, set_profiler
+from outcome_switch.stage_cache import StageCache, set_stage_cache
 from outcome_switch.visual import (
     get_article_markdown,
     get_highlighted_text,
@@ -9,22 +16,84 @@ from outcome_switch.visual import (
 )
 
 _CALCULATED_COSINE_THRESHOLD = 0.44 
+_MODELS_LOADING_TIMEOUT = 600 # max waiting time (s) of a request for models loading
+_WARMUP_EXAMPLE_PATH = Path(__file__).parent / "outcome_switch" / "data" / "36473651.xml"
 _app_description = open("front/app-description.md").read()
 _article_id_examples = json.load(open("front/examples.json"))
 _pmcid_start_value = _article_id_examples[0]
 config = json.load(open('./config.json', 'r'))
 
-# Load Detector (ner and sim model)
-osd = OutcomeSwitchingDetector(
-    config["ner_path"], 
-    config["sim_path"],
-    config["ner_label2id"]
-)
+# Articles xml, registry outcomes and detection stages results on-disk caches
+if "xml_cache" in config:
+    set_xml_cache(DiskCache.from_config(config["xml_cache"]))
+if "registry_cache" in config:
+    set_registry_cache(DiskCache.from_config(config["registry_cache"]))
+if "stage_cache" in config:
+    set_stage_cache(StageCache.from_config(config["stage_cache"]))
+
+# Detections metrics in Prometheus format (HTTP endpoint and/or text file) and profiling of sampled detections
+if "metrics" in config:
+    metrics_registry = MetricsRegistry(config["metrics"].get("textfile_path"))
+    add_metrics_hook(metrics_registry)
+    if config["metrics"].get("port") is not None:
+        metrics_registry.serve(config["metrics"]["port"])
+    if config["metrics"].get("profile_dir") is not None:
+        set_profiler(RequestProfiler(
+            config["metrics"]["profile_dir"], 
+            config["metrics"].get("profile_sample_rate", 0.01), 
+            config["metrics"].get("profiler", "cprofile"),
+        ))
+
+# Load Detector (ner and sim model) in background so that the app is served while models load,
+# then precompute the outputs of the examples. The loading status (loading, ready or failed) is shown
+# to users and served at http://<host>:<port>/health for load balancers (status 200 once ready, else 503)
+osd = None
+osd_ready = threading.Event()
+_load_status = {"status": "loading", "error": None, "warm_up_error": None}
+_examples_outputs = {}
+
+if "health" in config:
+    serve_health(lambda: dict(_load_status), config["health"]["port"], config["health"].get("host", "127.0.0.1"))
+
+def _load_detector():
+    global osd
+    try:
+        # torch and transformers are imported here
+        from outcome_switch import OutcomeSwitchingDetector
+        detector = OutcomeSwitchingDetector.from_config(config)
+    except Exception as e:
+        _load_status.update(status="failed", error=repr(e))
+        osd_ready.set()
+        raise
+    # a failed warm-up only slows down the first requests, the detector is served anyway
+    try:
+        detector.warm_up(_WARMUP_EXAMPLE_PATH.read_text(encoding="utf-8"), "pubmed")
+    except Exception as e:
+        _load_status["warm_up_error"] = repr(e)
+        print(f"Models warm-up failed : {e!r}")
+    osd = detector
+    _load_status["status"] = "ready"
+    osd_ready.set()
+    # users clicking an example during precomputation share its detection in flight
+    for article_id in _article_id_examples:
+        try:
+            _examples_outputs[article_id] = osd.detect(article_id)
+        except Exception as e:
+            print(f"Could not precompute example {article_id} : {e}")
+
+threading.Thread(target=_load_detector, name="osd-loader", daemon=True).start()
 
 def controller(article_id:str):
-    # clean input and run detection
+    # wait for models to be loaded
+    if not osd_ready.wait(timeout=_MODELS_LOADING_TIMEOUT):
+        gr.Warning("Models are still loading, please retry in a few moments")
+        return None, None, None, None
+    if osd is None:
+        gr.Warning(f"Models could not be loaded : {_load_status['error']}")
+        return None, None, None, None
+    # clean input and run detection (examples are precomputed)
     article_id = str(article_id).strip()
-    output = osd.detect(article_id)
+    output = _examples_outputs.get(article_id) or osd.detect(article_id)
 
     # init outputs
     article_markdown=None
@@ -59,10 +128,8 @@ def controller(article_id:str):
     # check whether similarity diagram can be displayed
     if (output["connections"] is not None and output["raw_entities"] is not None and
         output["ctgov_outcomes"] is not None and output["article_outcomes"] is not None):
-        registry_outcomes_tup = [(outcome["type"], outcome["measure"] + " , " + outcome["timeFrame"]) 
-                        for outcome in output["ctgov_outcomes"]]
         similarity_diagram = get_sankey_diagram(
-            registry_outcomes_tup,
+            registry_outcomes_tuples(output["ctgov_outcomes"]),
             output["article_outcomes"],
             output["connections"],
             output["raw_entities"],
@@ -104,6 +171,9 @@ with gr.Blocks() as blocks:
     # OUTPUTS AND BUTTONS
     outputs = [filtered_article, ner_output, ctgov_output,  similarity_output]
     clear_button.add([pmid_input]+outputs)
-    detect_button.click(fn=controller, inputs=pmid_input, outputs=outputs)
+    # concurrent requests reach the detector together so that their NER and similarity are micro-batched
+    detect_button.click(fn=controller, inputs=pmid_input, outputs=outputs, 
+                        concurrency_limit=config.get("batching", {}).get("max_batch_size", 1))
 
+blocks.queue()
 blocks.launch()
@@ -0,0 +1,149 @@
+"""Offline end-to-end benchmark : `python benchmarks/e2e.py [--repeat 20] [--concurrency 1 4 8] [--output e2e.json]`
+serves the articles of `outcome_switch/data` (under a new id for each request, PubMed articles registered with
+NCT04647656) and the recorded studies of `test/ctgov_examples` from local stand-in servers, then reports the latency
+(ms) of each stage (download, parse, registry, filter, NER, similarity, visual), the throughput (requests/s) and latency
+of `detect` followed by the app visuals at each concurrency level, and the peak RSS (MB). On-disk caches are not used,
+the in-memory embeddings cache of the similarity model is, as in a running app."""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "test"))
+from ctgov_server import CtgovStandInServer
+from entrez_server import EntrezStandInServer
+from outcome_switch.ctgov import detect_nct_id, extract_nct_outcomes, registry_outcomes_tuples, set_ctgov_api_url
+from outcome_switch.entrez import (_db_parser, _get_article_xml, _init_parse_output, _parse_output,
+                                   set_entrez_efetch_url)
+from outcome_switch.filter import filter_sections, get_sections_text
+
+_NCT_ID = "NCT04647656"
+_CALCULATED_COSINE_THRESHOLD = 0.44
+_ids = count(10000000)
+
+
+def _new_id(db):
+    """id never requested before, so that in-flight detections are not shared between requests"""
+    article_id = str(next(_ids))
+    return "PMC" + article_id if db == "pmc" else article_id
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _summary(durations):
+    durations = sorted(durations)
+    return {
+        "mean_ms": 1000 * sum(durations) / len(durations),
+        "p50_ms": 1000 * durations[len(durations) // 2],
+        "p95_ms": 1000 * durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+    }
+
+
+def _render(article_id, output):
+    """app visuals of a detection output (same calls as the app controller)"""
+    from outcome_switch.visual import get_article_markdown, get_highlighted_text, get_registry_dataframe, get_sankey_diagram
+    if output["article_sections"] is None or output["filtered_sections"] is None:
+        return
+    get_article_markdown(article_id, output["article_sections"], output["filtered_sections"])
+    if output["raw_entities"] is not None:
+        get_highlighted_text(output["raw_entities"], get_sections_text(output["filtered_sections"]))
+    if output["ctgov_outcomes"] is None:
+        return
+    get_registry_dataframe(output["ctgov_outcomes"])
+    if output["connections"] is not None and output["article_outcomes"] is not None:
+        get_sankey_diagram(registry_outcomes_tuples(output["ctgov_outcomes"]), output["article_outcomes"], output["connections"],
+                           output["raw_entities"], _CALCULATED_COSINE_THRESHOLD)
+
+
+def _time(durations, stage, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    durations.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+
+def _stages(detector, repeat):
+    """latency of each stage, run sequentially on a new article of each db at each repetition"""
+    results = {}
+    for db in ("pubmed", "pmc"):
+        durations = {}
+        for _ in range(repeat):
+            article_id = _new_id(db)
+            parse_output = _init_parse_output(_db_parser(article_id))
+            parse_output["article_xml"] = _time(durations, "download", _get_article_xml, article_id, db)
+            parse_output = _time(durations, "parse", _parse_output, parse_output)
+            registry_outcomes = _time(durations, "registry", extract_nct_outcomes, parse_output["article_xml"])
+            filter_output = _time(durations, "filter", filter_sections, parse_output["article_sections"])
+            ner_output = _time(durations, "ner", detector._extract_article_outcomes,
+                               get_sections_text(filter_output["filtered_sections"]))
+            connections = _time(durations, "similarity", detector._compare_outcomes,
+                                registry_outcomes, ner_output["article_outcomes"], detect_nct_id(parse_output["article_xml"]))
+            output = parse_output | filter_output | ner_output | {"ctgov_outcomes": registry_outcomes, "connections": connections}
+            _time(durations, "visual", _render, article_id, output)
+        results[db] = {stage: _summary(stage_durations) for stage, stage_durations in durations.items()}
+    return results
+
+
+def _throughput(detector, concurrency, n_requests):
+    """requests/s and latency of detect + visuals with `concurrency` concurrent requests (PubMed and PMC ids)"""
+    article_ids = [_new_id("pubmed" if i % 2 == 0 else "pmc") for i in range(n_requests)]
+    def request(article_id):
+        start = time.perf_counter()
+        _render(article_id, detector.detect(article_id))
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(request, article_ids))
+    duration = time.perf_counter() - start
+    return {"requests": n_requests, "requests_per_s": n_requests / duration, **_summary(latencies),
+            "peak_rss_mb": _peak_rss_mb()}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--repeat", type=int, default=20, help="number of articles of each db for the stages latency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=32, help="number of requests at each concurrency level")
+    parser.add_argument("--entrez-delay", type=float, default=0.0, help="added latency (s) of the efetch stand-in")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+    config = json.load(open(args.config))
+    with EntrezStandInServer(nct_id=_NCT_ID, delay=args.entrez_delay) as entrez_server, CtgovStandInServer() as ctgov_server:
+        set_entrez_efetch_url(entrez_server.url)
+        set_ctgov_api_url(ctgov_server.url)
+        from outcome_switch import OutcomeSwitchingDetector
+        detector = OutcomeSwitchingDetector.from_config({key: value for key, value in config.items() if key != "embedding_cache"})
+        detector.warm_up((Path(__file__).parent.parent / "outcome_switch" / "data" / "36473651.xml").read_text(), "pubmed")
+        results = {
+            "commit": _commit(),
+            "settings": {key: config.get(key) for key in ("inference_backend", "ner_mode", "ner_decoding", "ner_prefilter", "batching")},
+            "peak_rss_mb_loaded": _peak_rss_mb(),
+            "stages": _stages(detector, args.repeat),
+            "concurrency": {str(concurrency): _throughput(detector, concurrency, args.requests)
+                            for concurrency in args.concurrency},
+        }
+    results["peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
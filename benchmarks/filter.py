@@ -0,0 +1,106 @@
+"""Sections filtering benchmark : `python benchmarks/filter.py [--corpus DIR_OR_TAR] [--repeat 20] [--output filter.json]`
+compares the durations (ms per article) of `filter_sections` ("precompiled" : rules compiled once, section content
+joined once per section) with the previous implementation looping over `CHECK_PRIORITY` rules ("loop" : regex
+compiled and section content joined for each rule), on the parsed articles
+of `outcome_switch/data` and optionally of a local PMC OA corpus (directory or tar archive of JATS xml files),
+and checks that both return the same outputs"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from outcome_switch.entrez import _parse_article, _reformat_article
+from outcome_switch.filter import CHECK_PRIORITY, filter_sections
+from outcome_switch.pmc_oa import iter_pmc_oa_articles
+
+_PARSE_EXAMPLES = {
+    "PMC11102686": ("outcome_switch/data/PMC11102686.xml", "pmc"),
+    "36473651": ("outcome_switch/data/36473651.xml", "pubmed"),
+}
+
+
+def _filter_sections_loop(sections_dict):
+    """previous `filter_sections` implementation, one pass over the sections per rule"""
+    filter_output = {
+        "filtered_sections" : None,
+        "regex_priority_index" : None,
+        "regex_priority_name" : None,
+        "check_type" : None,
+    }
+    if not sections_dict:
+        return filter_output
+    filter_output["filtered_sections"] = {}
+    match_found = False
+    for i, (priority_name, content_type, current_regex) in enumerate(CHECK_PRIORITY):
+        current_regex = re.compile(current_regex, re.IGNORECASE)
+        for title, content_list in sections_dict.items():
+            content = title if content_type == "title" else '\n'.join(content_list)
+            if current_regex.search(content):
+                filter_output["check_type"] = content_type
+                filter_output["regex_priority_name"] = priority_name
+                filter_output["regex_priority_index"] = i
+                filter_output["filtered_sections"][title] = content_list
+                match_found = True
+        if match_found:
+            break
+    return filter_output
+
+
+def _load_corpus(corpus_path, max_articles):
+    articles = [
+        _reformat_article(_parse_article(Path(path).read_text(encoding="utf-8"), db))
+        for path, db in _PARSE_EXAMPLES.values()
+    ]
+    if corpus_path is not None:
+        for _, parse_output in iter_pmc_oa_articles(corpus_path, keep_xml=False):
+            if parse_output["article_sections"] is not None:
+                articles.append(parse_output["article_sections"])
+            if max_articles is not None and len(articles) >= max_articles:
+                break
+    return articles
+
+
+def _time_per_article(filter_function, articles, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for article_sections in articles:
+            filter_function(article_sections)
+        durations.append((time.perf_counter() - start) / len(articles))
+    durations.sort()
+    return {
+        "mean_ms": 1000 * sum(durations) / len(durations),
+        "median_ms": 1000 * durations[len(durations) // 2],
+        "min_ms": 1000 * durations[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=None, help="directory or tar archive of PMC OA JATS xml files")
+    parser.add_argument("--max-articles", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+    articles = _load_corpus(args.corpus, args.max_articles)
+    mismatches = sum(filter_sections(sections) != _filter_sections_loop(sections) for sections in articles)
+    results = {
+        "n_articles": len(articles),
+        "mean_n_sections": sum(len(sections) for sections in articles) / len(articles),
+        "mismatches": mismatches,
+        "loop": _time_per_article(_filter_sections_loop, articles, args.repeat),
+        "precompiled": _time_per_article(filter_sections, articles, args.repeat),
+    }
+    results["speedup"] = results["loop"]["median_ms"] / results["precompiled"]["median_ms"]
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if mismatches:
+        raise SystemExit(f"{mismatches} articles filtered differently with the precompiled rules")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Article parsing micro-benchmark : `python benchmarks/parse.py [--repeat 50] [--output parse.json]`
+reports the durations (ms) of parsing and sections extraction (`_parse_article` + `_reformat_article`)
+of the articles of `outcome_switch/data`, and of the xml parsing alone for reference"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from defusedxml import ElementTree
+from outcome_switch.entrez import _parse_article, _reformat_article
+
+_PARSE_EXAMPLES = {
+    "PMC11102686": ("outcome_switch/data/PMC11102686.xml", "pmc"),
+    "36473651": ("outcome_switch/data/36473651.xml", "pubmed"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+    results = {}
+    for article_id, (path, db) in _PARSE_EXAMPLES.items():
+        xml_string = Path(path).read_text(encoding="utf-8")
+        durations, xml_durations = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _reformat_article(_parse_article(xml_string, db))
+            durations.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            ElementTree.fromstring(xml_string)
+            xml_durations.append(time.perf_counter() - start)
+        durations.sort()
+        results[article_id] = {
+            "mean_ms": 1000 * sum(durations) / len(durations),
+            "median_ms": 1000 * durations[len(durations) // 2],
+            "min_ms": 1000 * durations[0],
+            "xml_parse_median_ms": 1000 * sorted(xml_durations)[len(xml_durations) // 2],
+        }
+        results[article_id]["extract_median_ms"] = results[article_id]["median_ms"] - results[article_id]["xml_parse_median_ms"]
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
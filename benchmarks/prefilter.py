@@ -0,0 +1,82 @@
+"""NER sentence pre-filter evaluation : `python benchmarks/prefilter.py [--min-cues 1 2] [--corpus DIR_OR_TAR] [--output prefilter.json]`
+runs the NER model on the filtered sections of the articles of `outcome_switch/data` (and optionally of a local
+PMC OA corpus) without pre-filter and with each min number of outcome cue words, and reports the NER tokens saved,
+the NER duration and the recall of the outcomes found without pre-filter"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from outcome_switch.entrez import _parse_article, _reformat_article
+from outcome_switch.filter import filter_outcomes, filter_sections, get_sections_text, outcome_cues_score, _text_segments
+from outcome_switch.pmc_oa import iter_pmc_oa_articles
+
+_PARSE_EXAMPLES = {
+    "PMC11102686": ("outcome_switch/data/PMC11102686.xml", "pmc"),
+    "36473651": ("outcome_switch/data/36473651.xml", "pubmed"),
+}
+
+
+def _load_texts(corpus_path, max_articles):
+    articles_sections = [
+        _reformat_article(_parse_article(Path(path).read_text(encoding="utf-8"), db))
+        for path, db in _PARSE_EXAMPLES.values()
+    ]
+    if corpus_path is not None:
+        for _, parse_output in iter_pmc_oa_articles(corpus_path, keep_xml=False):
+            if parse_output["article_sections"] is not None:
+                articles_sections.append(parse_output["article_sections"])
+            if max_articles is not None and len(articles_sections) >= max_articles:
+                break
+    texts = [get_sections_text(filter_sections(sections)["filtered_sections"]) for sections in articles_sections]
+    return [text for text in texts if text]
+
+
+def _run(detector, texts, min_cues):
+    detector.ner_prefilter = min_cues
+    start = time.perf_counter()
+    entities_lists = detector._ner(texts)
+    duration = time.perf_counter() - start
+    tokens = 0
+    for text in texts:
+        for segment_start, segment_end in _text_segments(text, detector.ner_mode):
+            segment = text[segment_start:segment_end]
+            if min_cues == 0 or outcome_cues_score(segment) >= min_cues:
+                tokens += len(detector.outcomes_ner.tokenizer(segment)["input_ids"])
+    return duration, tokens, [set(filter_outcomes(entities)) for entities in entities_lists]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--min-cues", type=int, nargs="+", default=[1, 2], help="pre-filter thresholds to evaluate")
+    parser.add_argument("--ner-mode", default="sentences", choices=["sentences", "paragraphs"])
+    parser.add_argument("--corpus", default=None, help="directory or tar archive of PMC OA JATS xml files")
+    parser.add_argument("--max-articles", type=int, default=200)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+    from outcome_switch import OutcomeSwitchingDetector
+    config = json.load(open(args.config)) | {"ner_mode": args.ner_mode}
+    detector = OutcomeSwitchingDetector.from_config(config)
+    texts = _load_texts(args.corpus, args.max_articles)
+    duration, tokens, reference_outcomes = _run(detector, texts, 0)
+    n_reference = sum(len(outcomes) for outcomes in reference_outcomes)
+    results = {"n_articles": len(texts), "no_prefilter": {"ner_s": duration, "tokens": tokens, "outcomes": n_reference}}
+    for min_cues in args.min_cues:
+        prefilter_duration, prefilter_tokens, outcomes = _run(detector, texts, min_cues)
+        found = sum(len(reference & article_outcomes) for reference, article_outcomes in zip(reference_outcomes, outcomes))
+        results[f"min_cues_{min_cues}"] = {
+            "ner_s": prefilter_duration,
+            "tokens": prefilter_tokens,
+            "tokens_saved": 1 - prefilter_tokens / tokens if tokens else 0.0,
+            "recall": found / n_reference if n_reference else 1.0,
+        }
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Registry trials search benchmark : `python benchmarks/registry_search.py [--outcomes 300000] [--repeat 20] [--output registry_search.json]`
+builds an index of random normalized embeddings (no encoding model) with the given number of registry outcomes, then
+reports the latency (ms) of `RegistryIndex.search_trials` for `--queries` article outcomes (noisy copies of the
+outcomes of a random study), exact (all rows scored) and with the IVF index at each `--n-probe`, and how often the
+IVF search returns the top trial of the exact search first"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from outcome_switch.registry_index import RegistryIndex, build_ivf_index
+
+
+def _write_random_index(path, n_outcomes, outcomes_per_study, dim, rng):
+    embeddings = rng.normal(size=(n_outcomes, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(path / "embeddings.npy", embeddings.astype(np.float16))
+    n_studies = n_outcomes // outcomes_per_study
+    studies = {f"NCT{i:08d}": [i * outcomes_per_study, (i + 1) * outcomes_per_study] for i in range(n_studies)}
+    studies[f"NCT{n_studies - 1:08d}"][1] = n_outcomes
+    sentences = [f"outcome {i}" for i in range(n_outcomes)]
+    index = {"model_id": "random", "dtype": "float16", "dim": dim, "studies": studies, "sentences": sentences}
+    (path / "index.json").write_text(json.dumps(index))
+    return embeddings
+
+
+def _summary(durations):
+    durations = sorted(durations)
+    return {
+        "mean_ms": 1000 * sum(durations) / len(durations),
+        "p50_ms": 1000 * durations[len(durations) // 2],
+        "p95_ms": 1000 * durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+    }
+
+
+def _search(index, queries_list, top_k, n_probe=None):
+    durations, results = [], []
+    for queries in queries_list:
+        start = time.perf_counter()
+        results.append(index.search_trials(queries, top_k) if n_probe is None else index.search_trials(queries, top_k, n_probe))
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--outcomes", type=int, default=300000, help="number of registry outcomes of the index")
+    parser.add_argument("--outcomes-per-study", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=10, help="number of article outcomes of each search")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--ivf-lists", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=20, help="number of searches of each setting")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embeddings = _write_random_index(Path(tmp_dir), args.outcomes, args.outcomes_per_study, args.dim, rng)
+        # article outcomes close to the outcomes of a registered study
+        queries_list = []
+        for _ in range(args.repeat):
+            study = rng.integers(0, args.outcomes // args.outcomes_per_study)
+            rows = study * args.outcomes_per_study + rng.integers(0, args.outcomes_per_study, args.queries)
+            queries = embeddings[rows] + rng.normal(scale=0.02, size=(args.queries, args.dim))
+            queries_list.append((queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32))
+        index = RegistryIndex(tmp_dir)
+        durations, exact_results = _search(index, queries_list, args.top_k)
+        results = {"settings": vars(args), "exact": _summary(durations)}
+        start = time.perf_counter()
+        build_ivf_index(tmp_dir, args.ivf_lists)
+        results["ivf_build_s"] = time.perf_counter() - start
+        index = RegistryIndex(tmp_dir)
+        for n_probe in args.n_probe:
+            durations, ivf_results = _search(index, queries_list, args.top_k, n_probe)
+            top_recall = np.mean([ivf[0][0] == exact[0][0] for ivf, exact in zip(ivf_results, exact_results) if ivf and exact])
+            results[f"ivf_n_probe_{n_probe}"] = _summary(durations) | {"top_recall": float(top_recall)}
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Startup time benchmark : run in a fresh process from the repository root
+`python benchmarks/startup.py [--output startup.json]` and report the duration (s) of each startup phase"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+_WARMUP_EXAMPLE_PATH = Path(__file__).parent.parent / "outcome_switch" / "data" / "36473651.xml"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--output", default=None, help="JSON file to write the phases durations to")
+    args = parser.parse_args()
+    phases = {}
+    # the imports are only timed, their modules are not used
+    start = time.perf_counter()
+    import outcome_switch  # noqa: F401
+    phases["import_package"] = time.perf_counter() - start
+    start = time.perf_counter()
+    import outcome_switch.visual  # noqa: F401
+    phases["import_visual"] = time.perf_counter() - start
+    start = time.perf_counter()
+    from outcome_switch import OutcomeSwitchingDetector
+    phases["import_detector"] = time.perf_counter() - start
+    with open(args.config) as f:
+        detector = OutcomeSwitchingDetector.from_config(json.load(f))
+    phases["load_ner_model"] = detector.load_times["ner_model"]
+    phases["load_sim_model"] = detector.load_times["sim_model"]
+    detector.warm_up(_WARMUP_EXAMPLE_PATH.read_text(), "pubmed")
+    phases["warm_up"] = detector.load_times["warm_up"]
+    phases["total"] = sum(phases.values())
+    print(json.dumps(phases, indent=2))
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(phases, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""CPU inference backends for the NER and similarity models : PyTorch fp32, PyTorch dynamic int8
+quantization, or an exported ONNX graph run with onnxruntime (optional dependency).
+Run `python -m outcome_switch.backends` to export the ONNX graphs and check the parity of a backend
+with fp32 outputs on the articles of `outcome_switch/data`."""
+
+from __future__ import annotations
+import argparse
+import json
+import numpy as np
+import torch
+from pathlib import Path
+from typing import Any, Union
+from transformers import PreTrainedModel, PreTrainedTokenizerBase
+from transformers.modeling_outputs import BaseModelOutput, TokenClassifierOutput
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+NER_ONNX_FILENAME = "ner.onnx"
+SIM_ONNX_FILENAME = "sim.onnx"
+_ONNX_OPSET = 14
+_PARITY_EXAMPLES_PATH = Path(__file__).parent / "data"
+
+
+class OnnxModel(torch.nn.Module):
+    """Wrapper of an onnxruntime session with the call interface of the exported transformers model,
+    so that it can replace it in pipelines and in `OutcomeSimilarity`"""
+    def __init__(self, onnx_path:Union[str,Path], config:Any, output_name:str):
+        super().__init__()
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("onnx backend requires onnxruntime : `pip install onnxruntime`") from e
+        self.config = config
+        self.output_name = output_name
+        self.session = onnxruntime.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    @property
+    def device(self) -> torch.device:
+        return torch.device("cpu")
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return torch.float32
+
+    def can_generate(self) -> bool:
+        return False
+
+    def forward(self, **kwargs) -> Union[TokenClassifierOutput,BaseModelOutput]:
+        inputs = {name: kwargs[name].cpu().numpy().astype(np.int64) for name in self.input_names if name in kwargs}
+        output = torch.from_numpy(self.session.run(None, inputs)[0])
+        if self.output_name == "logits":
+            return TokenClassifierOutput(logits=output)
+        return BaseModelOutput(last_hidden_state=output)
+
+
+def export_onnx(
+        model:PreTrainedModel,
+        tokenizer:PreTrainedTokenizerBase,
+        onnx_path:Union[str,Path],
+        output_name:str,
+    ) -> None:
+    """Export a transformers model to ONNX with dynamic batch and sequence axes"""
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    dummy_input = tokenizer(["outcome switching detection"], return_tensors="pt")
+    input_names = [name for name in tokenizer.model_input_names if name in dummy_input]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + [output_name]}
+    model.eval()
+    torch.onnx.export(
+        model,
+        tuple(dummy_input[name] for name in input_names),
+        str(onnx_path),
+        input_names=input_names,
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=_ONNX_OPSET,
+    )
+
+
+def load_backend(
+        model:PreTrainedModel,
+        backend:str,
+        onnx_path:Union[str,Path,None]=None,
+        output_name:str="logits",
+    ) -> Union[PreTrainedModel,OnnxModel]:
+    """Return the model to run for the backend : the fp32 model itself, its dynamic int8 quantized
+    version (Linear layers), or an `OnnxModel` of the graph exported in `onnx_path`"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, must be one of {BACKENDS}")
+    if backend == "torch-int8":
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        if onnx_path is None or not Path(onnx_path).exists():
+            raise FileNotFoundError(f"ONNX graph {onnx_path} not found, export it with `python -m outcome_switch.backends`")
+        return OnnxModel(onnx_path, model.config, output_name)
+    return model
+
+
+def _parity_texts() -> list[str]:
+    """filtered sections texts of the articles of `outcome_switch/data`"""
+    from outcome_switch.entrez import _parse_article, _reformat_article
+    from outcome_switch.filter import filter_sections, get_sections_text
+    texts = []
+    for path in sorted(_PARITY_EXAMPLES_PATH.glob("*.xml")):
+        db = "pmc" if path.stem.startswith("PMC") else "pubmed"
+        article_sections = _reformat_article(_parse_article(path.read_text(encoding="utf-8"), db))
+        texts.append(get_sections_text(filter_sections(article_sections)["filtered_sections"]))
+    return texts
+
+
+def check_parity(
+        reference_model:Any,
+        backend_model:Any,
+        tokenizer:PreTrainedTokenizerBase,
+        texts:list[str],
+        output_name:str,
+    ) -> dict[str,float]:
+    """Compare outputs of a backend model with the fp32 reference model on texts (truncated to the
+    model max length) : max absolute difference, and for NER logits the ratio of identical predicted
+    labels, for encoder outputs the min cosine similarity of mean pooled embeddings"""
+    max_abs_diff, agreements, min_cosine = 0.0, [], 1.0
+    for text in texts:
+        inputs = tokenizer(text, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            reference = reference_model(**inputs)[output_name]
+            output = backend_model(**inputs)[output_name]
+        max_abs_diff = max(max_abs_diff, (reference - output).abs().max().item())
+        if output_name == "logits":
+            agreements.append((reference.argmax(-1) == output.argmax(-1)).float().mean().item())
+        else:
+            cosine = torch.nn.functional.cosine_similarity(reference.mean(1), output.mean(1)).min().item()
+            min_cosine = min(min_cosine, cosine)
+    if output_name == "logits":
+        return {"max_abs_diff": max_abs_diff, "label_agreement": min(agreements)}
+    return {"max_abs_diff": max_abs_diff, "min_cosine": min_cosine}
+
+
+if __name__ == "__main__":
+    from transformers import AutoModel, AutoTokenizer, BertConfig, BertForTokenClassification, BertTokenizerFast
+    parser = argparse.ArgumentParser(description="Export ONNX graphs and check inference backends parity with fp32")
+    parser.add_argument("--config", default="config.json", help="app config with ner_path, sim_path, ner_label2id and onnx_dir")
+    parser.add_argument("--backend", default="onnx", choices=BACKENDS, help="backend to check against fp32")
+    parser.add_argument("--no-export", action="store_true", help="do not (re)export ONNX graphs")
+    parser.add_argument("--atol", type=float, default=0.1, help="max allowed absolute difference of outputs")
+    args = parser.parse_args()
+    config = json.load(open(args.config))
+    onnx_dir = Path(config.get("onnx_dir", ".cache/onnx"))
+    ner_label2id = config["ner_label2id"]
+    ner_config = BertConfig.from_pretrained(config["ner_path"], label2id=ner_label2id,
+                                            id2label={v: k for k, v in ner_label2id.items()})
+    models = {
+        "ner": (BertForTokenClassification.from_pretrained(config["ner_path"], config=ner_config),
+                BertTokenizerFast.from_pretrained(config["ner_path"]), onnx_dir / NER_ONNX_FILENAME, "logits"),
+        "sim": (AutoModel.from_pretrained(config["sim_path"]), AutoTokenizer.from_pretrained(config["sim_path"]),
+                onnx_dir / SIM_ONNX_FILENAME, "last_hidden_state"),
+    }
+    texts = _parity_texts()
+    failed = False
+    for name, (model, tokenizer, onnx_path, output_name) in models.items():
+        if args.backend == "onnx" and not args.no_export:
+            export_onnx(model, tokenizer, onnx_path, output_name)
+        backend_model = load_backend(model, args.backend, onnx_path, output_name)
+        parity = check_parity(model, backend_model, tokenizer, texts, output_name)
+        failed = failed or parity["max_abs_diff"] > args.atol
+        print(name, args.backend, json.dumps(parity))
+    if failed:
+        raise SystemExit(f"{args.backend} outputs differ from fp32 outputs by more than {args.atol}")
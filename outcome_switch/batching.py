@@ -0,0 +1,70 @@
+"""Dynamic micro-batching of work items submitted by concurrent requests : items are collected for at most
+`max_wait_ms` after the first one, or until `max_batch_size` items, then processed with a single call."""
+
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Union
+
+
+class MicroBatcher:
+    """Run `process` (list of items -> list of results in the same order) on batches of items
+    submitted by concurrent threads, collected by a single worker thread. Batches are processed
+    by `executor` if given (e.g. to share the threads and their limit with other model calls),
+    else by the worker thread"""
+    def __init__(
+            self,
+            process:Callable[[list[Any]],list[Any]],
+            max_batch_size:int=16,
+            max_wait_ms:float=5.0,
+            name:str="osd-batcher",
+            executor:Union[Executor,None]=None,
+        ):
+        self.process = process
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # number of items of each processed batch, for monitoring
+        self.batch_sizes = []
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item:Any) -> Any:
+        """add item to the next batch and wait for its result (exceptions of `process` are raised)"""
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _next_batch(self) -> list[tuple[Any,Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            self.batch_sizes.append(len(batch))
+            items = [item for item, _ in batch]
+            try:
+                if self.executor is not None:
+                    results = self.executor.submit(self.process, items).result()
+                else:
+                    results = self.process(items)
+            except BaseException as e:
+                # the worker keeps running so that waiting and later submissions are not left hanging
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,185 @@
+"""Persistent on-disk cache with compression, TTL and size based LRU eviction.
+Values are stored in blob files named after the sha256 of their content,
+a sqlite index maps keys to blobs and keeps creation and access times."""
+
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Union
+
+_INDEX_FILENAME = "index.sqlite"
+_BLOBS_DIRNAME = "blobs"
+# access times are only updated when older than this (s), so that cache hits rarely take the sqlite write lock
+_ACCESS_RESOLUTION = 60.0
+
+
+class DiskCache:
+    """Key/value cache of bytes on disk.
+
+    Args:
+        path (str | Path): cache directory, created if it does not exist
+        max_size (int | None): max total size of stored (compressed) blobs in bytes,
+            least recently used entries are evicted above it, None for no limit
+        ttl (float | None): time to live of entries in seconds, None for no expiration
+        compression_level (int): zlib compression level, 0 to store raw bytes
+        offline (bool): offline mode, callers should only serve values from cache
+    """
+    def __init__(
+            self,
+            path:Union[str,Path],
+            max_size:Union[int,None]=None,
+            ttl:Union[float,None]=None,
+            compression_level:int=6,
+            offline:bool=False,
+        ):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.compression_level = compression_level
+        self.offline = offline
+        self._blobs_path = self.path / _BLOBS_DIRNAME
+        self._blobs_path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path / _INDEX_FILENAME, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, digest TEXT, size INTEGER, compressed INTEGER, "
+            "created REAL, accessed REAL)"
+        )
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, cache_config:dict) -> DiskCache:
+        """create a cache from a config.json cache section (path, max_size_mb, ttl_days, offline)"""
+        return cls(
+            cache_config["path"],
+            max_size=cache_config["max_size_mb"] * 2**20,
+            ttl=cache_config["ttl_days"] * 86400,
+            offline=cache_config["offline"],
+        )
+
+    def _blob_path(self, digest:str) -> Path:
+        return self._blobs_path / digest[:2] / digest
+
+    def get(self, key:str) -> Union[bytes,None]:
+        """get value of key or None if key is missing or expired"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, compressed, created, accessed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, compressed, created, accessed = row
+            now = time.time()
+            if self.ttl is not None and now - created > self.ttl:
+                self._delete(key, digest)
+                self._db.commit()
+                return None
+            try:
+                data = self._blob_path(digest).read_bytes()
+            except FileNotFoundError:
+                self._delete(key, digest)
+                self._db.commit()
+                return None
+            if now - accessed > _ACCESS_RESOLUTION:
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+        return zlib.decompress(data) if compressed else data
+
+    def set(self, key:str, value:bytes) -> None:
+        """store value under key, then evict expired and least recently used entries if needed"""
+        compressed = self.compression_level > 0
+        data = zlib.compress(value, self.compression_level) if compressed else value
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        with self._lock:
+            if not blob_path.exists():
+                blob_path.parent.mkdir(exist_ok=True)
+                # temp file of each process and thread : processes sharing the cache may store the same blob at once
+                tmp_path = blob_path.with_name(f"{blob_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                try:
+                    tmp_path.write_bytes(data)
+                    tmp_path.replace(blob_path)
+                except OSError:
+                    tmp_path.unlink(missing_ok=True)
+                    # blobs are named after their content : a blob stored by another writer is the same
+                    if not blob_path.exists():
+                        raise
+            row = self._db.execute("SELECT digest FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, digest, len(data), int(compressed), now, now),
+            )
+            if row is not None and row[0] != digest:
+                self._remove_blob_if_unused(row[0])
+            self._evict()
+            self._db.commit()
+
+    def get_text(self, key:str) -> Union[str,None]:
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, key:str, value:str) -> None:
+        self.set(key, value.encode("utf-8"))
+
+    def __contains__(self, key:str) -> bool:
+        return self.get(key) is not None
+
+    def size(self) -> int:
+        """total size of stored blobs in bytes"""
+        with self._lock:
+            return self._total_size()
+
+    def evict(self) -> None:
+        """remove expired entries and least recently used entries above max size"""
+        with self._lock:
+            self._evict()
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key, digest in self._db.execute("SELECT key, digest FROM entries").fetchall():
+                self._delete(key, digest)
+            self._db.commit()
+
+    def _total_size(self) -> int:
+        # blobs shared by several keys are only counted once
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+        ).fetchone()[0]
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            expired = self._db.execute(
+                "SELECT key, digest FROM entries WHERE created < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            for key, digest in expired:
+                self._delete(key, digest)
+        if self.max_size is None:
+            return
+        total_size = self._total_size()
+        if total_size <= self.max_size:
+            return
+        lru_entries = self._db.execute(
+            "SELECT key, digest FROM entries ORDER BY accessed ASC"
+        ).fetchall()
+        for key, digest in lru_entries:
+            if total_size <= self.max_size:
+                break
+            self._delete(key, digest)
+            total_size = self._total_size()
+
+    def _delete(self, key:str, digest:str) -> None:
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._remove_blob_if_unused(digest)
+
+    def _remove_blob_if_unused(self, digest:str) -> None:
+        in_use = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if in_use is None:
+            self._blob_path(digest).unlink(missing_ok=True)
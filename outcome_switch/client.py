@@ -0,0 +1,162 @@
+"""Shared HTTP client for Entrez and ClinicalTrials.gov APIs : pooled session,
+per host rate limiting, retries with backoff, timeouts and latency statistics."""
+
+from __future__ import annotations
+import os
+import threading
+import time
+import requests
+from collections import deque
+from statistics import median
+from typing import Any, Dict, Union
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from outcome_switch.metrics import record_http
+
+NCBI_HOST = "eutils.ncbi.nlm.nih.gov"
+CTGOV_HOST = "clinicaltrials.gov"
+# NCBI allows 3 requests/s without api key and 10 requests/s with api key,
+# CTGOV asks for about 50 requests/min per IP
+_NCBI_RATE = 3.0
+_NCBI_API_KEY_RATE = 10.0
+_CTGOV_RATE = 50 / 60
+_DEFAULT_TIMEOUT = (5.0, 30.0) # (connect, read) in seconds
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+_LATENCY_WINDOW = 1000 # number of latencies kept per host for statistics
+
+
+class TokenBucket:
+    """Thread safe token bucket allowing `rate` requests per second with bursts of `capacity`"""
+    def __init__(self, rate:float, capacity:Union[float,None]=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """block until a token is available then consume it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            self._tokens -= 1
+        # sleep outside the lock, the token is already reserved
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HttpClient:
+    """Connection pooled HTTP client with per host token bucket rate limiting,
+    bounded retries with exponential backoff, hard timeouts and per host latency statistics"""
+    def __init__(
+            self,
+            rates:Union[Dict[str,float],None]=None,
+            api_keys:Union[Dict[str,str],None]=None,
+            timeout:tuple[float,float]=_DEFAULT_TIMEOUT,
+            max_retries:int=3,
+            backoff_factor:float=0.5,
+            pool_maxsize:int=10,
+        ):
+        self.rates = rates or {}
+        self.api_keys = api_keys or {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._buckets = {host: TokenBucket(rate) for host, rate in self.rates.items()}
+        self._latencies = {}
+        self._errors = {}
+        self._stats_lock = threading.Lock()
+        # retries are sent by `request` so that each attempt takes a token of the host bucket,
+        # urllib3 retries inside the session would not be rate limited
+        adapter = HTTPAdapter(pool_connections=len(self.rates) or 1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method:str, url:str, params:Union[Dict[str,Any],None]=None, **kwargs) -> requests.Response:
+        """send a rate limited request, retried up to `max_retries` times on connection errors, timeouts
+        and `_RETRY_STATUS` responses, raises `requests.RequestException` on network errors"""
+        host = urlparse(url).hostname
+        params = dict(params or {})
+        if host in self.api_keys:
+            params["api_key"] = self.api_keys[host]
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if host in self._buckets:
+                self._buckets[host].acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params, **kwargs)
+            except requests.RequestException as e:
+                self._record(host, time.perf_counter() - start, error=True)
+                record_http(host, type(e).__name__, time.perf_counter() - start)
+                if attempt == self.max_retries or not isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            self._record(host, time.perf_counter() - start, error=response.status_code != 200)
+            record_http(host, response.status_code, time.perf_counter() - start)
+            if response.status_code not in _RETRY_STATUS or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(attempt, response.headers.get("Retry-After")))
+
+    def _retry_delay(self, attempt:int, retry_after:Union[str,None]=None) -> float:
+        """exponential backoff delay (s) before retrying, or the Retry-After delay of the response in seconds"""
+        if retry_after is not None and retry_after.strip().isdigit():
+            return float(retry_after)
+        return self.backoff_factor * 2 ** attempt
+
+    def get(self, url:str, params:Union[Dict[str,Any],None]=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url:str, data:Union[Dict[str,Any],None]=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, **kwargs)
+
+    def _record(self, host:str, latency:float, error:bool) -> None:
+        with self._stats_lock:
+            self._latencies.setdefault(host, deque(maxlen=_LATENCY_WINDOW)).append(latency)
+            self._errors[host] = self._errors.get(host, 0) + int(error)
+
+    def latency_stats(self) -> Dict[str,Dict[str,float]]:
+        """per host statistics over the last requests : count, errors, mean, median, p95 and max latency (s)"""
+        stats = {}
+        with self._stats_lock:
+            for host, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                stats[host] = {
+                    "count" : len(ordered),
+                    "errors" : self._errors.get(host, 0),
+                    "mean" : sum(ordered) / len(ordered),
+                    "median" : median(ordered),
+                    "p95" : ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                    "max" : ordered[-1],
+                }
+        return stats
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client() -> HttpClient:
+    """get the shared client, created on first call, the NCBI api key is read from
+    the `NCBI_API_KEY` environment variable"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            ncbi_api_key = os.environ.get("NCBI_API_KEY")
+            _default_client = HttpClient(
+                rates={
+                    NCBI_HOST: _NCBI_API_KEY_RATE if ncbi_api_key else _NCBI_RATE,
+                    CTGOV_HOST: _CTGOV_RATE,
+                },
+                api_keys={NCBI_HOST: ncbi_api_key} if ncbi_api_key else {},
+            )
+    return _default_client
+
+def set_client(client:HttpClient) -> None:
+    """replace the shared client (e.g. to change rates, api keys or timeouts)"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
@@ -1,36 +1,150 @@
 import re
-import ast
+import json
 import requests
-from typing import Union
+from typing import Generator, Iterable, Union
+from outcome_switch.cache import DiskCache
+from outcome_switch.client import get_client
+
+_CTGOV_API_URL = "https://clinicaltrials.gov/api/v2/studies"
+_CTGOV_PAGE_SIZE = 100 # number of nct ids per bulk studies query (bounded by url length)
+_LAST_UPDATE_FIELDS = "NCTId,LastUpdatePostDate"
+_OUTCOMES_FIELDS = "NCTId,LastUpdatePostDate,OutcomesModule"
+_registry_cache = None
+
+def set_ctgov_api_url(url:str) -> None:
+    """Set the CTGOV APIV2 studies endpoint (e.g. a local stand-in server for tests)"""
+    global _CTGOV_API_URL
+    _CTGOV_API_URL = url.rstrip("/")
+
+def set_registry_cache(cache:Union[DiskCache,None]) -> None:
+    """Set the on-disk cache of registry outcomes (None to disable caching), outcomes are cached
+    per nct id and last update date of the study, if the cache is offline, outcomes are only served from cache"""
+    global _registry_cache
+    _registry_cache = cache
+
+def _registry_cache_key(nct_id:str, last_update:Union[str,None]) -> str:
+    return f"ctgov:{nct_id}:{last_update}"
 
 def _find_nctid(text: str) -> Union[str,None]:
     "return nct string if found in text else none"
     match = re.search(r"[Nn][Cc][Tt]0*[1-9]\d{0,7}", text)
     return match[0] if match is not None else match
 
-def _get_registry_outcomes(nct_id: str) -> Union[dict,None]:
-    outcomes = None
-    r = requests.get(f"https://clinicaltrials.gov/api/v2/studies/{nct_id}", params={"fields":"OutcomesModule"})
-    if r.status_code == 200 and "outcomesModule" in r.json()["protocolSection"]:
-        outcomes = ast.literal_eval(r.text)["protocolSection"]["outcomesModule"]
+def _normalize_nctid(nct_id: str) -> str:
+    "return nct id in registry format : uppercase NCT prefix followed by 8 digits"
+    return f"NCT{int(nct_id[3:]):08d}"
+
+def _iter_studies(nct_ids:list[str], fields:str, failed_ids:Union[list[str],None]=None) -> Generator[dict, None, None]:
+    """yield studies of the nct ids using CTGOV APIV2 studies query, one request per page
+    of `_CTGOV_PAGE_SIZE` ids, each page is parsed once and its studies yielded before next request.
+    ids of the queries that failed (network error or error status) are added to `failed_ids` if given"""
+    for i in range(0, len(nct_ids), _CTGOV_PAGE_SIZE):
+        chunk = nct_ids[i:i+_CTGOV_PAGE_SIZE]
+        params = {"filter.ids": ",".join(chunk), "fields": fields, "pageSize": len(chunk)}
+        while True:
+            try:
+                r = get_client().get(_CTGOV_API_URL, params=params)
+            except requests.RequestException:
+                if failed_ids is not None:
+                    failed_ids.extend(chunk)
+                break
+            if r.status_code == 400 and len(chunk) > 1:
+                # one malformed id makes the whole query fail : query ids one by one
+                for nct_id in chunk:
+                    yield from _iter_studies([nct_id], fields, failed_ids)
+                break
+            if r.status_code != 200:
+                # a single malformed id is not a failure, the study does not exist
+                if failed_ids is not None and not (r.status_code == 400 and len(chunk) == 1):
+                    failed_ids.extend(chunk)
+                break
+            page = r.json()
+            yield from page.get("studies", [])
+            if not page.get("nextPageToken"):
+                break
+            params["pageToken"] = page["nextPageToken"]
+
+def _study_nct_id(study:dict) -> Union[str,None]:
+    return study.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
+
+def _study_last_update(study:dict) -> Union[str,None]:
+    return study.get("protocolSection", {}).get("statusModule", {}).get("lastUpdatePostDateStruct", {}).get("date")
+
+def get_registry_outcomes_many(nct_ids:Iterable[str]) -> dict[str,Union[dict,None]]:
+    """Get registry outcomes module of several nct ids with bulk CTGOV APIV2 queries,
+    each nct id is fetched once, returns a dict with nct id as key and outcomes module (or None) as value.
+    If a registry cache is set, only the last update dates are queried for studies already cached (studies never
+    cached are directly fetched), the latest cached outcomes are served if the cache is offline or if the last
+    update dates query fails"""
+    nct_ids = list(dict.fromkeys(nct_ids))
+    outcomes = dict.fromkeys(nct_ids)
+    missing_ids = nct_ids
+    if _registry_cache is not None:
+        # last update date of the latest cached outcomes of each study
+        latest = {nct_id: _registry_cache.get_text(_registry_cache_key(nct_id, "latest")) for nct_id in nct_ids}
+        cached_ids = [nct_id for nct_id in nct_ids if latest[nct_id] is not None]
+        failed_ids = list(cached_ids) if _registry_cache.offline else []
+        last_updates = {} if _registry_cache.offline else {
+            _study_nct_id(study): _study_last_update(study) for study in _iter_studies(cached_ids, _LAST_UPDATE_FIELDS, failed_ids)
+        }
+        # freshness unknown : latest cached outcomes
+        for nct_id in failed_ids:
+            if nct_id not in last_updates:
+                last_updates[nct_id] = latest[nct_id]
+        missing_ids = [] if _registry_cache.offline else [nct_id for nct_id in nct_ids if latest[nct_id] is None]
+        for nct_id in cached_ids:
+            cached = None
+            if last_updates.get(nct_id) is not None:
+                cached = _registry_cache.get_text(_registry_cache_key(nct_id, last_updates[nct_id]))
+            if cached is not None:
+                outcomes[nct_id] = json.loads(cached)
+            elif nct_id in last_updates and not _registry_cache.offline:
+                missing_ids.append(nct_id)
+    for study in _iter_studies(missing_ids, _OUTCOMES_FIELDS):
+        nct_id = _study_nct_id(study)
+        if nct_id not in outcomes:
+            continue
+        outcomes[nct_id] = study.get("protocolSection", {}).get("outcomesModule")
+        if _registry_cache is not None:
+            last_update = _study_last_update(study)
+            _registry_cache.set_text(_registry_cache_key(nct_id, last_update), json.dumps(outcomes[nct_id]))
+            _registry_cache.set_text(_registry_cache_key(nct_id, "latest"), str(last_update))
     return outcomes
 
+def _get_registry_outcomes(nct_id: str) -> Union[dict,None]:
+    return get_registry_outcomes_many([nct_id])[nct_id]
+
 def _reformat_outcomes(outcomes: dict) -> list[dict[str,str]]:
     new_outcomes = []
     for outcome_type, outcome_list in outcomes.items() :
         outcome_type = outcome_type.replace("Outcomes","")
         for outcome_item in outcome_list :
+            outcome_item = dict(outcome_item)
             outcome_item["type"] = outcome_type
             new_outcomes.append(outcome_item)
     return new_outcomes
 
+def registry_outcomes_tuples(registry_outcomes:list[dict[str,str]]) -> list[tuple[str,str]]:
+    """(type, sentence) tuples of reformatted registry outcomes as compared with article outcomes"""
+    return [(outcome["type"], outcome["measure"] + " , " + outcome.get("timeFrame", ""))
+            for outcome in registry_outcomes]
+
+def detect_nct_id(text:Union[str,None]) -> Union[str,None]:
+    """Return the first nct id found in text in registry format, None if not found"""
+    nct_id = _find_nctid(text) if text is not None else None
+    return _normalize_nctid(nct_id) if nct_id is not None else None
+
 def extract_nct_outcomes(text:str) -> Union[None,list[dict[str,str]]]:
     """Extract outcomes from a text using CTGOV APIV2 if a nct id is found else return None"""
-    outcomes = None
-    if text is None : 
-        return outcomes
-    nct_id = _find_nctid(text)
-    if nct_id is not None:
-        outcomes = _get_registry_outcomes(nct_id)
-        outcomes = _reformat_outcomes(outcomes)
-    return outcomes
+    return extract_nct_outcomes_many([text])[0]
+
+def extract_nct_outcomes_many(texts:list[Union[str,None]]) -> list[Union[None,list[dict[str,str]]]]:
+    """Same as `extract_nct_outcomes` for several texts, registry outcomes of all found
+    nct ids are fetched with bulk queries and a nct id shared by several texts is fetched once"""
+    nct_ids = [detect_nct_id(text) for text in texts]
+    registry_outcomes = get_registry_outcomes_many(nct_id for nct_id in nct_ids if nct_id is not None)
+    outcomes_list = []
+    for nct_id in nct_ids:
+        outcomes = registry_outcomes.get(nct_id) if nct_id is not None else None
+        outcomes_list.append(_reformat_outcomes(outcomes) if outcomes is not None else None)
+    return outcomes_list
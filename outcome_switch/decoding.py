@@ -0,0 +1,125 @@
+"""Vectorized decoding of NER logits into entities, a NumPy replacement of the token classification pipeline
+post-processing (softmax, "average" aggregation of subword tokens into words, grouping of BIO tagged words and
+resolution of the entities of overlapping windows)."""
+
+from __future__ import annotations
+import numpy as np
+from typing import Any, Callable, Union
+
+
+def _label_groups(id2label:dict[int,str]) -> tuple[list[str],np.ndarray,np.ndarray]:
+    """entity groups names, group index and begin flag of each label id (B-/I- prefixes are removed)"""
+    labels = [id2label[i] for i in range(len(id2label))]
+    names = [label[2:] if label[:2] in {"B-", "I-"} else label for label in labels]
+    groups = list(dict.fromkeys(names))
+    label_groups = np.array([groups.index(name) for name in names])
+    label_begins = np.array([label.startswith("B-") for label in labels])
+    return groups, label_groups, label_begins
+
+def _decode_window(
+        probs:np.ndarray,
+        offsets:np.ndarray,
+        text:str,
+        id2label:dict[int,str],
+        word_ids:Union[np.ndarray,None],
+        tokens:Union[np.ndarray,None],
+        tokens_to_string:Union[Callable[[list[str]],str],None],
+    ) -> list[dict[str,Any]]:
+    """entities of a window from its tokens probabilities (seq_len, n_labels) and offsets (seq_len, 2)"""
+    # special and padding tokens have empty offsets
+    keep = offsets[:, 1] > offsets[:, 0]
+    probs, offsets = probs[keep], offsets[keep]
+    if word_ids is not None:
+        word_ids = word_ids[keep]
+    if tokens is not None:
+        tokens = tokens[keep]
+    if len(probs) == 0:
+        return []
+    word_starts = np.ones(len(offsets), dtype=bool)
+    if word_ids is not None:
+        word_starts[1:] = word_ids[1:] != word_ids[:-1]
+    else:
+        word_starts[1:] = offsets[1:, 0] != offsets[:-1, 1]
+    word_indices = np.flatnonzero(word_starts)
+    word_counts = np.diff(np.append(word_indices, len(offsets)))
+    word_probs = np.add.reduceat(probs, word_indices, axis=0) / word_counts[:, None]
+    word_labels = word_probs.argmax(axis=1)
+    word_scores = word_probs[np.arange(len(word_labels)), word_labels]
+    word_ends = np.maximum.reduceat(offsets[:, 1], word_indices)
+    # a word starts an entity if its group differs from the previous word group or if it is tagged B-
+    groups, label_groups, label_begins = _label_groups(id2label)
+    word_groups = label_groups[word_labels]
+    entity_starts = np.ones(len(word_labels), dtype=bool)
+    entity_starts[1:] = (word_groups[1:] != word_groups[:-1]) | label_begins[word_labels[1:]]
+    entity_indices = np.flatnonzero(entity_starts)
+    entity_counts = np.diff(np.append(entity_indices, len(word_labels)))
+    entity_scores = np.add.reduceat(word_scores, entity_indices) / entity_counts
+    entity_start_chars = offsets[word_indices[entity_indices], 0]
+    entity_end_chars = np.maximum.reduceat(word_ends, entity_indices)
+    if tokens is not None:
+        # words detokenized as in the pipeline : subword tokens joined in words, words joined in entities
+        words = [tokens_to_string(list(tokens[i:i+n])) for i, n in zip(word_indices.tolist(), word_counts.tolist())]
+        entity_words = [tokens_to_string(words[i:i+n]) for i, n in zip(entity_indices.tolist(), entity_counts.tolist())]
+    else:
+        entity_words = [text[start:end] for start, end in zip(entity_start_chars.tolist(), entity_end_chars.tolist())]
+    return [
+        {"entity_group": groups[group], "score": float(score), "word": word, "start": int(start), "end": int(end)}
+        for group, score, word, start, end in zip(
+            word_groups[entity_indices].tolist(), entity_scores, entity_words,
+            entity_start_chars.tolist(), entity_end_chars.tolist()
+        )
+    ]
+
+def _aggregate_overlapping_entities(entities:list[dict[str,Any]]) -> list[dict[str,Any]]:
+    """entities of overlapping windows resolved as in the pipeline : of entities starting inside the previous
+    kept entity, the longest is kept, then the one with the highest score"""
+    if len(entities) == 0:
+        return entities
+    entities = sorted(entities, key=lambda entity: entity["start"])
+    aggregated_entities = []
+    previous_entity = entities[0]
+    for entity in entities[1:]:
+        if previous_entity["start"] <= entity["start"] < previous_entity["end"]:
+            length = entity["end"] - entity["start"]
+            previous_length = previous_entity["end"] - previous_entity["start"]
+            if length > previous_length or (length == previous_length and entity["score"] > previous_entity["score"]):
+                previous_entity = entity
+        else:
+            aggregated_entities.append(previous_entity)
+            previous_entity = entity
+    aggregated_entities.append(previous_entity)
+    return aggregated_entities
+
+def decode_entities(
+        logits:np.ndarray,
+        offsets:np.ndarray,
+        text:str,
+        id2label:dict[int,str],
+        word_ids:Union[np.ndarray,None]=None,
+        tokens:Union[np.ndarray,None]=None,
+        tokens_to_string:Union[Callable[[list[str]],str],None]=None,
+    ) -> list[dict[str,Any]]:
+    """Decode the entities of a text from the logits (n_windows, seq_len, n_labels) and character offsets
+    (n_windows, seq_len, 2) of its tokenized windows, which may overlap (stride). Tokens are grouped in words
+    by `word_ids` (n_windows, seq_len) of the tokenizer if given, else a token starting where the previous
+    token ends is a subword of the same word. Returns entities in the format of the pipeline with "average"
+    aggregation, "O" chunks included : entity_group, score, word, start, end.
+    As in the pipeline, each window is decoded on its own and overlapping entities of different windows are
+    resolved by `_aggregate_overlapping_entities`. Entity words are detokenized from the token strings
+    `tokens` (n_windows, seq_len) by `tokens_to_string` (the tokenizer `convert_tokens_to_string`, e.g.
+    lowercased by an uncased tokenizer) if given, as the pipeline words, else they are the text between the
+    entity offsets"""
+    n_labels = logits.shape[-1]
+    logits = logits.reshape(-1, offsets.shape[-2], n_labels).astype(np.float32)
+    offsets = offsets.reshape(-1, offsets.shape[-2], 2)
+    probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probs /= probs.sum(axis=-1, keepdims=True)
+    entities = []
+    for k in range(len(offsets)):
+        entities += _decode_window(
+            probs[k], offsets[k], text, id2label,
+            None if word_ids is None else word_ids.reshape(len(offsets), -1)[k],
+            None if tokens is None else tokens.reshape(len(offsets), -1)[k],
+            tokens_to_string,
+        )
+    return _aggregate_overlapping_entities(entities) if len(offsets) > 1 else entities
@@ -0,0 +1,529 @@
+import copy
+import contextvars
+import threading
+import time
+import numpy as np
+import torch
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from queue import Queue
+from pathlib import Path
+from typing import Any, Generator, Iterable, Union
+from outcome_switch.backends import NER_ONNX_FILENAME, SIM_ONNX_FILENAME, load_backend
+from outcome_switch.batching import MicroBatcher
+from outcome_switch.cache import DiskCache
+from outcome_switch.ctgov import (detect_nct_id, extract_nct_outcomes, 
+                                  extract_nct_outcomes_many, registry_outcomes_tuples)
+from outcome_switch.decoding import decode_entities
+from outcome_switch.matching import connections_array
+from outcome_switch.metrics import RequestMetrics, get_profiler, has_metrics_hooks, track_request
+from outcome_switch.registry_index import RegistryIndex
+from outcome_switch.similarity import OutcomeSimilarity
+from outcome_switch.stage_cache import get_stage_cache
+from outcome_switch.entrez import dl_and_parse, dl_and_parse_many
+from outcome_switch.filter import (filter_sections, filter_outcomes, get_sections_text, 
+                                   outcome_cues_score, _text_segments, _merge_segments_entities)
+from outcome_switch.entrez import _normalize_article_id, _parse_article, _reformat_article
+from transformers import (BertConfig, 
+                          BertTokenizerFast, 
+                          BertForTokenClassification, 
+                          TokenClassificationPipeline)
+
+# NER on the whole text with overlapping strided windows, or on length sorted batches of its sentences or paragraphs
+NER_MODES = ("strided", "sentences", "paragraphs")
+# NER logits decoded by the pipeline post-processing, or by NumPy array operations (`decode_entities`)
+NER_DECODINGS = ("pipeline", "vectorized")
+_NER_STRIDE = 64
+
+def _nct_search_text(parse_output:dict[str,Any]) -> Union[str,None]:
+    """text where the nct id of an article is searched : raw xml, or sections text if xml was not kept"""
+    if parse_output["article_xml"] is not None:
+        return parse_output["article_xml"]
+    return get_sections_text(parse_output["article_sections"])
+
+class OutcomeSwitchingDetector:
+    """Main Class for the whole pipeline of outcome switching detection"""
+    def __init__(
+            self, 
+            ner_path:str, 
+            sim_path:str, 
+            ner_label2id:dict[str,str],
+            io_workers:int=8,
+            model_workers:int=1,
+            embedding_store:Union[DiskCache,None]=None,
+            registry_index:Union[RegistryIndex,None]=None,
+            sim_batch_size:int=64,
+            sim_max_tokens:int=8192,
+            backend:str="torch",
+            onnx_dir:str=".cache/onnx",
+            ner_mode:str="strided",
+            ner_batch_size:int=16,
+            ner_workers:int=1,
+            ner_prefilter:int=0,
+            ner_decoding:str="pipeline",
+            batch_max_size:int=0,
+            batch_max_wait_ms:float=5.0,
+            match_mode:str="bidirectional",
+            match_threshold:Union[float,None]=None,
+            match_top_k:int=1,
+        ):
+        if ner_mode not in NER_MODES:
+            raise ValueError(f"Unknown NER mode {ner_mode}, must be one of {NER_MODES}")
+        if ner_decoding not in NER_DECODINGS:
+            raise ValueError(f"Unknown NER decoding {ner_decoding}, must be one of {NER_DECODINGS}")
+        if ner_prefilter > 0 and ner_mode == "strided":
+            raise ValueError("ner_prefilter skips sentences or paragraphs, it requires ner_mode sentences or paragraphs")
+        # executors shared by all in-flight requests : network downloads and models forward passes
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="osd-io")
+        self._model_executor = ThreadPoolExecutor(max_workers=model_workers, thread_name_prefix="osd-model")
+        # detections in flight by article id : concurrent calls for the same id share one computation
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # models ids and settings, part of the stage cache keys
+        self.ner_path = ner_path
+        self.sim_path = sim_path
+        self.backend = backend
+        # models loading duration (s) of each phase
+        self.load_times = {}
+        start = time.perf_counter()
+        # define config
+        config = BertConfig.from_pretrained(ner_path, 
+                                            label2id=ner_label2id, 
+                                            id2label={v: k for k, v in ner_label2id.items()})
+        self.outcomes_ner = TokenClassificationPipeline(
+            model = load_backend(
+                BertForTokenClassification.from_pretrained(ner_path,config=config,low_cpu_mem_usage=True),
+                backend,
+                Path(onnx_dir) / NER_ONNX_FILENAME,
+                "logits",
+            ),
+            tokenizer = BertTokenizerFast.from_pretrained(ner_path),
+            ignore_labels = [],
+            aggregation_strategy = "average",
+            stride=_NER_STRIDE
+        )
+        # sentences and paragraphs modes : batches of segments are run by `ner_workers` threads, each with 
+        # its own pipeline (and tokenizer copy, fast tokenizers can not be used by several threads at once)
+        self.ner_mode = ner_mode
+        self.ner_decoding = ner_decoding
+        self.ner_batch_size = ner_batch_size
+        # min number of outcome cue words of a segment to run NER on it (0 : all segments)
+        self.ner_prefilter = ner_prefilter
+        self._ner_pipelines = Queue()
+        self._ner_pipelines.put(self.outcomes_ner)
+        for _ in range(ner_workers - 1):
+            self._ner_pipelines.put(TokenClassificationPipeline(
+                model = self.outcomes_ner.model,
+                tokenizer = copy.deepcopy(self.outcomes_ner.tokenizer),
+                ignore_labels = [],
+                aggregation_strategy = "average",
+                stride=_NER_STRIDE
+            ))
+        self._ner_executor = ThreadPoolExecutor(max_workers=ner_workers, thread_name_prefix="osd-ner") if ner_workers > 1 else None
+        # tokenizer counting the NER tokens of requests for the metrics hooks
+        self._count_tokenizer = copy.deepcopy(self.outcomes_ner.tokenizer)
+        self._count_tokenizer_lock = threading.Lock()
+        self.load_times["ner_model"] = time.perf_counter() - start
+        start = time.perf_counter()
+        self.outcome_sim = OutcomeSimilarity(
+            sim_path, 
+            embedding_store=embedding_store, 
+            batch_size=sim_batch_size, 
+            max_tokens=sim_max_tokens,
+            backend=backend,
+            onnx_path=Path(onnx_dir) / SIM_ONNX_FILENAME,
+            match_mode=match_mode,
+            match_threshold=match_threshold,
+            match_top_k=match_top_k,
+        )
+        self.load_times["sim_model"] = time.perf_counter() - start
+        if registry_index is not None and registry_index.model_id != self.outcome_sim.embedding_cache.model_id:
+            raise ValueError(f"Registry index was built with {registry_index.model_id}, it can not be used with "
+                             f"{self.outcome_sim.embedding_cache.model_id}, rebuild it with the same model and backend")
+        self.registry_index = registry_index
+        # cross-request micro-batching of NER and similarity in `detect` (0 : each request runs its own forward passes),
+        # batches are run on the model executor like the other forward passes
+        self._ner_batcher = None
+        self._sim_batcher = None
+        if batch_max_size > 1:
+            self._ner_batcher = MicroBatcher(self._extract_articles_outcomes, batch_max_size, batch_max_wait_ms,
+                                             "osd-ner-batcher", self._model_executor)
+            self._sim_batcher = MicroBatcher(self._similarity_items, batch_max_size, batch_max_wait_ms,
+                                             "osd-sim-batcher", self._model_executor)
+
+    @classmethod
+    def from_config(cls, config:dict[str,Any]) -> "OutcomeSwitchingDetector":
+        """create the detector from the app config (see config.json)"""
+        return cls(
+            config["ner_path"], 
+            config["sim_path"],
+            config["ner_label2id"],
+            embedding_store=DiskCache.from_config(config["embedding_cache"]) if "embedding_cache" in config else None,
+            registry_index=RegistryIndex(config["registry_index_path"]) if "registry_index_path" in config else None,
+            sim_batch_size=config.get("sim_batch_size", 64),
+            sim_max_tokens=config.get("sim_max_tokens", 8192),
+            backend=config.get("inference_backend", "torch"),
+            onnx_dir=config.get("onnx_dir", ".cache/onnx"),
+            ner_mode=config.get("ner_mode", "strided"),
+            ner_batch_size=config.get("ner_batch_size", 16),
+            ner_workers=config.get("ner_workers", 1),
+            ner_prefilter=config.get("ner_prefilter", 0),
+            ner_decoding=config.get("ner_decoding", "pipeline"),
+            batch_max_size=config.get("batching", {}).get("max_batch_size", 0),
+            batch_max_wait_ms=config.get("batching", {}).get("max_wait_ms", 5.0),
+            match_mode=config.get("match_mode", "bidirectional"),
+            match_threshold=config.get("match_threshold"),
+            match_top_k=config.get("match_top_k", 1),
+        )
+
+    def warm_up(self, article_xml:str, db:str) -> None:
+        """run the models once on a local article (no network) so that the first request does not pay
+        for lazy initializations (tokenizers, kernels, memory allocations), the stage cache is not used"""
+        start = time.perf_counter()
+        filter_output = filter_sections(_reformat_article(_parse_article(article_xml, db)))
+        article_outcomes = filter_outcomes(self._ner([get_sections_text(filter_output["filtered_sections"])])[0])
+        if article_outcomes:
+            self.outcome_sim.get_similarity(article_outcomes, article_outcomes)
+        self.load_times["warm_up"] = time.perf_counter() - start
+
+    def _ner(self, texts:list[str]) -> list[list[dict[str,Any]]]:
+        """entities of each text (same format as the pipeline output, start and end are offsets in the text).
+        In sentences and paragraphs modes, segments of all texts are sorted by length and run in padded batches 
+        of `ner_batch_size` segments, so that there is no overlapping windows and little padding.
+        If `ner_prefilter` is set, segments with less outcome cue words are not run and annotated as O"""
+        if self.ner_mode == "strided":
+            if self.ner_decoding == "pipeline":
+                return self.outcomes_ner(texts, batch_size=len(texts))
+            segments = [(i, 0, len(text)) for i, text in enumerate(texts) if text]
+        else:
+            segments = [(i, start, end) for i, text in enumerate(texts) for start, end in _text_segments(text, self.ner_mode)]
+        segments_entities = [None] * len(segments)
+        if self.ner_prefilter > 0 and self.ner_mode != "strided":
+            for k, (i, start, end) in enumerate(segments):
+                segment = texts[i][start:end]
+                if outcome_cues_score(segment) < self.ner_prefilter:
+                    segments_entities[k] = [{"entity_group": "O", "score": 1.0, "word": segment, "start": 0, "end": end - start}]
+        order = sorted(
+            (k for k in range(len(segments)) if segments_entities[k] is None), 
+            key=lambda k: segments[k][2] - segments[k][1],
+        )
+        batches = [order[k:k+self.ner_batch_size] for k in range(0, len(order), self.ner_batch_size)]
+        batches_texts = [[texts[segments[k][0]][segments[k][1]:segments[k][2]] for k in batch] for batch in batches]
+        if self._ner_executor is not None:
+            batches_entities = self._ner_executor.map(self._ner_batch, batches_texts)
+        else:
+            batches_entities = map(self._ner_batch, batches_texts)
+        for batch, batch_entities in zip(batches, batches_entities):
+            for k, entities in zip(batch, batch_entities):
+                segments_entities[k] = entities
+        # map segments offsets back to texts offsets
+        return _merge_segments_entities(texts, segments, segments_entities)
+
+    def _ner_batch(self, segments:list[str]) -> list[list[dict[str,Any]]]:
+        pipeline = self._ner_pipelines.get()
+        try:
+            if self.ner_decoding == "vectorized":
+                return self._ner_decode(pipeline, segments)
+            return pipeline(segments, batch_size=len(segments))
+        finally:
+            self._ner_pipelines.put(pipeline)
+
+    def _ner_decode(self, pipeline:TokenClassificationPipeline, segments:list[str]) -> list[list[dict[str,Any]]]:
+        """run the NER model of the pipeline on segments split in overlapping windows of the model max length,
+        and decode the entities of each segment from the windows logits and offsets with `decode_entities`"""
+        encodings = pipeline.tokenizer(
+            segments, 
+            truncation=True, 
+            stride=_NER_STRIDE, 
+            padding=True,
+            return_overflowing_tokens=True, 
+            return_offsets_mapping=True, 
+            return_tensors="np",
+        )
+        input_names = [name for name in pipeline.tokenizer.model_input_names if name in encodings]
+        windows = encodings["overflow_to_sample_mapping"]
+        logits = []
+        for start in range(0, len(windows), self.ner_batch_size):
+            inputs = {name: torch.from_numpy(encodings[name][start:start+self.ner_batch_size]) for name in input_names}
+            with torch.no_grad():
+                logits.append(pipeline.model(**inputs).logits.numpy())
+        logits = np.concatenate(logits)
+        # words of the pre-tokenizer (-1 for special tokens), subwords are averaged as in the pipeline
+        word_ids = np.array([[-1 if word_id is None else word_id for word_id in encodings.word_ids(i)] 
+                             for i in range(len(windows))])
+        # token strings detokenized into the entity words as in the pipeline, unknown tokens are their text
+        tokenizer = pipeline.tokenizer
+        tokens = np.array([tokenizer.convert_ids_to_tokens(ids) for ids in encodings["input_ids"].tolist()], dtype=object)
+        for i, j in zip(*np.nonzero(encodings["input_ids"] == tokenizer.unk_token_id)):
+            start, end = encodings["offset_mapping"][i, j]
+            tokens[i, j] = segments[windows[i]][start:end]
+        id2label = pipeline.model.config.id2label
+        return [
+            decode_entities(
+                logits[windows == k], encodings["offset_mapping"][windows == k], segment, id2label, word_ids[windows == k],
+                tokens[windows == k], tokenizer.convert_tokens_to_string,
+            )
+            for k, segment in enumerate(segments)
+        ]
+
+    def _extract_article_outcomes(self, article_text:str) -> dict[str, Any]:
+        return self._extract_articles_outcomes([article_text])[0]
+
+    def _extract_articles_outcomes(self, articles_texts:list[str]) -> list[dict[str, Any]]:
+        """raw entities and outcomes of each article text, NER is run at once on all texts 
+        whose results are not in the stage cache"""
+        ner_outputs = [{"raw_entities" : None, "article_outcomes" : None} for _ in articles_texts]
+        stage_cache = get_stage_cache()
+        stage_inputs = [[text, self.ner_path, self.backend, self.ner_mode, self.ner_decoding, self.ner_prefilter] 
+                        for text in articles_texts]
+        ner_indices = []
+        for i, text in enumerate(articles_texts):
+            cached = stage_cache.get("ner", stage_inputs[i]) if stage_cache is not None and text else None
+            if cached is not None:
+                ner_outputs[i] = {"raw_entities" : cached["raw_entities"], 
+                                  "article_outcomes" : [tuple(outcome) for outcome in cached["article_outcomes"]]}
+            elif text:
+                ner_indices.append(i)
+        # get article outcomes (all pieces of text annotated)
+        entities_lists = self._ner([articles_texts[i] for i in ner_indices]) if ner_indices else []
+        for i, entities_list in zip(ner_indices, entities_lists):
+            # filter outcomes and reformat
+            ner_outputs[i] = {"raw_entities" : entities_list, "article_outcomes" : filter_outcomes(entities_list)}
+            if stage_cache is not None:
+                stage_cache.set("ner", stage_inputs[i], ner_outputs[i])
+        return ner_outputs
+
+    def _compare_outcomes(
+            self, 
+            registry_outcomes:list[tuple[str,str]],
+            article_outcomes:list[tuple[str,str]],
+            nct_id:Union[str,None]=None,
+        ) -> dict[str, Any]:
+        if not registry_outcomes or not article_outcomes :
+            return None
+        registry_outcomes = registry_outcomes_tuples(registry_outcomes)
+        # semantic similarity of outcomes between registry and article
+        item = ((registry_outcomes, article_outcomes), self._registry_embeddings(nct_id, registry_outcomes))
+        if self._sim_batcher is not None:
+            return self._sim_batcher.submit(item)
+        return self._similarity_items([item])[0]
+
+    def _similarity_items(
+            self, 
+            items:list[tuple[tuple[list[tuple[str,str]],list[tuple[str,str]]],Union[np.ndarray,None]]],
+        ) -> list[np.ndarray]:
+        """`_similarity_many` on a list of ((registry outcomes, article outcomes), registry embeddings) items"""
+        return self._similarity_many([pair for pair, _ in items], [embeddings for _, embeddings in items])
+
+    def _similarity_many(
+            self, 
+            outcomes_pairs:list[tuple[list[tuple[str,str]],list[tuple[str,str]]]],
+            registry_embeddings_list:list[Union[np.ndarray,None]],
+        ) -> list[np.ndarray]:
+        """connections of each (registry outcomes, article outcomes) pair, similarity is computed at once 
+        for all pairs whose connections are not in the stage cache"""
+        connections_list = [None] * len(outcomes_pairs)
+        stage_cache = get_stage_cache()
+        match_settings = [self.outcome_sim.match_mode, self.outcome_sim.match_threshold, self.outcome_sim.match_top_k]
+        stage_inputs = [[registry_outcomes, article_outcomes, self.sim_path, self.backend, *match_settings] 
+                        for registry_outcomes, article_outcomes in outcomes_pairs]
+        sim_indices = []
+        for i in range(len(outcomes_pairs)):
+            cached = stage_cache.get("similarity", stage_inputs[i]) if stage_cache is not None else None
+            if cached is not None:
+                connections_list[i] = connections_array(cached)
+            else:
+                sim_indices.append(i)
+        computed = self.outcome_sim.get_similarity_many(
+            [outcomes_pairs[i] for i in sim_indices], [registry_embeddings_list[i] for i in sim_indices]
+        )
+        for i, connections in zip(sim_indices, computed):
+            connections_list[i] = connections
+            if stage_cache is not None:
+                stage_cache.set("similarity", stage_inputs[i], connections.tolist())
+        return connections_list
+
+    def _filter_sections(self, article_sections:Union[dict[str,list[str]],None]) -> dict[str,Any]:
+        """`filter_sections` output, from the stage cache if it is set"""
+        stage_cache = get_stage_cache()
+        if stage_cache is None or not article_sections:
+            return filter_sections(article_sections)
+        filter_output = stage_cache.get("filter", [article_sections])
+        if filter_output is None:
+            filter_output = filter_sections(article_sections)
+            stage_cache.set("filter", [article_sections], filter_output)
+        return filter_output
+
+    def _registry_embeddings(self, nct_id:Union[str,None], registry_outcomes:list[tuple[str,str]]):
+        """precomputed registry outcomes embeddings if a registry index is loaded, else None"""
+        if self.registry_index is None or nct_id is None:
+            return None
+        return self.registry_index.get_embeddings(nct_id, registry_outcomes)
+    
+    def _search_registry(self, nct_id:Union[str,None], article_outcomes:list[tuple[str,str]]) -> Union[list[tuple[str,float]],None]:
+        """registered trials most similar to the article outcomes when no nct id is found in article"""
+        if self.registry_index is None or nct_id is not None or not article_outcomes:
+            return None
+        return self.registry_index.search_trials(self.outcome_sim.encode(article_outcomes))
+
+    def detect(self, article_id:str) -> dict[str,Any]:
+        """detect outcome switching in input id (pmid, pmcid)
+        returns a dictionary with the following keys :  
+        - article_xml : xml string of the article
+        - article_sections : dict of all sections of the article key=title, value=list of text content
+        - check_type : type of the check for regex outcome section filtering (title or content)
+        - regex_priority_name : name of the regex used for outcome section filtering
+        - regex_priority_index : number of priority of the regex used for outcome section filtering (0 is the highest priority)
+        - filtered_sections : dict of all filtered sections of the article key=title, value=list of text content
+        - raw_entities : output of huggingface token classification pipeline with aggregated entities but also O text (non-entity)
+        - article_outcomes : List of tuples (type, outcome) of all outcomes detected in the article
+        - detected_nct_id : first nct id detected in the article
+        - ctgov_outcomes : List of tuples (type, outcome) of all outcomes detected in the registry
+        - candidate_trials : if no nct id is detected and a registry index is loaded, list of tuples 
+        (nct_id, score) of the registered trials whose outcomes are the most similar to the article outcomes
+        Concurrent calls for the same (normalized) id wait for the detection in flight and each get a deep copy
+        of its output, which they can modify.
+        Stages durations, counts and HTTP calls of the detection are passed to the hooks of `outcome_switch.metrics`
+        """
+        article_id = _normalize_article_id(article_id)
+        with self._inflight_lock:
+            future = self._inflight.get(article_id)
+            in_flight = future is not None
+            if not in_flight:
+                future = self._inflight[article_id] = Future()
+        if in_flight:
+            return copy.deepcopy(future.result())
+        profiler = get_profiler()
+        try:
+            with track_request(article_id) as request_metrics:
+                with profiler.profile(article_id) if profiler is not None else nullcontext():
+                    output = self._detect(article_id, request_metrics)
+            future.set_result(output)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[article_id]
+        return copy.deepcopy(output)
+
+    def _detect(self, article_id:str, request_metrics:RequestMetrics) -> dict[str,Any]:
+        # download and parse article
+        with request_metrics.stage("dl_and_parse"):
+            parse_output = dl_and_parse(article_id)
+        nct_id = detect_nct_id(parse_output["article_xml"])
+        # search nct id in text, then download and parse registry outcomes in background
+        # (in a copy of the context so that its HTTP calls are recorded in the request metrics)
+        def extract_registry_outcomes():
+            with request_metrics.stage("extract_nct_outcomes"):
+                return extract_nct_outcomes(parse_output["article_xml"])
+        registry_future = self._io_executor.submit(contextvars.copy_context().run, extract_registry_outcomes)
+        # filter article sections and get text
+        with request_metrics.stage("filter_sections"):
+            filter_output = self._filter_sections(parse_output["article_sections"])
+        sections_text = get_sections_text(filter_output["filtered_sections"])
+        # outcomes ner in article text while registry is downloaded, batched with concurrent requests 
+        # if micro-batching is enabled (batches are then run by the batchers on the model executor)
+        with request_metrics.stage("ner"):
+            if self._ner_batcher is not None:
+                ner_output = self._ner_batcher.submit(sections_text)
+            else:
+                ner_output = self._model_executor.submit(self._extract_article_outcomes, sections_text).result()
+        with request_metrics.stage("registry_wait"):
+            registry_outcomes = registry_future.result()
+        # compare outcomes between article and registry
+        with request_metrics.stage("similarity"):
+            if self._sim_batcher is not None:
+                connections = self._compare_outcomes(registry_outcomes, ner_output["article_outcomes"], nct_id)
+            else:
+                connections = self._model_executor.submit(
+                    self._compare_outcomes, registry_outcomes, ner_output["article_outcomes"], nct_id
+                ).result()
+        with request_metrics.stage("search_registry"):
+            candidate_trials = self._model_executor.submit(
+                self._search_registry, nct_id, ner_output["article_outcomes"]
+            ).result()
+        self._count_items(request_metrics, parse_output, filter_output, sections_text, ner_output, registry_outcomes, connections)
+        return (parse_output | {"detected_nct_id":nct_id, "ctgov_outcomes":registry_outcomes} | 
+                filter_output | ner_output | {"connections":connections, "candidate_trials":candidate_trials})
+
+    def _count_items(
+            self,
+            request_metrics:RequestMetrics,
+            parse_output:dict[str,Any],
+            filter_output:dict[str,Any],
+            sections_text:str,
+            ner_output:dict[str,Any],
+            registry_outcomes:Union[list[dict[str,str]],None],
+            connections:Union[np.ndarray,None],
+        ) -> None:
+        """sections, NER characters and tokens, entities, outcomes and connections counts of a detection"""
+        request_metrics.count("sections", len(parse_output["article_sections"] or {}))
+        request_metrics.count("filtered_sections", len(filter_output["filtered_sections"] or {}))
+        request_metrics.count("ner_chars", len(sections_text))
+        # tokens are only counted when the metrics are used by a hook
+        if sections_text and has_metrics_hooks():
+            with self._count_tokenizer_lock:
+                request_metrics.count("ner_tokens", len(self._count_tokenizer(sections_text, add_special_tokens=False, verbose=False)["input_ids"]))
+        request_metrics.count("raw_entities", len(ner_output["raw_entities"] or []))
+        request_metrics.count("article_outcomes", len(ner_output["article_outcomes"] or []))
+        request_metrics.count("registry_outcomes", len(registry_outcomes or []))
+        request_metrics.count("connections", len(connections) if connections is not None else 0)
+
+    def detect_many(self, article_ids:Iterable[str], batch_size:int=32) -> Generator[tuple[str,dict[str,Any]],None,None]:
+        """detect outcome switching for several ids (pmid, pmcid), articles are downloaded in bulk 
+        and NER and similarity models are run on batches of `batch_size` articles.
+        yields tuples (article_id, output) where output is the same dictionary as `detect` output,
+        results are grouped by database (pubmed, pmc) so they are not yielded in input order"""
+        yield from self.detect_parsed_many(dl_and_parse_many(article_ids), batch_size)
+
+    def detect_parsed_many(
+            self, 
+            parse_outputs:Iterable[tuple[str,dict[str,Any]]], 
+            batch_size:int=32,
+        ) -> Generator[tuple[str,dict[str,Any]],None,None]:
+        """same as `detect_many` for already downloaded and parsed articles, e.g. local full texts of
+        `outcome_switch.pmc_oa.iter_pmc_oa_articles` : `parse_outputs` yields tuples (article_id, parse_output)
+        where parse_output is a `dl_and_parse` output dict. Results are yielded in input order"""
+        batch = []
+        for article_id, parse_output in parse_outputs:
+            batch.append((article_id, parse_output))
+            if len(batch) == batch_size:
+                yield from self._detect_batch(batch)
+                batch = []
+        if batch:
+            yield from self._detect_batch(batch)
+
+    def _detect_batch(self, batch:list[tuple[str,dict[str,Any]]]) -> Generator[tuple[str,dict[str,Any]],None,None]:
+        # registry outcomes of the batch are downloaded in background during filtering and NER
+        nct_texts = [_nct_search_text(parse_output) for _, parse_output in batch]
+        registry_future = self._io_executor.submit(extract_nct_outcomes_many, nct_texts)
+        outputs = [parse_output | self._filter_sections(parse_output["article_sections"]) for _, parse_output in batch]
+        # outcomes ner on all non empty article texts at once
+        texts = [get_sections_text(output["filtered_sections"]) for output in outputs]
+        ner_outputs = self._model_executor.submit(self._extract_articles_outcomes, texts).result()
+        for output, nct_text, registry_outcomes, ner_output in zip(outputs, nct_texts, registry_future.result(), ner_outputs):
+            output.update({
+                "detected_nct_id" : detect_nct_id(nct_text), 
+                "ctgov_outcomes" : registry_outcomes, 
+                "connections" : None,
+                "candidate_trials" : None,
+            } | ner_output)
+        # similarity on all articles having both registry and article outcomes at once
+        sim_indices = [i for i, output in enumerate(outputs) if output["ctgov_outcomes"] and output["article_outcomes"]]
+        outcomes_pairs = [(registry_outcomes_tuples(outputs[i]["ctgov_outcomes"]), outputs[i]["article_outcomes"]) 
+                          for i in sim_indices]
+        registry_embeddings_list = [self._registry_embeddings(outputs[i]["detected_nct_id"], registry_outcomes) 
+                                    for i, (registry_outcomes, _) in zip(sim_indices, outcomes_pairs)]
+        connections_list = self._model_executor.submit(
+            self._similarity_many, outcomes_pairs, registry_embeddings_list
+        ).result()
+        for i, connections in zip(sim_indices, connections_list):
+            outputs[i]["connections"] = connections
+        candidate_trials_list = self._model_executor.map(
+            self._search_registry, [output["detected_nct_id"] for output in outputs], [output["article_outcomes"] for output in outputs]
+        )
+        for output, candidate_trials in zip(outputs, candidate_trials_list):
+            output["candidate_trials"] = candidate_trials
+        for (article_id, _), output in zip(batch, outputs):
+            yield article_id, output
@@ -5,15 +5,63 @@ import html
 import requests
 import unicodedata
 from abc import ABC, abstractmethod
+from functools import cached_property
 from io import StringIO
 from pathlib import Path
 from typing import IO, Any, Dict, Union 
-from xml.etree.ElementTree import Element  # nosec
+from xml.etree.ElementTree import Element, tostring  # nosec
 from zipfile import ZipFile
-from typing import Generator
+from typing import Generator, Iterable
 from defusedxml import ElementTree
+from outcome_switch.cache import DiskCache
+from outcome_switch.client import get_client
+from outcome_switch.stage_cache import get_stage_cache
 
 _ENTREZ_EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+_EFETCH_BATCH_SIZE = 200 # max number of ids per efetch GET request recommended by NCBI
+# errors of `dl_and_parse` outputs : id with wrong format, article not returned by efetch, 
+# article without abstract nor paragraphs
+PARSE_ERRORS = ("invalid_id", "not_found", "no_text")
+# JATS tags for which the inner text is used as is
+_JATS_INNER_TEXT_TAGS = frozenset({
+    "bold",
+    "italic",
+    "monospace",
+    "p",
+    "sc",
+    "styled-content",
+    "underline",
+    "xref",
+})
+# JATS tags without useful text
+_JATS_IGNORED_TAGS = frozenset({
+    "disp-formula",
+    "email",
+    "ext-link",
+    "inline-formula",
+    "uri",
+})
+_JATS_SECTION_SKIPPED_TAGS = frozenset({"title", "caption", "fig", "table-wrap", "label"})
+_xml_cache = None
+
+def set_entrez_efetch_url(url:str) -> None:
+    """Set the Entrez efetch endpoint (e.g. a local stand-in server for tests and benchmarks)"""
+    global _ENTREZ_EFETCH_URL
+    _ENTREZ_EFETCH_URL = url
+
+def set_xml_cache(cache:Union[DiskCache,None]) -> None:
+    """Set the on-disk cache used for downloaded articles xml (None to disable caching),
+    if the cache is offline, articles are only served from cache"""
+    global _xml_cache
+    _xml_cache = cache
+
+def _xml_cache_key(article_id:str, db:str) -> str:
+    return f"efetch:{db}:{article_id}"
+
+def _normalize_article_id(article_id:str) -> str:
+    """strip article id and uppercase its PMC prefix"""
+    article_id = article_id.strip()
+    return "PMC" + article_id[3:] if article_id[:3].upper() == "PMC" else article_id
 
 def _db_parser(article_id:str) -> str|None:
     """Parse the article ID to ensure it is in the correct format."""
@@ -27,11 +75,95 @@ def _db_parser(article_id:str) -> str|None:
 def _dl_article_xml(article_id:str, db:str|None) -> tuple[None|str,str] : 
     xml_string = None
     params = {"db": db, "id": article_id, "retmode": "xml"}
-    response = requests.get(_ENTREZ_EFETCH_URL, params=params)
+    try:
+        response = get_client().get(_ENTREZ_EFETCH_URL, params=params)
+    except requests.RequestException:
+        return xml_string
     if response.status_code == 200:
         xml_string = response.text
     return xml_string
 
+def _get_article_xml(article_id:str, db:str) -> Union[str,None]:
+    """Get article xml from cache if available else download it (unless cache is offline) and cache it"""
+    if _xml_cache is not None:
+        xml_string = _xml_cache.get_text(_xml_cache_key(article_id, db))
+        if xml_string is not None or _xml_cache.offline:
+            return xml_string
+    xml_string = _dl_article_xml(article_id, db)
+    if xml_string is not None and _xml_cache is not None:
+        _xml_cache.set_text(_xml_cache_key(article_id, db), xml_string)
+    return xml_string
+
+def _group_ids_by_db(article_ids:Iterable[str]) -> Dict[Union[str,None],list[str]]:
+    """Group article ids by the database they belong to (None for wrong format ids)"""
+    groups = {}
+    for article_id in article_ids:
+        db = _db_parser(article_id)
+        groups.setdefault(db, []).append(article_id)
+    return groups
+
+def _article_xml_id(article:Element, db:str) -> Union[str,None]:
+    """Get the id of an article element of an efetch articleset, with the same format as input ids"""
+    if db == "pmc":
+        for article_id in article.findall("./front/article-meta/article-id"):
+            if article_id.get("pub-id-type") in {"pmc","pmcid"}:
+                text = (article_id.text or "").strip()
+                return text if text.startswith("PMC") else "PMC" + text
+    elif db == "pubmed":
+        pmid = article.find("./MedlineCitation/PMID")
+        if pmid is not None:
+            return (pmid.text or "").strip()
+    return None
+
+def _article_to_xml(article:Element, db:str) -> str:
+    """Serialize an article element of an articleset to a standalone xml string readable by `_parse_article`"""
+    article_xml = tostring(article, encoding="unicode")
+    if db == "pubmed":
+        article_xml = f"<PubmedArticleSet>{article_xml}</PubmedArticleSet>"
+    return article_xml
+
+def parse_articleset(xml_string:str, db:str) -> Dict[str,ArticleParser]:
+    """Parse every article of an efetch articleset xml (or of a single article xml) with the parser
+    of the db, returns a dict with article id (PMCID or PMID) as key and article parser as value"""
+    root = ElementTree.fromstring(xml_string)
+    parser_class = JATSXMLParser if db == "pmc" else PubMedXMLParser
+    parsers = {}
+    for parser in parser_class.iter_elements(root):
+        if parser.article_id is not None:
+            parsers[parser.article_id] = parser
+    return parsers
+
+def _dl_articles(article_ids:list[str], db:str) -> Dict[str,tuple[str,Union[ArticleParser,None]]]:
+    """Download several articles of the same db with one efetch request per
+    `_EFETCH_BATCH_SIZE` ids (cached articles are not downloaded again), each response is parsed once.
+    Returns a dict with article id as key and (article xml, article parser) as value, 
+    the parser is None for cached articles which are not parsed yet, missing ids are not in the dict"""
+    articles = {}
+    if _xml_cache is not None:
+        for article_id in article_ids:
+            xml_string = _xml_cache.get_text(_xml_cache_key(article_id, db))
+            if xml_string is not None:
+                articles[article_id] = (xml_string, None)
+        if _xml_cache.offline:
+            return articles
+    missing_ids = [article_id for article_id in dict.fromkeys(article_ids) if article_id not in articles]
+    for i in range(0, len(missing_ids), _EFETCH_BATCH_SIZE):
+        xml_string = _dl_article_xml(",".join(missing_ids[i:i+_EFETCH_BATCH_SIZE]), db)
+        if xml_string is None:
+            continue
+        for article_id, parser in parse_articleset(xml_string, db).items():
+            article_xml = _article_to_xml(parser.content, db)
+            articles[article_id] = (article_xml, parser)
+            if _xml_cache is not None:
+                _xml_cache.set_text(_xml_cache_key(article_id, db), article_xml)
+    return articles
+
+def _unescape(text:Union[str,None]) -> str:
+    """html unescape of xml text, text without entities is returned as is"""
+    if not text:
+        return ""
+    return html.unescape(text) if "&" in text else text
+
 def _parse_article(xml_string:str, db:str) -> Union[None,ArticleParser] : 
     parsed_article = None
     if db == "pmc":
@@ -39,7 +171,7 @@ def _parse_article(xml_string:str, db:str) -> Union[None,ArticleParser] :
     elif db == "pubmed":
         parsed_article = PubMedXMLParser(xml_string)
     # check if parsing was successful
-    if not parsed_article.abstract and not parsed_article.paragraphs:
+    if parsed_article is None or (not parsed_article.abstract and not parsed_article.paragraphs):
         parsed_article = None
     return parsed_article
 
@@ -47,34 +179,77 @@ def _reformat_article(parsed_article:ArticleParser) -> Dict[str,Any] :
     reformatted_article = {"Title":[parsed_article.title]}
     for sec_title,sentence in parsed_article.abstract :
         sec_title = "Abstract" if sec_title is None else "Abstract - " + sec_title
-        reformatted_article[sec_title] = reformatted_article.get(sec_title,[]) + [sentence]
+        reformatted_article.setdefault(sec_title, []).append(sentence)
     for sec_title,sentence in parsed_article.paragraphs :
-        reformatted_article[sec_title] = reformatted_article.get(sec_title,[]) + [sentence]
+        reformatted_article.setdefault(sec_title, []).append(sentence)
     return reformatted_article
     
 
 def dl_and_parse(article_id:str) -> Dict[str,Union[None,Any]]:
     """Fetch article from PubMed or PMC using the ID using Entrez efetch 
     and parse it using the appropriate parser. Then returns dict containing keys : 
-    article_xml(raw xml of downloaded article) and
+    db (pubmed or pmc), article_xml(raw xml of downloaded article),
     article_sections (parsed sections in the form of a dictionary with keys as section titles 
-    and values as list of text content)"""
-    parse_output = {
-        "db" : None,
+    and values as list of text content) and error (None, or one of `PARSE_ERRORS` if article_sections is None)"""
+    parse_output = _init_parse_output(_db_parser(article_id))
+    # parse id for correct db format
+    if parse_output["db"] is None:
+        return parse_output
+    parse_output["article_xml"] = _get_article_xml(article_id, parse_output["db"])
+    return _parse_output(parse_output)
+
+def _init_parse_output(db:Union[str,None]) -> Dict[str,Union[None,Any]]:
+    return {
+        "db" : db,
         "article_xml": None,
         "article_sections": None,
+        "error": "invalid_id" if db is None else None,
     }
-    # parse id for correct db format
-    parse_output["db"] = _db_parser(article_id)
-    if parse_output["db"] is None:
+
+def _parse_output(
+        parse_output:Dict[str,Union[None,Any]], 
+        article_parser:Union[ArticleParser,None]=None,
+    ) -> Dict[str,Union[None,Any]]:
+    """Fill article_sections (and error) of a parse output dict from its db and article_xml,
+    or from the already parsed article of `article_parser`. Sections parsed from xml are cached 
+    in the stage cache if it is set"""
+    if parse_output["article_xml"] is None:
+        parse_output["error"] = "not_found"
         return parse_output
-    parse_output["article_xml"] = _dl_article_xml(article_id, parse_output["db"])
-    article_parser = _parse_article(parse_output["article_xml"], parse_output["db"])
-    if article_parser is None :
+    stage_cache = get_stage_cache() if article_parser is None else None
+    stage_inputs = [parse_output["db"], parse_output["article_xml"]]
+    cached = stage_cache.get("parse", stage_inputs) if stage_cache is not None else None
+    if cached is not None:
+        parse_output.update(cached)
         return parse_output
-    parse_output["article_sections"] = _reformat_article(article_parser)
+    if article_parser is None:
+        article_parser = _parse_article(parse_output["article_xml"], parse_output["db"])
+    elif not article_parser.abstract and not article_parser.paragraphs:
+        article_parser = None
+    if article_parser is None :
+        parse_output["error"] = "no_text"
+    else:
+        parse_output["article_sections"] = _reformat_article(article_parser)
+    if stage_cache is not None:
+        stage_cache.set("parse", stage_inputs, {
+            "article_sections": parse_output["article_sections"], 
+            "error": parse_output["error"],
+        })
     return parse_output
 
+def dl_and_parse_many(article_ids:Iterable[str]) -> Generator[tuple[str,Dict[str,Union[None,Any]]], None, None]:
+    """Same as `dl_and_parse` for several ids : ids are grouped by db and fetched in bulk
+    with efetch, each efetch response is parsed once for all its articles.
+    Yields tuples (article_id, parse_output) grouped by db, articles missing
+    from efetch responses have the "not_found" error"""
+    for db, db_ids in _group_ids_by_db(article_ids).items():
+        articles = _dl_articles(db_ids, db) if db is not None else {}
+        for article_id in db_ids:
+            parse_output = _init_parse_output(db)
+            article_xml, article_parser = articles.get(article_id, (None, None))
+            parse_output["article_xml"] = article_xml
+            yield article_id, _parse_output(parse_output, article_parser)
+
 class ArticleParser(ABC):
     """An abstract base class for article parsers."""
 
@@ -126,6 +301,48 @@ class JATSXMLParser(ArticleParser):
             obj = cls(stream)
         return obj
 
+    @classmethod
+    def from_element(cls, article: Element) -> JATSXMLParser:
+        """Create a parser of an already parsed `article` element."""
+        obj = cls.__new__(cls)
+        ArticleParser.__init__(obj)
+        obj.content = article
+        return obj
+
+    @classmethod
+    def iter_elements(cls, root: Element) -> Generator[JATSXMLParser, None, None]:
+        """Yield a parser per article of a parsed pmc-articleset (or single article)."""
+        articles = [root] if root.tag == "article" else root.iterfind("article")
+        for article in articles:
+            yield cls.from_element(article)
+
+    @cached_property
+    def article_id(self) -> str | None:
+        """PMCID of the article (with PMC prefix)."""
+        return _article_xml_id(self.content, "pmc")
+
+    @classmethod
+    def iter_articles(cls, xml_stream: IO[Any]) -> Generator[JATSXMLParser, None, None]:
+        """Incrementally parse a JATS xml stream (single article or pmc-articleset) and yield a
+        parser per article. Back matter (references) is cleared as soon as it is parsed and each
+        article is cleared once consumed, so memory does not grow with the number of articles.
+
+        Parsers are only valid until the next article is yielded.
+        """
+        root = None
+        for event, element in ElementTree.iterparse(xml_stream, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag == "back":
+                element.clear()
+            elif element.tag == "article":
+                yield cls.from_element(element)
+                element.clear()
+                if root is not element:
+                    root.clear()
+
     @classmethod
     def from_zip(cls, path: str | Path) -> JATSXMLParser:
         with ZipFile(path) as myzip:
@@ -147,12 +364,12 @@ class JATSXMLParser(ArticleParser):
                 obj = cls(fh)
         return obj
 
-    @property
+    @cached_property
     def title(self) -> str:
         titles = self.content.find("./front/article-meta/title-group/article-title")
         return self._element_to_str(titles)
 
-    @property
+    @cached_property
     def abstract(self) -> list[tuple[str, str]]:
         abstract = self.content.find("./front/article-meta/abstract")
         abstract_list: list[tuple[str, str]] = []
@@ -161,37 +378,33 @@ class JATSXMLParser(ArticleParser):
                 abstract_list.append((sec_title,text))
         return abstract_list
 
-    @property
+    @cached_property
     def paragraphs(self) -> list[tuple[str, str]]:
         paragraph_list: list[tuple[str, str]] = []
+        body = self.content.find("./body")
+        if body is None:
+            return paragraph_list
 
         # Paragraphs of text body
-        body = self.content.find("./body")
         if body:
             paragraph_list.extend(self.parse_section(body,""))
 
-        # Figure captions
-        figs = self.content.findall("./body//fig")
-        for fig in figs:
-            fig_captions = fig.findall("caption")
-            if fig_captions is None:
-                continue
-            caption = " ".join(self._element_to_str(c) for c in list(fig_captions))
-            if caption:
-                paragraph_list.append(("Figure Caption", caption))
-
-        # Table captions
-        tables = self.content.findall("./body//table-wrap")
-        for table in tables:
-            caption_elements = table.findall("./caption/p") or table.findall(
-                "./caption/title"
-            )
-            if caption_elements is None:
-                continue
-            caption = " ".join(self._element_to_str(c) for c in caption_elements)
-            if caption:
-                paragraph_list.append(("Table Caption", caption))
-        return paragraph_list
+        # Figure and table captions, collected in a single pass over the body
+        figure_captions: list[tuple[str, str]] = []
+        table_captions: list[tuple[str, str]] = []
+        for element in body.iter():
+            if element.tag == "fig":
+                caption = " ".join(self._element_to_str(c) for c in element.findall("caption"))
+                if caption:
+                    figure_captions.append(("Figure Caption", caption))
+            elif element.tag == "table-wrap":
+                caption_elements = element.findall("./caption/p") or element.findall(
+                    "./caption/title"
+                )
+                caption = " ".join(self._element_to_str(c) for c in caption_elements)
+                if caption:
+                    table_captions.append(("Table Caption", caption))
+        return paragraph_list + figure_captions + table_captions
     
     def parse_section(self, section: Element, sec_title_path: str = "") -> Generator[tuple[str, str], None, None]:
         sec_title = self._element_to_str(section.find("title"))
@@ -201,7 +414,7 @@ class JATSXMLParser(ArticleParser):
         for element in section:
             if element.tag == "sec":
                 yield from self.parse_section(element, sec_title_path)
-            elif element.tag in {"title", "caption", "fig", "table-wrap", "label"}:
+            elif element.tag in _JATS_SECTION_SKIPPED_TAGS:
                 continue
             else:
                 text = self._element_to_str(element)
@@ -209,28 +422,23 @@ class JATSXMLParser(ArticleParser):
                     yield sec_title_path, text
 
     def _inner_text(self, element: Element) -> str:
-        text_parts = [html.unescape(element.text or "")]
+        text_parts = [_unescape(element.text)]
         for sub_element in element:
             # recursively parse the sub-element
             text_parts.append(self._element_to_str(sub_element))
             # don't forget the text after the sub-element
-            text_parts.append(html.unescape(sub_element.tail or ""))
-        return unicodedata.normalize("NFKC", "".join(text_parts)).strip()
+            text_parts.append(_unescape(sub_element.tail))
+        text = "".join(text_parts)
+        # ascii text is unchanged by NFKC normalization
+        if not text.isascii():
+            text = unicodedata.normalize("NFKC", text)
+        return text.strip()
 
     def _element_to_str(self, element: Element | None) -> str:
         if element is None:
             return ""
 
-        if element.tag in {
-            "bold",
-            "italic",
-            "monospace",
-            "p",
-            "sc",
-            "styled-content",
-            "underline",
-            "xref",
-        }:
+        if element.tag in _JATS_INNER_TEXT_TAGS:
             # Mostly styling tags for which getting the inner text is enough.
             # Currently this is the same as the default handling. Writing it out
             # explicitly here to decouple from the default handling, which may
@@ -240,13 +448,7 @@ class JATSXMLParser(ArticleParser):
             return f"_{self._inner_text(element)}"
         elif element.tag == "sup":
             return f"^{self._inner_text(element)}"
-        elif element.tag in {
-            "disp-formula",
-            "email",
-            "ext-link",
-            "inline-formula",
-            "uri",
-        }:
+        elif element.tag in _JATS_IGNORED_TAGS:
             return ""
         else:
             # Default handling for all other element tags
@@ -258,18 +460,41 @@ class PubMedXMLParser(ArticleParser):
 
     def __init__(self, data: str | bytes) -> None:
         super().__init__()
-        self.content = ElementTree.fromstring(data)
+        root = ElementTree.fromstring(data)
+        # first article of a PubmedArticleSet
+        article = root if root.tag == "PubmedArticle" else root.find("PubmedArticle")
+        self.content = article if article is not None else root
 
-    @property
+    @classmethod
+    def from_element(cls, article: Element) -> PubMedXMLParser:
+        """Create a parser of an already parsed `PubmedArticle` element."""
+        obj = cls.__new__(cls)
+        ArticleParser.__init__(obj)
+        obj.content = article
+        return obj
+
+    @classmethod
+    def iter_elements(cls, root: Element) -> Generator[PubMedXMLParser, None, None]:
+        """Yield a parser per article of a parsed PubmedArticleSet (or single PubmedArticle)."""
+        articles = [root] if root.tag == "PubmedArticle" else root.iterfind("PubmedArticle")
+        for article in articles:
+            yield cls.from_element(article)
+
+    @cached_property
+    def article_id(self) -> str | None:
+        """PMID of the article."""
+        return _article_xml_id(self.content, "pubmed")
+
+    @cached_property
     def title(self) -> str:
-        title = self.content.find("./PubmedArticle/MedlineCitation/Article/ArticleTitle")
+        title = self.content.find("./MedlineCitation/Article/ArticleTitle")
         if title is None:
             return ""
         return "".join(title.itertext())
 
-    @property
+    @cached_property
     def abstract(self) -> list[tuple[str,str]]:
-        abstract = self.content.find("./PubmedArticle/MedlineCitation/Article/Abstract")
+        abstract = self.content.find("./MedlineCitation/Article/Abstract")
 
         if abstract is None:
             # No paragraphs to parse: stop and return an empty iterable.
@@ -283,7 +508,7 @@ class PubMedXMLParser(ArticleParser):
                 abstract_list.append((sec_title,"".join(paragraph.itertext())))
         return abstract_list
 
-    @property
+    @cached_property
     def paragraphs(self) -> list[tuple[str, str]]:
         # No paragraph to parse in PubMed article sets: return an empty iterable.
         return []
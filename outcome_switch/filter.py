@@ -1,17 +1,17 @@
 import re
 from typing import Dict, List, Any, Tuple
 
-STRICT_OUTCOME_REGEX = '(outcome|end(\s)?point)'
-OUTCOME_REGEX = '(outcome|end(\s)?point|measure|assessment)'
+STRICT_OUTCOME_REGEX = r'(outcome|end(\s)?point)'
+OUTCOME_REGEX = r'(outcome|end(\s)?point|measure|assessment)'
 
-METHOD_REGEX = '(method|approach|strategy|design|protocol)'
-SAMPLE_SIZE_REGEX = 'sample\s(size|number)'
-ABSTRACT_REGEX = '(abstract|summary)'
+METHOD_REGEX = r'(method|approach|strategy|design|protocol)'
+SAMPLE_SIZE_REGEX = r'sample\s(size|number)'
+ABSTRACT_REGEX = r'(abstract|summary)'
 
-STRICT_PRIM_SEC_REGEX = f'(primary|secondary|main|)\s([a-z]+\s)?{STRICT_OUTCOME_REGEX}'
-PRIM_SEC_REGEX = f'(primary|secondary|main|)\s([a-z]+\s)?{OUTCOME_REGEX}'
-STRICT_METHOD_AND_PRIM_SEC_REGEX = f'{METHOD_REGEX}.+{STRICT_PRIM_SEC_REGEX}' 
-METHOD_AND_PRIM_SEC_REGEX = f'{METHOD_REGEX}.+{PRIM_SEC_REGEX}'
+STRICT_PRIM_SEC_REGEX = rf'(primary|secondary|main|)\s([a-z]+\s)?{STRICT_OUTCOME_REGEX}'
+PRIM_SEC_REGEX = rf'(primary|secondary|main|)\s([a-z]+\s)?{OUTCOME_REGEX}'
+STRICT_METHOD_AND_PRIM_SEC_REGEX = rf'{METHOD_REGEX}.+{STRICT_PRIM_SEC_REGEX}' 
+METHOD_AND_PRIM_SEC_REGEX = rf'{METHOD_REGEX}.+{PRIM_SEC_REGEX}'
 
 CHECK_PRIORITY = [
     ("strict_method_and_prim_sec","title",STRICT_METHOD_AND_PRIM_SEC_REGEX),
@@ -27,6 +27,15 @@ CHECK_PRIORITY = [
     ("abstract","title",ABSTRACT_REGEX),
 ]
 
+# CHECK_PRIORITY regexes compiled once
+_COMPILED_CHECK_PRIORITY = [
+    (priority_name, content_type, re.compile(regex, re.IGNORECASE))
+    for priority_name, content_type, regex in CHECK_PRIORITY
+]
+# every content rule requires an outcome keyword : contents are searched once for it, which is much cheaper
+# than searching the (primary|secondary|main|) regexes which are tried at every whitespace of a text
+_CONTENT_KEYWORDS_REGEX = re.compile(OUTCOME_REGEX, re.IGNORECASE)
+
 def filter_sections(sections_dict: Dict[str, List[str]]) -> Dict[str, Any] :
     """Filter sections to keep only the ones containing relevant information if the text is a fulltext
     else keep all sections of abstract
@@ -50,21 +59,27 @@ def filter_sections(sections_dict: Dict[str, List[str]]) -> Dict[str, Any] :
     }
     if not sections_dict:
         return filter_output
-    # else we filter the sections
+    # else we filter the sections : rules are checked by priority and the sections matching the first
+    # matching rule are kept, contents are joined and searched for outcome keywords once per section.
+    # A single scan classifying every section by its highest priority rule is slower : most articles have
+    # a section title matching one of the first rules, the loop then stops before any content is searched
     filter_output["filtered_sections"] = {} # init
-    match_found = False
-    for i, el  in enumerate(CHECK_PRIORITY) :
-        priority_name, content_type, current_regex = el
-        current_regex = re.compile(current_regex, re.IGNORECASE)
-        for title, content_list in sections_dict.items() :
-            content = title if content_type == "title" else '\n'.join(content_list)
-            if current_regex.search(content) :
-                filter_output["check_type"] = content_type
-                filter_output["regex_priority_name"] = priority_name
-                filter_output["regex_priority_index"] = i
+    contents = [None] * len(sections_dict)
+    for i, (priority_name, content_type, current_regex) in enumerate(_COMPILED_CHECK_PRIORITY) :
+        for j, (title, content_list) in enumerate(sections_dict.items()) :
+            if content_type == "title" :
+                content = title
+            else :
+                if contents[j] is None :
+                    content = '\n'.join(content_list)
+                    contents[j] = content if _CONTENT_KEYWORDS_REGEX.search(content) else ""
+                content = contents[j]
+            if content and current_regex.search(content) :
                 filter_output["filtered_sections"][title] = content_list
-                match_found = True
-        if match_found :
+        if filter_output["filtered_sections"] :
+            filter_output["check_type"] = content_type
+            filter_output["regex_priority_name"] = priority_name
+            filter_output["regex_priority_index"] = i
             break
     return filter_output
 
@@ -88,4 +103,60 @@ def get_sections_text(sections: Dict[str, List[str]]) -> str:
     sections_text = ""
     for title, content in sections.items():
         sections_text += title + '\n' + " ".join(content) + '\n'
-    return sections_text
\ No newline at end of file
+    return sections_text
+
+def normalize_text(text: str) -> str:
+    """collapse whitespaces of a text (outcome sentences are compared and cached on normalized text)"""
+    return " ".join(text.split())
+
+# boundaries of paragraphs (newlines) and sentences (end punctuation followed by an uppercase, digit or bracket)
+_SEGMENT_BOUNDARY_REGEX = {
+    "paragraphs" : re.compile(r'\n+'),
+    "sentences" : re.compile(r'\n+|(?<=[.!?])\s+(?=[A-Z0-9(\[])'),
+}
+
+def _text_segments(text: str, by: str = "sentences") -> List[Tuple[int, int]]:
+    """(start, end) character offsets in text of its non empty sentences or paragraphs"""
+    segments = []
+    start = 0
+    for boundary in _SEGMENT_BOUNDARY_REGEX[by].finditer(text):
+        if text[start:boundary.start()].strip():
+            segments.append((start, boundary.start()))
+        start = boundary.end()
+    if text[start:].strip():
+        segments.append((start, len(text)))
+    return segments
+
+def _merge_segments_entities(
+        texts: List[str],
+        segments: List[Tuple[int, int, int]],
+        segments_entities: List[List[Dict[str, Any]]],
+    ) -> List[List[Dict[str, Any]]]:
+    """entities of each text from the entities of its (text index, start, end) segments (offsets in the segment),
+    the text left out between segments is annotated as O so that the entities words cover the whole text"""
+    entities_lists = [[] for _ in texts]
+    ends = [0] * len(texts)
+    for (i, start, end), entities in zip(segments, segments_entities):
+        if start > ends[i]:
+            entities_lists[i].append({"entity_group": "O", "score": 1.0, "word": texts[i][ends[i]:start], "start": ends[i], "end": start})
+        for entity in entities:
+            entity["start"] += start
+            entity["end"] += start
+        entities_lists[i].extend(entities)
+        ends[i] = end
+    for i, text in enumerate(texts):
+        if text and len(text) > ends[i]:
+            entities_lists[i].append({"entity_group": "O", "score": 1.0, "word": text[ends[i]:], "start": ends[i], "end": len(text)})
+    return entities_lists
+
+# cue words of outcome mentions (prefixes), used to skip sentences unlikely to contain outcomes before NER
+_OUTCOME_CUES_REGEX = re.compile(
+    r'\b(outcome|end\s?point|measure|assess|evaluat|primary|secondary|efficacy|safety|score|scale|'
+    r'questionnaire|index|rate|incidence|prevalence|mortality|survival|death|change|time to|duration|level|'
+    r'frequency|proportion|number of|occurrence|response|remission|recurrence|adverse|quality of life)',
+    re.IGNORECASE,
+)
+
+def outcome_cues_score(text: str) -> int:
+    """number of outcome cue words in text, a cheap estimate of the chance that it mentions an outcome"""
+    return sum(1 for _ in _OUTCOME_CUES_REGEX.finditer(text))
@@ -0,0 +1,103 @@
+"""Matching of registry and article outcomes from their cosine similarity matrix with NumPy array operations :
+bidirectional best matches (with top-k per registry outcome and score threshold) or optimal one-to-one assignment.
+Connections are structured arrays of (registry index, article index, score) sorted by registry then article index."""
+
+from __future__ import annotations
+import numpy as np
+from typing import Union
+
+# bidirectional : best article outcomes of each registry outcome and best registry outcome of each article
+# outcome not matched yet, assignment : one-to-one matching maximizing the total score (Hungarian algorithm)
+MATCH_MODES = ("bidirectional", "assignment")
+CONNECTION_DTYPE = np.dtype([("registry", np.int32), ("article", np.int32), ("score", np.float32)])
+
+
+def connections_array(connections:list[tuple[int,int,float]]) -> np.ndarray:
+    """connections array from (registry index, article index, score) tuples, e.g. read from JSON"""
+    return _connections(*(np.array(values) for values in zip(*connections))) if connections else _connections([], [], [])
+
+def _connections(rows:np.ndarray, cols:np.ndarray, scores:np.ndarray) -> np.ndarray:
+    rows, cols, scores = np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32), np.asarray(scores)
+    # connections sorted by (registry, article), duplicate pairs are dropped
+    order = np.lexsort((cols, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    unique = np.ones(len(rows), dtype=bool)
+    unique[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    connections = np.empty(int(unique.sum()), dtype=CONNECTION_DTYPE)
+    connections["registry"], connections["article"], connections["score"] = rows[unique], cols[unique], scores[unique]
+    return connections
+
+def _linear_assignment(scores:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """rows and columns of the one-to-one assignment maximizing the sum of scores (min(n_rows, n_cols) pairs),
+    shortest augmenting path Hungarian algorithm with the updates of each step vectorized over the columns"""
+    transposed = scores.shape[0] > scores.shape[1]
+    cost = -(scores.T if transposed else scores).astype(np.float64)
+    n, m = cost.shape
+    # potentials of rows and columns, row matched to each column (1-indexed, 0 : free), previous column on path
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    matched_rows, way = np.zeros(m + 1, dtype=np.int64), np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        matched_rows[0] = i
+        j0 = 0
+        min_values = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = matched_rows[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (reduced < min_values[1:])
+            min_values[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+            candidates = np.where(free, min_values[1:], np.inf)
+            j1 = int(candidates.argmin()) + 1
+            delta = candidates[j1 - 1]
+            u[matched_rows[used]] += delta
+            v[used] -= delta
+            min_values[1:][free] -= delta
+            j0 = j1
+            if matched_rows[j0] == 0:
+                break
+        # augment along the path
+        while j0 != 0:
+            j1 = way[j0]
+            matched_rows[j0] = matched_rows[j1]
+            j0 = j1
+    cols = np.flatnonzero(matched_rows[1:])
+    rows = matched_rows[1:][cols] - 1
+    return (cols, rows) if transposed else (rows, cols)
+
+def match_outcomes(
+        scores:np.ndarray,
+        mode:str="bidirectional",
+        threshold:Union[float,None]=None,
+        top_k:int=1,
+    ) -> np.ndarray:
+    """Connections between registry outcomes (rows) and article outcomes (columns) of a similarity matrix.
+    In bidirectional mode, each registry outcome is connected to its `top_k` most similar article outcomes,
+    then each article outcome not connected yet to its most similar registry outcome.
+    In assignment mode, outcomes are matched one to one maximizing the total similarity.
+    Connections scoring below `threshold` are dropped"""
+    if mode not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode {mode}, must be one of {MATCH_MODES}")
+    n_rows, n_cols = scores.shape
+    if n_rows == 0 or n_cols == 0:
+        return _connections([], [], [])
+    if mode == "assignment":
+        rows, cols = _linear_assignment(scores)
+    else:
+        k = min(top_k, n_cols)
+        if k == 1:
+            row_cols = scores.argmax(axis=1)[:, None]
+        else:
+            row_cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        remaining_cols = np.ones(n_cols, dtype=bool)
+        remaining_cols[row_cols.ravel()] = False
+        extra_cols = np.flatnonzero(remaining_cols)
+        rows = np.concatenate([np.repeat(np.arange(n_rows), k), scores[:, extra_cols].argmax(axis=0)])
+        cols = np.concatenate([row_cols.ravel(), extra_cols])
+    connection_scores = scores[rows, cols]
+    if threshold is not None:
+        kept = connection_scores >= threshold
+        rows, cols, connection_scores = rows[kept], cols[kept], connection_scores[kept]
+    return _connections(rows, cols, connection_scores)
@@ -0,0 +1,272 @@
+"""Instrumentation of `OutcomeSwitchingDetector.detect` : each detection records its stages durations, counts
+(sections, NER tokens, entities, outcomes) and HTTP calls (host, status, latency) in a `RequestMetrics` passed to the
+registered hooks. `MetricsRegistry` is a hook aggregating them in Prometheus text format (served over HTTP or dumped
+to a file), `RequestProfiler` captures cProfile or torch profiler traces of sampled detections.
+`serve_health` exposes the readiness of a process (e.g. models loaded) to load balancers and health checks."""
+
+from __future__ import annotations
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Generator, Union
+
+# upper bounds (s) of the durations histograms buckets
+_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILER_KINDS = ("cprofile", "torch")
+_hooks = []
+_profiler = None
+# metrics of the detection running in the current context (copied to the io threads of the detection)
+_current_metrics = ContextVar("osd_request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Metrics of one detection : stages durations (s), counts and HTTP calls (host, status, latency)"""
+    def __init__(self, article_id:str):
+        self.article_id = article_id
+        self.stages = {}
+        self.counts = {}
+        self.http = []
+        self.error = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name:str) -> Generator[None,None,None]:
+        """add the duration of the block to the stage (stages running in background threads may overlap)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    def count(self, name:str, value:int) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        return {"article_id": self.article_id, "stages": dict(self.stages), "counts": dict(self.counts),
+                "http": list(self.http), "error": self.error}
+
+
+def add_metrics_hook(hook:Callable[[RequestMetrics],None]) -> None:
+    """Register a callable called with the `RequestMetrics` of each detection once it is done"""
+    _hooks.append(hook)
+
+def remove_metrics_hook(hook:Callable[[RequestMetrics],None]) -> None:
+    _hooks.remove(hook)
+
+def has_metrics_hooks() -> bool:
+    return bool(_hooks)
+
+def set_profiler(profiler:Union[RequestProfiler,None]) -> None:
+    """Set the profiler of sampled detections (None to disable profiling)"""
+    global _profiler
+    _profiler = profiler
+
+def get_profiler() -> Union[RequestProfiler,None]:
+    return _profiler
+
+@contextmanager
+def track_request(article_id:str) -> Generator[RequestMetrics,None,None]:
+    """metrics of the detection run in the block, passed to the hooks at the end of the block
+    (hooks errors are turned into warnings so that they do not fail the detection)"""
+    request_metrics = RequestMetrics(article_id)
+    token = _current_metrics.set(request_metrics)
+    try:
+        with request_metrics.stage("total"):
+            yield request_metrics
+    except BaseException as e:
+        request_metrics.error = type(e).__name__
+        raise
+    finally:
+        _current_metrics.reset(token)
+        for hook in list(_hooks):
+            try:
+                hook(request_metrics)
+            except Exception as e:
+                warnings.warn(f"metrics hook {hook!r} failed : {e!r}")
+
+def current_metrics() -> Union[RequestMetrics,None]:
+    return _current_metrics.get()
+
+def record_http(host:str, status:Union[int,str], latency:float) -> None:
+    """record an HTTP call in the metrics of the current detection, if any"""
+    request_metrics = _current_metrics.get()
+    if request_metrics is not None:
+        with request_metrics._lock:
+            request_metrics.http.append((host, status, latency))
+
+
+def _format_labels(labels:tuple[tuple[str,str],...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Hook aggregating the detections metrics in counters and durations histograms, exposed in Prometheus
+    text format by `to_prometheus`, `serve` (HTTP endpoint) or written to `textfile_path` after each detection"""
+    def __init__(self, textfile_path:Union[str,Path,None]=None, prefix:str="osd"):
+        self.textfile_path = Path(textfile_path) if textfile_path is not None else None
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _inc(self, name:str, labels:tuple, value:float=1) -> None:
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name:str, labels:tuple, value:float) -> None:
+        buckets, total, count = self._histograms.get((name, labels), ([0] * len(_DURATION_BUCKETS), 0.0, 0))
+        for i, bound in enumerate(_DURATION_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        self._histograms[(name, labels)] = (buckets, total + value, count + 1)
+
+    def __call__(self, request_metrics:RequestMetrics) -> None:
+        with self._lock:
+            self._inc("detect_requests_total", (("status", "error" if request_metrics.error else "ok"),))
+            for stage, duration in request_metrics.stages.items():
+                self._observe("stage_duration_seconds", (("stage", stage),), duration)
+            for name, value in request_metrics.counts.items():
+                self._inc("detect_items_total", (("item", name),), value)
+            for host, status, latency in request_metrics.http:
+                self._inc("http_requests_total", (("host", host), ("status", str(status))))
+                self._observe("http_duration_seconds", (("host", host),), latency)
+        if self.textfile_path is not None:
+            self.dump(self.textfile_path)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(buckets), total, count)) for key, (buckets, total, count) in self._histograms.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                declared.add(name)
+            lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                declared.add(name)
+            for bound, bucket_count in zip(_DURATION_BUCKETS, buckets):
+                lines.append(f"{self.prefix}_{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{self.prefix}_{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.prefix}_{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.prefix}_{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path:Union[str,Path]) -> None:
+        """write the metrics to a file, atomically (e.g. for the node exporter textfile collector)"""
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(self.to_prometheus())
+        tmp_path.replace(path)
+
+    def serve(self, port:int, host:str="127.0.0.1") -> int:
+        """serve the metrics at http://host:port/metrics from a background thread, returns the port"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="osd-metrics", daemon=True).start()
+        return self._server.server_port
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def serve_health(get_status:Callable[[],dict], port:int, host:str="127.0.0.1") -> ThreadingHTTPServer:
+    """serve `get_status()` as JSON at http://host:port/health from a background thread, with status 200
+    if its "status" is "ready" else 503 (loading, failed), returns the server (`shutdown` to stop it)"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/health":
+                self.send_error(404)
+                return
+            status = get_status()
+            data = json.dumps(status).encode("utf-8")
+            self.send_response(200 if status.get("status") == "ready" else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="osd-health", daemon=True).start()
+    return server
+
+
+class RequestProfiler:
+    """Profile a sample of the detections : cProfile stats (`.prof`, profiles the thread running `detect`,
+    models forward passes run in executor threads are seen as waits) or torch profiler chrome traces
+    (`.json`, torch operators of all threads), written to `output_dir`"""
+    def __init__(self, output_dir:Union[str,Path], sample_rate:float=0.01, kind:str="cprofile"):
+        if kind not in PROFILER_KINDS:
+            raise ValueError(f"Unknown profiler {kind}, must be one of {PROFILER_KINDS}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.kind = kind
+        # a single detection is profiled at a time (one profiler can be active per process)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, article_id:str) -> Generator[None,None,None]:
+        """profile the block if the detection is sampled"""
+        if random.random() >= self.sample_rate or not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            yield from self._profile(article_id)
+        finally:
+            self._lock.release()
+
+    def _profile(self, article_id:str) -> Generator[None,None,None]:
+        stem = self.output_dir / f"{article_id}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}"
+        if self.kind == "torch":
+            import torch
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as torch_profiler:
+                yield
+            torch_profiler.export_chrome_trace(str(stem) + ".json")
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(stem) + ".prof")
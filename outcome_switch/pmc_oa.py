@@ -0,0 +1,49 @@
+"""Streaming reader of local PMC Open Access full texts : bulk tar.gz packages or directories of
+JATS xml files, articles are parsed one at a time without extracting archives to disk."""
+
+from __future__ import annotations
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, Generator, IO, Union
+from outcome_switch.entrez import JATSXMLParser, _article_to_xml, _reformat_article
+
+_XML_SUFFIXES = (".xml", ".nxml")
+
+
+def _iter_xml_files(path:Union[str,Path]) -> Generator[tuple[str,IO[bytes]], None, None]:
+    """yield (name, binary stream) of the xml files of an archive or of a directory"""
+    path = Path(path)
+    if path.is_dir():
+        for xml_path in sorted(p for p in path.rglob("*") if p.suffix in _XML_SUFFIXES):
+            with open(xml_path, "rb") as stream:
+                yield xml_path.name, stream
+        return
+    # streaming mode : members are read sequentially, compression is detected
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(_XML_SUFFIXES):
+                continue
+            yield Path(member.name).name, archive.extractfile(member)
+
+
+def iter_pmc_oa_articles(
+        path:Union[str,Path], 
+        keep_xml:bool=True,
+    ) -> Generator[tuple[str,Dict[str,Union[None,Any]]], None, None]:
+    """Iterate the articles of a PMC OA bulk package (tar, tar.gz) or of a directory of JATS xml files
+    and yield tuples (article_id, parse_output) with the same parse_output dict as `dl_and_parse`
+    (db, article_xml, article_sections, error), so that they can be fed to `OutcomeSwitchingDetector.detect_parsed_many`.
+    With `keep_xml=False` the raw xml is not kept (article_xml is None, the nct id is then searched in sections text).
+    Files are parsed incrementally, article_xml is the xml of each article alone (without its back matter)"""
+    for name, stream in _iter_xml_files(path):
+        for parser in JATSXMLParser.iter_articles(stream):
+            article_id = parser.article_id or Path(name).stem
+            article_sections = None
+            if parser.abstract or parser.paragraphs:
+                article_sections = _reformat_article(parser)
+            yield article_id, {
+                "db": "pmc",
+                "article_xml": _article_to_xml(parser.content, "pmc") if keep_xml else None,
+                "article_sections": article_sections,
+                "error": None if article_sections is not None else "no_text",
+            }
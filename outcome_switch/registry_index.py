@@ -0,0 +1,218 @@
+"""Precomputed embeddings of registry outcomes built from a local dump of CTGOV APIV2 studies JSON files.
+Embeddings are stored in a memory-mapped `.npy` matrix shared by all processes reading it,
+and a JSON index maps each NCT id to its range of rows and outcomes sentences."""
+
+from __future__ import annotations
+import argparse
+import json
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Generator, Union
+from outcome_switch.ctgov import _reformat_outcomes, registry_outcomes_tuples
+from outcome_switch.filter import normalize_text
+if TYPE_CHECKING:
+    from outcome_switch.similarity import OutcomeSimilarity
+
+_EMBEDDINGS_FILENAME = "embeddings.npy"
+_INDEX_FILENAME = "index.json"
+_IVF_CENTROIDS_FILENAME = "ivf_centroids.npy"
+_IVF_ROWS_FILENAME = "ivf_rows.npy"
+_IVF_OFFSETS_FILENAME = "ivf_offsets.npy"
+_KMEANS_SAMPLES_PER_LIST = 64 # number of training samples per inverted list for k-means
+_CHUNK_SIZE = 65536 # rows of the embeddings matrix loaded at once when assigning lists or searching
+
+
+def _iter_dump_outcomes(studies_path:Union[str,Path]) -> Generator[tuple[str,list[str]], None, None]:
+    """yield (nct_id, outcomes sentences) of each study JSON file of the dump having outcomes"""
+    for path in sorted(Path(studies_path).rglob("*.json")):
+        protocol = json.loads(path.read_text(encoding="utf-8")).get("protocolSection", {})
+        nct_id = protocol.get("identificationModule", {}).get("nctId")
+        outcomes = protocol.get("outcomesModule")
+        if nct_id is None or not outcomes:
+            continue
+        yield nct_id, [sentence for _, sentence in registry_outcomes_tuples(_reformat_outcomes(outcomes))]
+
+def build_registry_index(
+        studies_path:Union[str,Path],
+        output_path:Union[str,Path],
+        outcome_sim:OutcomeSimilarity,
+        dtype:str="float16",
+        batch_size:int=256,
+    ) -> None:
+    """Encode every primary and secondary outcome of a local CTGOV dump directory with
+    the `OutcomeSimilarity` model `outcome_sim`, and write the embeddings matrix and its index in `output_path`"""
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    studies, sentences = {}, []
+    for nct_id, study_sentences in _iter_dump_outcomes(studies_path):
+        studies[nct_id] = [len(sentences), len(sentences) + len(study_sentences)]
+        sentences.extend(normalize_text(sentence) for sentence in study_sentences)
+    dim = outcome_sim.model.config.hidden_size
+    embeddings = np.lib.format.open_memmap(
+        output_path / _EMBEDDINGS_FILENAME, mode="w+", dtype=dtype, shape=(len(sentences), dim)
+    )
+    # length sorted batches limit padding
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+    for i in range(0, len(order), batch_size):
+        rows = order[i:i+batch_size]
+        embeddings[rows] = outcome_sim._encode_sentences([sentences[row] for row in rows]).numpy().astype(dtype)
+    embeddings.flush()
+    index = {
+        "model_id": outcome_sim.embedding_cache.model_id,
+        "backend": outcome_sim.backend,
+        "dtype": dtype,
+        "dim": dim,
+        "studies": studies,
+        "sentences": sentences,
+    }
+    (output_path / _INDEX_FILENAME).write_text(json.dumps(index), encoding="utf-8")
+
+def _nearest_centroids(vectors:np.ndarray, centroids:np.ndarray, n:int=1) -> np.ndarray:
+    """indices of the `n` nearest centroids (highest inner product) of each vector"""
+    scores = vectors @ centroids.T
+    if n == 1:
+        return np.argmax(scores, axis=1)[:, None]
+    return np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+def build_ivf_index(
+        index_path:Union[str,Path],
+        n_lists:Union[int,None]=None,
+        n_iter:int=10,
+        seed:int=0,
+    ) -> None:
+    """Build an inverted file (IVF) index over the embeddings of a registry index for approximate
+    nearest neighbours search : k-means centroids (spherical, embeddings are normalized)
+    and rows of each list sorted by list"""
+    index_path = Path(index_path)
+    embeddings = np.load(index_path / _EMBEDDINGS_FILENAME, mmap_mode="r")
+    n_rows = embeddings.shape[0]
+    n_lists = n_lists or max(1, int(4 * np.sqrt(n_rows)))
+    n_lists = min(n_lists, n_rows)
+    # k-means on a sample of rows
+    rng = np.random.default_rng(seed)
+    n_samples = min(n_rows, n_lists * _KMEANS_SAMPLES_PER_LIST)
+    samples = np.asarray(embeddings[np.sort(rng.choice(n_rows, n_samples, replace=False))], dtype=np.float32)
+    centroids = samples[rng.choice(n_samples, n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignments = _nearest_centroids(samples, centroids)[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, samples)
+        counts = np.bincount(assignments, minlength=n_lists)
+        # empty lists keep their previous centroid
+        sums[counts == 0] = centroids[counts == 0]
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(1e-9)
+    # assign all rows by chunks
+    assignments = np.empty(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, _CHUNK_SIZE):
+        chunk = np.asarray(embeddings[start:start+_CHUNK_SIZE], dtype=np.float32)
+        assignments[start:start+_CHUNK_SIZE] = _nearest_centroids(chunk, centroids)[:, 0]
+    rows = np.argsort(assignments, kind="stable").astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+    np.save(index_path / _IVF_CENTROIDS_FILENAME, centroids)
+    np.save(index_path / _IVF_ROWS_FILENAME, rows)
+    np.save(index_path / _IVF_OFFSETS_FILENAME, offsets)
+
+def _study_maxima(scores:np.ndarray, row_studies:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """studies of sorted `row_studies` and best scores (along the first axis) of the rows of each study"""
+    starts = np.concatenate([[0], np.flatnonzero(row_studies[1:] != row_studies[:-1]) + 1])
+    return row_studies[starts], np.maximum.reduceat(scores, starts, axis=0)
+
+
+class RegistryIndex:
+    """Read only access to a registry outcomes embeddings index built with `build_registry_index`"""
+    def __init__(self, path:Union[str,Path]):
+        path = Path(path)
+        index = json.loads((path / _INDEX_FILENAME).read_text(encoding="utf-8"))
+        # embeddings can only be compared with embeddings of the same model and inference backend
+        self.model_id = index["model_id"]
+        self.backend = index.get("backend")
+        self.studies = index["studies"]
+        self.sentences = index["sentences"]
+        self.embeddings = np.load(path / _EMBEDDINGS_FILENAME, mmap_mode="r")
+        self.nct_ids = list(self.studies)
+        # study index of each row of the embeddings matrix
+        self.row_studies = np.repeat(
+            np.arange(len(self.nct_ids)),
+            [end - start for start, end in self.studies.values()],
+        )
+        self.ivf_centroids = None
+        if (path / _IVF_CENTROIDS_FILENAME).exists():
+            self.ivf_centroids = np.load(path / _IVF_CENTROIDS_FILENAME)
+            self.ivf_rows = np.load(path / _IVF_ROWS_FILENAME, mmap_mode="r")
+            self.ivf_offsets = np.load(path / _IVF_OFFSETS_FILENAME)
+
+    def __contains__(self, nct_id:str) -> bool:
+        return nct_id in self.studies
+
+    def __len__(self) -> int:
+        return len(self.studies)
+
+    def get_embeddings(self, nct_id:str, registry_outcomes:list[tuple[str,str]]) -> Union[np.ndarray,None]:
+        """get the (n_outcomes, dim) float32 embeddings of the registry outcomes of a study,
+        None if the study is not indexed or if its outcomes differ from the indexed ones (registry updated)"""
+        if nct_id not in self.studies:
+            return None
+        start, end = self.studies[nct_id]
+        if self.sentences[start:end] != [normalize_text(sentence) for _, sentence in registry_outcomes]:
+            return None
+        return np.asarray(self.embeddings[start:end], dtype=np.float32)
+
+    def search_trials(
+            self, 
+            outcomes_embeddings:np.ndarray, 
+            top_k:int=10, 
+            n_probe:int=8,
+        ) -> list[tuple[str,float]]:
+        """Approximate search of the registered trials whose outcomes are the most similar to 
+        `outcomes_embeddings` (normalized (n_outcomes, dim) embeddings of article outcomes).
+        For each article outcome, the rows of the `n_probe` nearest IVF lists are scored (all rows if
+        no IVF index was built), a trial score is the mean over article outcomes of their best
+        cosine similarity with the trial outcomes. Returns the `top_k` (nct_id, score) sorted by score"""
+        queries = np.asarray(outcomes_embeddings, dtype=np.float32)
+        if len(queries) == 0 or len(self.nct_ids) == 0:
+            return []
+        study_scores = np.zeros(len(self.nct_ids), dtype=np.float32)
+        if self.ivf_centroids is None:
+            # all queries scored at once over contiguous chunks of rows, best score of each query for each study
+            # (a study can span two chunks)
+            best = np.full((len(self.nct_ids), len(queries)), -np.inf, dtype=np.float32)
+            for start in range(0, self.embeddings.shape[0], _CHUNK_SIZE):
+                scores = np.asarray(self.embeddings[start:start+_CHUNK_SIZE], dtype=np.float32) @ queries.T
+                studies, maxima = _study_maxima(scores, self.row_studies[start:start+_CHUNK_SIZE])
+                best[studies] = np.maximum(best[studies], maxima)
+            study_scores = np.where(np.isfinite(best), best, 0.0).sum(axis=1, dtype=np.float32)
+        else:
+            n_probe = min(n_probe, len(self.ivf_centroids))
+            for query, lists in zip(queries, _nearest_centroids(queries, self.ivf_centroids, n_probe)):
+                rows = np.sort(np.concatenate([self.ivf_rows[self.ivf_offsets[l]:self.ivf_offsets[l+1]] for l in lists]))
+                if len(rows) == 0:
+                    continue
+                # rows are sorted so their studies are too, best score of the query for each candidate study
+                studies, maxima = _study_maxima(np.asarray(self.embeddings[rows], dtype=np.float32) @ query, self.row_studies[rows])
+                study_scores[studies] += maxima
+        study_scores /= len(queries)
+        top_k = min(top_k, len(self.nct_ids))
+        top = np.argpartition(-study_scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-study_scores[top], kind="stable")]
+        return [(self.nct_ids[i], float(study_scores[i])) for i in top if study_scores[i] > 0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build registry outcomes embeddings index from a local CTGOV studies dump")
+    parser.add_argument("studies_path", help="directory of CTGOV APIV2 study JSON files")
+    parser.add_argument("output_path", help="output directory of the index")
+    parser.add_argument("--sim-path", default=None, help="similarity model path (default : sim_path of config.json)")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--ivf-lists", type=int, default=None, help="number of IVF lists (default : 4 * sqrt(n_outcomes))")
+    parser.add_argument("--no-ivf", action="store_true", help="do not build the IVF index for registry search")
+    args = parser.parse_args()
+    # the similarity model (torch) is only imported to build the index, not to search it
+    from outcome_switch import similarity
+    sim_path = args.sim_path
+    if sim_path is None:
+        with open("config.json") as f:
+            sim_path = json.load(f)["sim_path"]
+    build_registry_index(args.studies_path, args.output_path, similarity.OutcomeSimilarity(sim_path), args.dtype, args.batch_size)
+    if not args.no_ivf:
+        build_ivf_index(args.output_path, args.ivf_lists)
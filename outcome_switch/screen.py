@@ -0,0 +1,226 @@
+"""Headless batch screening : `python -m outcome_switch.screen INPUT OUTPUT [--workers 4]` detects outcome switching
+for the article ids of a text file (one pmid or pmcid per line) or for the local JATS xml files of a directory or PMC OA
+tar archive, and writes one record per article to a JSONL or Parquet file. Records are checkpointed as chunks complete,
+a rerun skips the articles already written. Models are loaded once in the main process and shared copy-on-write with
+the forked worker processes, each worker uses `--threads` torch intra-op threads."""
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Any, Generator, Iterable, Union
+from outcome_switch.cache import DiskCache
+from outcome_switch.ctgov import set_registry_cache
+from outcome_switch.entrez import set_xml_cache
+from outcome_switch.pmc_oa import iter_pmc_oa_articles
+from outcome_switch.stage_cache import StageCache, set_stage_cache
+
+# keys of the detection output written for each article (with --full all keys except article_xml)
+_RECORD_KEYS = (
+    "db", "error", "detected_nct_id", "regex_priority_name", "check_type",
+    "article_outcomes", "ctgov_outcomes", "connections", "candidate_trials",
+)
+_detector = None
+logger = logging.getLogger(__name__)
+
+
+def _read_ids(path:Union[str,Path]) -> list[str]:
+    """article ids of a text file, one per line (empty lines and lines starting with # are skipped)"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+def _checkpoint_path(output_path:Path) -> Path:
+    """records are appended to the output itself for JSONL, to a JSONL file next to it for Parquet"""
+    return output_path if output_path.suffix == ".jsonl" else output_path.with_name(output_path.name + ".checkpoint.jsonl")
+
+def _done_ids(checkpoint_path:Path) -> set[str]:
+    """ids of the articles already written, a truncated last line (interrupted write) is ignored"""
+    done = set()
+    if not checkpoint_path.exists():
+        return done
+    with open(checkpoint_path, encoding="utf-8") as checkpoint:
+        for line in checkpoint:
+            try:
+                done.add(json.loads(line)["article_id"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+def _truncate_partial_line(checkpoint_path:Path) -> None:
+    """drop a truncated last line (interrupted write) so that appended records start on a new line"""
+    if not checkpoint_path.exists():
+        return
+    with open(checkpoint_path, "rb+") as checkpoint:
+        end = checkpoint.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            checkpoint.seek(start)
+            newline = checkpoint.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            checkpoint.truncate(position)
+
+def _to_record(article_id:str, output:dict[str,Any], full:bool=False) -> dict[str,Any]:
+    keys = [key for key in output if key != "article_xml"] if full else _RECORD_KEYS
+    record = {"article_id": article_id} | {key: output.get(key) for key in keys}
+    if record.get("connections") is not None:
+        record["connections"] = record["connections"].tolist()
+    return record
+
+def _set_caches(config:dict[str,Any]) -> None:
+    if "xml_cache" in config:
+        set_xml_cache(DiskCache.from_config(config["xml_cache"]))
+    if "registry_cache" in config:
+        set_registry_cache(DiskCache.from_config(config["registry_cache"]))
+    if "stage_cache" in config:
+        set_stage_cache(StageCache.from_config(config["stage_cache"]))
+
+def _load_detector(config:dict[str,Any]):
+    """detector without embedding store (opened by each process, sqlite connections can not be shared
+    across fork) and without cross-request batchers (their threads would not exist in forked workers)"""
+    from outcome_switch import OutcomeSwitchingDetector
+    return OutcomeSwitchingDetector.from_config(
+        {key: value for key, value in config.items() if key not in {"embedding_cache", "batching"}}
+    )
+
+def _init_worker(config:dict[str,Any], threads:int) -> None:
+    """worker process initializer : pin torch threads, open caches, load the models if they were not inherited"""
+    global _detector
+    import torch
+    torch.set_num_threads(threads)
+    _set_caches(config)
+    if _detector is None:
+        _detector = _load_detector(config)
+    if "embedding_cache" in config:
+        _detector.outcome_sim.embedding_cache.store = DiskCache.from_config(config["embedding_cache"])
+
+def _screen_chunk(chunk:tuple[str,list], batch_size:int, full:bool) -> list[dict[str,Any]]:
+    """records of a chunk of ("ids", article ids) or ("parsed", (article_id, parse_output) tuples)"""
+    kind, items = chunk
+    if kind == "ids":
+        outputs = _detector.detect_many(items, batch_size)
+    else:
+        outputs = _detector.detect_parsed_many(items, batch_size)
+    return [_to_record(article_id, output, full) for article_id, output in outputs]
+
+def _iter_chunks(input_path:Path, done:set[str], chunk_size:int) -> Generator[tuple[str,list], None, None]:
+    """chunks of the articles to screen, input is a directory or tar archive of xml files, or a text file of ids"""
+    if input_path.is_dir() or input_path.name.endswith((".tar", ".tar.gz", ".tgz")):
+        chunk = []
+        for article_id, parse_output in iter_pmc_oa_articles(input_path):
+            if article_id in done:
+                continue
+            chunk.append((article_id, parse_output))
+            if len(chunk) == chunk_size:
+                yield "parsed", chunk
+                chunk = []
+        if chunk:
+            yield "parsed", chunk
+        return
+    ids = [article_id for article_id in _read_ids(input_path) if article_id not in done]
+    for start in range(0, len(ids), chunk_size):
+        yield "ids", ids[start:start+chunk_size]
+
+def _write_parquet(checkpoint_path:Path, output_path:Path) -> None:
+    import pandas as pd
+    with open(checkpoint_path, encoding="utf-8") as checkpoint:
+        records = [json.loads(line) for line in checkpoint if line.strip()]
+    # nested values (outcomes, connections) are stored as JSON strings
+    frame = pd.DataFrame.from_records(records)
+    for column in frame.columns:
+        if frame[column].map(lambda value: isinstance(value, (list, dict))).any():
+            frame[column] = frame[column].map(lambda value: None if value is None else json.dumps(value))
+    frame.to_parquet(output_path, index=False)
+
+class _ScreenChunk:
+    """picklable `_screen_chunk` with fixed options, errors are returned so that the other chunks go on"""
+    def __init__(self, batch_size:int, full:bool):
+        self.batch_size = batch_size
+        self.full = full
+
+    def __call__(self, chunk:tuple[str,list]) -> Union[list[dict[str,Any]],str]:
+        try:
+            return _screen_chunk(chunk, self.batch_size, self.full)
+        except Exception as e:
+            return f"chunk of {len(chunk[1])} articles failed : {e!r}"
+
+def _write_records(results:Iterable[Union[list[dict[str,Any]],str]], checkpoint) -> int:
+    """append records to the checkpoint as chunks complete, failed chunks are not written and retried by a rerun"""
+    n_records = 0
+    for records in results:
+        if isinstance(records, str):
+            logger.warning(records)
+            continue
+        for record in records:
+            checkpoint.write(json.dumps(record, default=float) + "\n")
+        checkpoint.flush()
+        n_records += len(records)
+    return n_records
+
+def screen(
+        input_path:Union[str,Path],
+        output_path:Union[str,Path],
+        config:dict[str,Any],
+        workers:int=1,
+        threads:Union[int,None]=None,
+        chunk_size:int=32,
+        batch_size:int=32,
+        full:bool=False,
+        start_method:Union[str,None]=None,
+    ) -> int:
+    """screen the articles of `input_path` not already in the output checkpoint, returns the number of records written.
+    With the fork start method (default where available) the models are loaded before the workers are started
+    and their weights are shared copy-on-write, with spawn each worker loads its own copy"""
+    global _detector
+    input_path, output_path = Path(input_path), Path(output_path)
+    if output_path.suffix not in {".jsonl", ".parquet"}:
+        raise ValueError(f"Unknown output format {output_path.suffix}, must be .jsonl or .parquet")
+    checkpoint_path = _checkpoint_path(output_path)
+    chunks = _iter_chunks(input_path, _done_ids(checkpoint_path), chunk_size)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    start_method = start_method or ("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    if start_method == "fork" and _detector is None:
+        _detector = _load_detector(config)
+    n_records = 0
+    _truncate_partial_line(checkpoint_path)
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        if workers == 1:
+            _init_worker(config, threads)
+            n_records = _write_records(map(_ScreenChunk(batch_size, full), chunks), checkpoint)
+        else:
+            context = multiprocessing.get_context(start_method)
+            with context.Pool(workers, initializer=_init_worker, initargs=(config, threads)) as pool:
+                n_records = _write_records(pool.imap_unordered(_ScreenChunk(batch_size, full), chunks), checkpoint)
+    if output_path.suffix == ".parquet":
+        _write_parquet(checkpoint_path, output_path)
+    return n_records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen articles for outcome switching without the Gradio app")
+    parser.add_argument("input_path", help="text file of article ids (one per line), or directory / tar archive of JATS xml files")
+    parser.add_argument("output_path", help="output file, .jsonl or .parquet (parquet requires pyarrow)")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads per worker (default : cpus / workers)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="number of articles sent to a worker at once")
+    parser.add_argument("--batch-size", type=int, default=32, help="number of articles per NER and similarity batch")
+    parser.add_argument("--full", action="store_true", help="write all detection outputs (sections, entities) except xml")
+    parser.add_argument("--start-method", default=None, choices=["fork", "spawn", "forkserver"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s : %(message)s")
+    with open(args.config) as f:
+        config = json.load(f)
+    n_records = screen(
+        args.input_path, args.output_path, config, args.workers, args.threads,
+        args.chunk_size, args.batch_size, args.full, args.start_method,
+    )
+    print(f"{n_records} articles screened, results in {args.output_path}")
@@ -1,16 +1,105 @@
+import hashlib
+import threading
+import numpy as np
 import torch
 import torch.nn.functional as F
+from collections import OrderedDict
+from typing import Generator, Union
 from sentence_transformers.util import cos_sim
 from transformers import AutoTokenizer, AutoModel
+from outcome_switch.backends import load_backend
+from outcome_switch.cache import DiskCache
+from outcome_switch.filter import normalize_text
+from outcome_switch.matching import MATCH_MODES, match_outcomes
+
+
+def _token_budget_batches(lengths: list[int], batch_size: int, max_tokens: int) -> Generator[list[int], None, None]:
+    """ yield batches of indices of sequences sorted by length, each batch has at most `batch_size`
+    sequences and at most `max_tokens` tokens once padded (a longer sequence is alone in its batch)"""
+    batch = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # sequences are sorted by length : the padded length of the batch is the length of the new sequence
+        if batch and (len(batch) == batch_size or (len(batch) + 1) * lengths[i] > max_tokens):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+class EmbeddingCache:
+    """ in-memory LRU cache of sentence embeddings keyed by model id and normalized text,
+    backed by an optional persistent store"""
+
+    def __init__(self, model_id: str, max_size: int = 10000, store: Union[DiskCache,None] = None):
+        self.model_id = model_id
+        self.max_size = max_size
+        self.store = store
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store_key(self, text: str) -> str:
+        return f"emb:{self.model_id}:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Union[torch.Tensor,None]:
+        with self._lock:
+            embedding = self._embeddings.get(text)
+            if embedding is not None:
+                self._embeddings.move_to_end(text)
+                return embedding
+        if self.store is None:
+            return None
+        data = self.store.get(self._store_key(text))
+        if data is None:
+            return None
+        embedding = torch.frombuffer(bytearray(data), dtype=torch.float32)
+        self._put(text, embedding)
+        return embedding
+
+    def set(self, text: str, embedding: torch.Tensor) -> None:
+        embedding = embedding.detach().to(torch.float32).contiguous()
+        self._put(text, embedding)
+        if self.store is not None:
+            self.store.set(self._store_key(text), embedding.numpy().tobytes())
+
+    def _put(self, text: str, embedding: torch.Tensor) -> None:
+        with self._lock:
+            self._embeddings[text] = embedding
+            self._embeddings.move_to_end(text)
+            while len(self._embeddings) > self.max_size:
+                self._embeddings.popitem(last=False)
 
 
 class OutcomeSimilarity:
     """ similarity detector between outcomes statements"""
     ID2LABEL = ["different", "similar"]
 
-    def __init__(self, model_path: str):
+    def __init__(
+            self, 
+            model_path: str, 
+            cache_size: int = 10000, 
+            embedding_store: Union[DiskCache,None] = None,
+            batch_size: int = 64,
+            max_tokens: int = 8192,
+            backend: str = "torch",
+            onnx_path: Union[str,None] = None,
+            match_mode: str = "bidirectional",
+            match_threshold: Union[float,None] = None,
+            match_top_k: int = 1,
+        ):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode {match_mode}, must be one of {MATCH_MODES}")
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModel.from_pretrained(model_path)
+        self.model = load_backend(AutoModel.from_pretrained(model_path, low_cpu_mem_usage=True), backend, onnx_path, "last_hidden_state")
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.backend = backend
+        # embeddings of each backend are cached under their own keys (int8 and onnx outputs differ from fp32)
+        self.embedding_cache = EmbeddingCache(f"{model_path}:{backend}", max_size=cache_size, store=embedding_store)
+        # matching of outcomes from the similarity matrix, see `outcome_switch.matching.match_outcomes`
+        self.match_mode = match_mode
+        self.match_threshold = match_threshold
+        self.match_top_k = match_top_k
 
     def _mean_pooling(self, model_output, attention_mask: torch.Tensor):
         """ Mean Pooling - Take attention mask into account for correct averaging"""
@@ -20,20 +109,45 @@ class OutcomeSimilarity:
             -1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
-    def _encode(self, outcomes_lot: list[tuple[str,str]]):
-        # Parse sentences
-        sentences = []
-        if len(outcomes_lot) > 0:
-            _, sentences = zip(*outcomes_lot)
-        # Tokenize sentences
-        encoded_input = self.tokenizer(
-            sentences, padding=True, truncation=True, return_tensors='pt')
-        # Compute token embeddings
-        with torch.no_grad():
-            model_output = self.model(**encoded_input)
-        # Perform pooling
-        sentence_embeddings = self._mean_pooling(
-            model_output, encoded_input['attention_mask'])
+    def _encode(self, outcomes_lot: list[tuple[str,str]]) -> torch.Tensor:
+        """ encode outcomes sentences, identical sentences are encoded once and
+        cached embeddings are reused, rows follow the order of `outcomes_lot`"""
+        sentences = [normalize_text(sentence) for _, sentence in outcomes_lot]
+        unique_sentences = list(dict.fromkeys(sentences))
+        embeddings = {sentence: self.embedding_cache.get(sentence) for sentence in unique_sentences}
+        missing_sentences = [sentence for sentence, embedding in embeddings.items() if embedding is None]
+        if missing_sentences:
+            for sentence, embedding in zip(missing_sentences, self._encode_sentences(missing_sentences)):
+                self.embedding_cache.set(sentence, embedding)
+                embeddings[sentence] = embedding
+        if not sentences:
+            return torch.empty((0, self.model.config.hidden_size))
+        unique_embeddings = torch.stack([embeddings[sentence] for sentence in unique_sentences])
+        # broadcast unique embeddings back to the original indices
+        sentence_index = {sentence: i for i, sentence in enumerate(unique_sentences)}
+        return unique_embeddings[torch.tensor([sentence_index[sentence] for sentence in sentences])]
+
+    def encode(self, outcomes_lot: list[tuple[str,str]]) -> np.ndarray:
+        """ normalized embeddings (n_outcomes, hidden_size) of (type, outcome) tuples, e.g. to search a `RegistryIndex`"""
+        return self._encode(outcomes_lot).numpy()
+
+    def _encode_sentences(self, sentences: list[str]) -> torch.Tensor:
+        """ encode sentences by micro-batches of similar lengths limited in size and padded tokens,
+        rows follow the order of `sentences`"""
+        # Tokenize sentences without padding to get their lengths
+        encoded_input = self.tokenizer(sentences, truncation=True)
+        lengths = [len(input_ids) for input_ids in encoded_input['input_ids']]
+        sentence_embeddings = torch.empty((len(sentences), self.model.config.hidden_size))
+        for batch_indices in _token_budget_batches(lengths, self.batch_size, self.max_tokens):
+            batch_input = self.tokenizer.pad(
+                {key: [values[i] for i in batch_indices] for key, values in encoded_input.items()},
+                return_tensors='pt')
+            # Compute token embeddings
+            with torch.no_grad():
+                model_output = self.model(**batch_input)
+            # Perform pooling
+            sentence_embeddings[batch_indices] = self._mean_pooling(
+                model_output, batch_input['attention_mask'])
         # Normalize embeddings
         sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
         return sentence_embeddings
@@ -41,23 +155,48 @@ class OutcomeSimilarity:
     def get_similarity(
             self, 
             registry_outcomes:list[tuple[str,str]], 
-            article_outcomes:list[tuple[str,str]]
-        ) -> list[tuple[int,int,float]]:
-        """For each outcome in true_dict, find the most similar outcome in compared_dict and return a mapping
-        of all matchs , for each tuple : registry is the first index (at i=0); article is the second index (at i=1)
-        and the third index (i=3) is the cosine similarity score"""
-        connections = set()
-        rembs = self._encode(registry_outcomes)
+            article_outcomes:list[tuple[str,str]],
+            registry_embeddings:Union[np.ndarray,None]=None,
+        ) -> np.ndarray:
+        """Match registry and article outcomes from their cosine similarity (`match_mode`, `match_threshold` and 
+        `match_top_k`, by default the most similar article outcome of each registry outcome and the most similar registry
+        outcome of each remaining article outcome) and return the connections as a structured array of (registry index, 
+        article index, cosine similarity score) sorted by registry then article index (`outcome_switch.matching.CONNECTION_DTYPE`).
+        Precomputed `registry_embeddings` (e.g. from a `RegistryIndex`) are used instead of encoding registry outcomes"""
+        rembs = self._encode(registry_outcomes) if registry_embeddings is None else torch.from_numpy(registry_embeddings)
         aembs = self._encode(article_outcomes)
-        cosines_scores = cos_sim(rembs, aembs)
-        lines_max = torch.argmax(cosines_scores, dim=1)
-        col_max = torch.argmax(cosines_scores, dim=0)
-        remaining_cols = set(range(len(col_max)))
-        for i in range(len(lines_max)):
-            connection = (i, lines_max[i].item(), cosines_scores[i, lines_max[i]].item())
-            remaining_cols.discard(lines_max[i].item())
-            connections.add(connection)
-        for j in remaining_cols:
-            connection = (col_max[j].item(), j, cosines_scores[col_max[j], j].item())
-            connections.add(connection)
-        return connections
+        return self._match(rembs, aembs)
+
+    def get_similarity_many(
+            self,
+            outcomes_pairs:list[tuple[list[tuple[str,str]],list[tuple[str,str]]]],
+            registry_embeddings_list:Union[list[Union[np.ndarray,None]],None]=None,
+        ) -> list[np.ndarray]:
+        """Same as `get_similarity` for a list of (registry_outcomes, article_outcomes) pairs,
+        all outcomes of all pairs are encoded in a single forward pass per side"""
+        if not outcomes_pairs:
+            return []
+        if registry_embeddings_list is None:
+            registry_embeddings_list = [None] * len(outcomes_pairs)
+        rembs = self._encode([outcome for (registry_outcomes,_), registry_embeddings 
+                              in zip(outcomes_pairs, registry_embeddings_list) 
+                              if registry_embeddings is None for outcome in registry_outcomes])
+        aembs = self._encode([outcome for _,article_outcomes in outcomes_pairs for outcome in article_outcomes])
+        connections_list = []
+        r_start, a_start = 0, 0
+        for (registry_outcomes, article_outcomes), registry_embeddings in zip(outcomes_pairs, registry_embeddings_list):
+            a_end = a_start + len(article_outcomes)
+            if registry_embeddings is None:
+                r_end = r_start + len(registry_outcomes)
+                pair_rembs = rembs[r_start:r_end]
+                r_start = r_end
+            else:
+                pair_rembs = torch.from_numpy(registry_embeddings)
+            connections_list.append(self._match(pair_rembs, aembs[a_start:a_end]))
+            a_start = a_end
+        return connections_list
+
+    def _match(self, rembs:torch.Tensor, aembs:torch.Tensor) -> np.ndarray:
+        """connections of the cosine similarity matrix of registry and article outcomes embeddings"""
+        cosines_scores = cos_sim(rembs, aembs).numpy()
+        return match_outcomes(cosines_scores, self.match_mode, self.match_threshold, self.match_top_k)
@@ -0,0 +1,69 @@
+"""Cache of the results of the detection stages (parse, filter, NER, similarity) keyed by the stage inputs,
+the version of the code of the stage (hash of its modules sources) and the models ids and settings, so that
+re-running a batch only recomputes the stages whose inputs changed. The registry fetch stage is cached by
+the registry cache of `outcome_switch.ctgov` (per NCT ID and last update date)."""
+
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Union
+from outcome_switch.cache import DiskCache
+
+# modules whose source code defines the result of each stage
+_STAGE_MODULES = {
+    "parse" : ("entrez",),
+    "filter" : ("filter",),
+    "ner" : ("detector", "decoding", "filter"),
+    "similarity" : ("similarity", "matching"),
+}
+_stage_cache = None
+
+@lru_cache(maxsize=None)
+def _code_version(stage:str) -> str:
+    """hash of the sources of the modules of a stage"""
+    digest = hashlib.sha256()
+    for module in _STAGE_MODULES[stage]:
+        digest.update((Path(__file__).parent / f"{module}.py").read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class StageCache:
+    """Stages results stored as JSON in a `DiskCache`, with hits and misses counts per stage"""
+    def __init__(self, store:DiskCache):
+        self.store = store
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cache_config:dict) -> StageCache:
+        """create a stage cache from a config.json cache section (path, max_size_mb, ttl_days, offline)"""
+        return cls(DiskCache.from_config(cache_config))
+
+    def _key(self, stage:str, inputs:list[Any]) -> str:
+        digest = hashlib.sha256(json.dumps(inputs, default=str).encode("utf-8")).hexdigest()
+        return f"stage:{stage}:{_code_version(stage)}:{digest}"
+
+    def get(self, stage:str, inputs:list[Any]) -> Union[Any,None]:
+        """result of the stage for these inputs, None if not cached"""
+        value = self.store.get_text(self._key(stage, inputs))
+        with self._lock:
+            (self.misses if value is None else self.hits)[stage] += 1
+        return json.loads(value) if value is not None else None
+
+    def set(self, stage:str, inputs:list[Any], value:Any) -> None:
+        # numpy scores of entities are stored as floats
+        self.store.set_text(self._key(stage, inputs), json.dumps(value, default=float))
+
+
+def set_stage_cache(cache:Union[StageCache,None]) -> None:
+    """Set the stages results cache used by `dl_and_parse` and `OutcomeSwitchingDetector` (None to disable)"""
+    global _stage_cache
+    _stage_cache = cache
+
+def get_stage_cache() -> Union[StageCache,None]:
+    return _stage_cache
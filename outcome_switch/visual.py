@@ -1,6 +1,10 @@
-import pandas as pd
-import plotly.graph_objects as go
-from typing import List, Dict, Any, Tuple, Union
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Union
+# pandas and plotly are imported when used to keep imports fast
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import plotly.graph_objects as go
 
 
 _PUBMED_LINK= "https://pubmed.ncbi.nlm.nih.gov/{article_id}/"
@@ -55,7 +59,8 @@ def _highlight_df_rows(row):
     else :
         return ['background-color: lightgrey'] * len(row)
 
-def get_registry_dataframe(registry_outcomes: list[dict[str,str]]) -> str:
+def get_registry_dataframe(registry_outcomes: list[dict[str,str]]) -> pd.io.formats.style.Styler:
+    import pandas as pd
     return pd.DataFrame(registry_outcomes).style.apply(_highlight_df_rows, axis=1)
 
 # fcts for sankey diagram
@@ -74,11 +79,14 @@ def _find_entity_score(entity_text, raw_entities):
 def get_sankey_diagram(
         registry_outcomes: list[tuple[str,str]], 
         article_outcomes: list[tuple[str,str]],
-        connections: set[tuple[int,int,float]], 
+        connections: np.ndarray, 
         raw_entities: list[Dict[str,Any]],
         cosine_threshold: float=0.44,
     ) -> go.Figure:
+    import plotly.graph_objects as go
 
+    # (registry index, article index, score) tuples of the connections array
+    connections = connections.tolist()
     color_map = {
         "primary": "red",
         "secondary": "green",
@@ -0,0 +1,67 @@
+"""Local stand-in for CTGOV APIV2 studies endpoints serving recorded study JSON files"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+CTGOV_EXAMPLES_PATH = Path(__file__).parent / "ctgov_examples"
+
+
+class CtgovStandInServer:
+    """Serve `/api/v2/studies/{nct_id}` and `/api/v2/studies?filter.ids=...` from a directory
+    of `{nct_id}.json` study files, usable as a context manager, `url` is the studies endpoint.
+    All requests are answered with `fail_status` if it is set (e.g. 500 to simulate an outage)"""
+    def __init__(self, studies_path:Path=CTGOV_EXAMPLES_PATH):
+        self.studies = {path.stem: json.loads(path.read_text()) for path in Path(studies_path).glob("*.json")}
+        self.requests = []
+        self.fail_status = None
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}/api/v2/studies"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                server.requests.append((url.path, params))
+                if server.fail_status is not None:
+                    self._send(server.fail_status, {})
+                elif url.path.startswith("/api/v2/studies/"):
+                    study = server.studies.get(url.path.rsplit("/", 1)[-1])
+                    self._send(200, study) if study is not None else self._send(404, {})
+                elif url.path == "/api/v2/studies":
+                    nct_ids = params.get("filter.ids", [""])[0].replace("|", ",").split(",")
+                    studies = [server.studies[nct_id] for nct_id in nct_ids if nct_id in server.studies]
+                    page_size = int(params.get("pageSize", ["10"])[0])
+                    start = int(params.get("pageToken", ["0"])[0])
+                    page = {"studies": studies[start:start + page_size]}
+                    if start + page_size < len(studies):
+                        page["nextPageToken"] = str(start + page_size)
+                    self._send(200, page)
+                else:
+                    self._send(404, {})
+
+            def _send(self, status:int, body:dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,79 @@
+"""Local stand-in for the Entrez efetch endpoint serving the articles of `outcome_switch/data`"""
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+PARSE_EXAMPLES_PATH = Path(__file__).parent.parent / "outcome_switch" / "data"
+# example article used as template of each db, its id is replaced by the requested id
+_TEMPLATES = {
+    "pubmed": ("36473651.xml", "36473651", r"<PubmedArticle>.*</PubmedArticle>", "PubmedArticleSet"),
+    "pmc": ("PMC11102686.xml", "11102686", r"<article .*</article>", "pmc-articleset"),
+}
+# ClinicalTrials.gov registration of a PubMed article
+_DATABANK = ("<DataBankList CompleteYN=\"Y\"><DataBank><DataBankName>ClinicalTrials.gov</DataBankName>"
+             "<AccessionNumberList><AccessionNumber>{}</AccessionNumber></AccessionNumberList></DataBank></DataBankList>")
+
+
+class EntrezStandInServer:
+    """Serve efetch requests (`?db=pubmed|pmc&id=...`) for any id : each article is the example article
+    of the db with the requested id, usable as a context manager, `url` is the efetch endpoint.
+    PubMed articles are registered with `nct_id` (DataBank) if given, `delay` (s) is added to each response"""
+    def __init__(self, examples_path:Path=PARSE_EXAMPLES_PATH, nct_id:str=None, delay:float=0.0):
+        self.templates = {}
+        for db, (filename, template_id, article_regex, _) in _TEMPLATES.items():
+            article = re.search(article_regex, (Path(examples_path) / filename).read_text(), re.S).group()
+            if db == "pubmed" and nct_id is not None:
+                article = article.replace("</Article>", _DATABANK.format(nct_id) + "</Article>", 1)
+            self.templates[db] = (article, template_id)
+        self.delay = delay
+        self.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}/entrez/eutils/efetch.fcgi"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def articleset(self, db:str, article_ids:list[str]) -> str:
+        article, template_id = self.templates[db]
+        articles = "".join(article.replace(template_id, article_id.removeprefix("PMC")) for article_id in article_ids)
+        root = _TEMPLATES[db][3]
+        return f"<?xml version=\"1.0\"?>\n<{root}>{articles}</{root}>"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                server.requests.append((url.path, params))
+                db = params.get("db", [""])[0]
+                article_ids = params.get("id", [""])[0].split(",")
+                if db not in server.templates or not all(article_ids):
+                    self._send(400, "")
+                    return
+                if server.delay:
+                    time.sleep(server.delay)
+                self._send(200, server.articleset(db, article_ids))
+
+            def _send(self, status:int, body:str):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
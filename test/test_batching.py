@@ -0,0 +1,58 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from outcome_switch.batching import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+
+    def test_concurrent_items_batched(self):
+        calls = []
+        release = threading.Event()
+        def process(items):
+            release.wait(timeout=5)
+            calls.append(list(items))
+            return [item * 2 for item in items]
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=200)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(batcher.submit, i) for i in range(8)]
+            release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(results, [i * 2 for i in range(8)])
+        self.assertTrue(all(len(items) <= 4 for items in calls))
+        self.assertLess(len(calls), 8)
+        self.assertEqual(sum(batcher.batch_sizes), 8)
+
+    def test_single_item_not_delayed_beyond_wait(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=16, max_wait_ms=1)
+        self.assertEqual(batcher.submit(1), 2)
+        self.assertEqual(batcher.batch_sizes, [1])
+
+    def test_exception_raised_to_all_items(self):
+        def process(items):
+            raise ValueError("model error")
+        batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.submit("text")
+        # worker keeps running after an error
+        batcher.process = lambda items: items
+        self.assertEqual(batcher.submit("text"), "text")
+
+    def test_base_exception_raised_to_all_items(self):
+        def process(items):
+            raise KeyboardInterrupt
+        batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=1)
+        with self.assertRaises(KeyboardInterrupt):
+            batcher.submit("text")
+        batcher.process = lambda items: items
+        self.assertEqual(batcher.submit("text"), "text")
+
+    def test_batches_run_on_executor(self):
+        threads = []
+        def process(items):
+            threads.append(threading.current_thread().name)
+            return items
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="model") as model_executor:
+            batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=1, executor=model_executor)
+            self.assertEqual(batcher.submit("text"), "text")
+        self.assertTrue(threads[0].startswith("model"))
@@ -0,0 +1,68 @@
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from outcome_switch.cache import DiskCache
+
+_KEY_1 = "efetch:pmc:PMC11102686"
+_KEY_2 = "efetch:pubmed:36473651"
+_VALUE = b"<article>" + b"outcome " * 1000 + b"</article>"
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_set_get(self):
+        cache = DiskCache(self.tmp_dir.name)
+        self.assertIsNone(cache.get(_KEY_1))
+        cache.set(_KEY_1, _VALUE)
+        self.assertEqual(cache.get(_KEY_1), _VALUE)
+        self.assertLess(cache.size(), len(_VALUE))
+
+    def test_persistence(self):
+        DiskCache(self.tmp_dir.name).set_text(_KEY_1, "text")
+        self.assertEqual(DiskCache(self.tmp_dir.name).get_text(_KEY_1), "text")
+
+    def test_same_content_stored_once(self):
+        cache = DiskCache(self.tmp_dir.name)
+        cache.set(_KEY_1, _VALUE)
+        size = cache.size()
+        cache.set(_KEY_2, _VALUE)
+        self.assertEqual(cache.size(), size)
+
+    def test_ttl_eviction(self):
+        cache = DiskCache(self.tmp_dir.name, ttl=0.01)
+        cache.set(_KEY_1, _VALUE)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(_KEY_1))
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.tmp_dir.name, compression_level=0, max_size=len(_VALUE) + 10)
+        cache.set(_KEY_1, _VALUE)
+        cache.set(_KEY_2, _VALUE + b"2")
+        self.assertIsNone(cache.get(_KEY_1))
+        self.assertIsNotNone(cache.get(_KEY_2))
+
+    def test_concurrent_writers_same_content(self):
+        # writers of several processes store the same blobs at once (e.g. "null" registry outcomes)
+        def write(worker):
+            cache = DiskCache(self.tmp_dir.name)
+            for i in range(20):
+                cache.set_text(f"ctgov:NCT{worker:04d}{i:04d}:latest", "null")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write, range(8)))
+        cache = DiskCache(self.tmp_dir.name)
+        self.assertEqual(cache.get_text("ctgov:NCT00070019:latest"), "null")
+        self.assertEqual([path.name for path in cache._blobs_path.rglob("*.tmp")], [])
+
+    def test_recent_access_not_written(self):
+        cache = DiskCache(self.tmp_dir.name)
+        cache.set(_KEY_1, _VALUE)
+        accessed = cache._db.execute("SELECT accessed FROM entries").fetchone()[0]
+        cache.get(_KEY_1)
+        self.assertEqual(cache._db.execute("SELECT accessed FROM entries").fetchone()[0], accessed)
@@ -0,0 +1,61 @@
+import time
+import unittest
+from ctgov_server import CtgovStandInServer
+from outcome_switch.client import HttpClient, TokenBucket
+
+_RATE = 20.0
+_N_REQUESTS = 10
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_is_not_limited(self):
+        bucket = TokenBucket(_RATE, capacity=_N_REQUESTS)
+        start = time.monotonic()
+        for _ in range(_N_REQUESTS):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.5 * _N_REQUESTS / _RATE)
+
+    def test_rate_is_limited(self):
+        bucket = TokenBucket(_RATE, capacity=1)
+        start = time.monotonic()
+        for _ in range(_N_REQUESTS):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, (_N_REQUESTS - 1) / _RATE * 0.9)
+
+class CountingBucket(TokenBucket):
+    def __init__(self, rate:float):
+        super().__init__(rate)
+        self.acquired = 0
+
+    def acquire(self) -> None:
+        self.acquired += 1
+        super().acquire()
+
+class HttpClientRetryTest(unittest.TestCase):
+
+    def test_retries_are_rate_limited(self):
+        client = HttpClient(max_retries=2, backoff_factor=0.0)
+        bucket = client._buckets["127.0.0.1"] = CountingBucket(1000.0)
+        with CtgovStandInServer() as server:
+            server.fail_status = 503
+            response = client.get(server.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(bucket.acquired, 3)
+            server.fail_status = None
+            server.requests.clear()
+            self.assertEqual(client.get(server.url).status_code, 200)
+            self.assertEqual(len(server.requests), 1)
+
+class HttpClientStatsTest(unittest.TestCase):
+
+    def test_latency_stats(self):
+        client = HttpClient()
+        for latency in (0.1, 0.2, 0.3):
+            client._record("example.org", latency, error=False)
+        client._record("example.org", 0.4, error=True)
+        stats = client.latency_stats()["example.org"]
+        self.assertEqual(stats["count"], 4)
+        self.assertEqual(stats["errors"], 1)
+        self.assertAlmostEqual(stats["mean"], 0.25)
+        self.assertEqual(stats["max"], 0.4)
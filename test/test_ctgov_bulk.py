@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from ctgov_server import CtgovStandInServer
+from outcome_switch import ctgov
+from outcome_switch.cache import DiskCache
+from outcome_switch.client import HttpClient, set_client
+
+_TEXT_WITH_OUTCOMES_NCT = "blablabla nct id is NCT04647656 blabla"
+_TEXT_WITH_SHORT_NCT = "blablabla nct id is nct4647656 blabla"
+_TEXT_WITHOUT_OUTCOMES_NCT = "blablabla nct id is NCT06562582 blabla"
+_TEXT_WITH_UNKNOWN_NCT = "blablabla nct id is NCT01234567 blabla"
+_TEXT_WITHOUT_NCT = "blablabla blablabla"
+
+
+class CtgovBulkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CtgovStandInServer().__enter__()
+        self.default_url = ctgov._CTGOV_API_URL
+        ctgov.set_ctgov_api_url(self.server.url)
+
+    def tearDown(self):
+        ctgov.set_ctgov_api_url(self.default_url)
+        ctgov.set_registry_cache(None)
+        set_client(None)
+        self.server.__exit__()
+
+    def test_extract_many(self):
+        outcomes_list = ctgov.extract_nct_outcomes_many([
+            _TEXT_WITH_OUTCOMES_NCT, _TEXT_WITHOUT_OUTCOMES_NCT, _TEXT_WITH_UNKNOWN_NCT, _TEXT_WITHOUT_NCT, None
+        ])
+        self.assertEqual([outcome["type"] for outcome in outcomes_list[0]], ["primary", "secondary"])
+        self.assertEqual(outcomes_list[1:], [None, None, None, None])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_shared_nct_fetched_once(self):
+        outcomes_list = ctgov.extract_nct_outcomes_many([_TEXT_WITH_OUTCOMES_NCT, _TEXT_WITH_SHORT_NCT])
+        self.assertEqual(outcomes_list[0], outcomes_list[1])
+        self.assertEqual(self.server.requests[0][1]["filter.ids"], ["NCT04647656"])
+
+    def test_cache_keyed_on_last_update(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ctgov.set_registry_cache(DiskCache(tmp_dir))
+            first = ctgov.extract_nct_outcomes(_TEXT_WITH_OUTCOMES_NCT)
+            # studies never cached are fetched without last update date query
+            self.assertEqual([params["fields"] for _, params in self.server.requests], [[ctgov._OUTCOMES_FIELDS]])
+            n_requests = len(self.server.requests)
+            self.assertEqual(ctgov.extract_nct_outcomes(_TEXT_WITH_OUTCOMES_NCT), first)
+            # only the last update date is queried for cached studies
+            self.assertEqual(len(self.server.requests), n_requests + 1)
+            self.assertEqual(self.server.requests[-1][1]["fields"], [ctgov._LAST_UPDATE_FIELDS])
+            # a study update invalidates the cached outcomes
+            status = self.server.studies["NCT04647656"]["protocolSection"]["statusModule"]
+            status["lastUpdatePostDateStruct"]["date"] = "2025-01-01"
+            ctgov.extract_nct_outcomes(_TEXT_WITH_OUTCOMES_NCT)
+            self.assertEqual(self.server.requests[-1][1]["fields"], [ctgov._OUTCOMES_FIELDS])
+
+    def test_cache_served_when_registry_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ctgov.set_registry_cache(DiskCache(tmp_dir))
+            first = ctgov.extract_nct_outcomes(_TEXT_WITH_OUTCOMES_NCT)
+            self.assertIsNotNone(first)
+            self.server.fail_status = 500
+            set_client(HttpClient(max_retries=0))
+            n_requests = len(self.server.requests)
+            # last update date query fails : latest cached outcomes, without outcomes query
+            self.assertEqual(ctgov.extract_nct_outcomes(_TEXT_WITH_OUTCOMES_NCT), first)
+            self.assertTrue(all(params["fields"] == [ctgov._LAST_UPDATE_FIELDS] for _, params in self.server.requests[n_requests:]))
+            # studies not cached are still unavailable
+            self.assertEqual(ctgov.get_registry_outcomes_many(["NCT06562582"]), {"NCT06562582": None})
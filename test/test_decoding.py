@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from outcome_switch.decoding import decode_entities
+from outcome_switch.filter import filter_outcomes
+
+_ID2LABEL = {0: "O", 1: "B-PrimaryOutcome", 2: "I-PrimaryOutcome", 3: "B-SecondaryOutcome", 4: "I-SecondaryOutcome"}
+_TEXT = "The primary outcome is painscore at 12 months and QoL."
+# tokens (start, end, label) : "painscore" is split in two subwords, "." is a word
+_WORD_IDS = [-1, 0, 1, 2, 3, 4, 4, 5, 6, 7, 8, 9, 10, -1, -1, -1]
+_TOKENS = [
+    (0, 3, 0), (4, 11, 0), (12, 19, 0), (20, 22, 0), (23, 27, 1), (27, 32, 2),
+    (33, 35, 2), (36, 38, 2), (39, 45, 2), (46, 49, 0), (50, 53, 3), (53, 54, 0),
+]
+
+
+def _window(tokens, seq_len):
+    """logits and offsets of a window with [CLS] and [SEP] special tokens, padded to seq_len"""
+    logits = np.zeros((seq_len, len(_ID2LABEL)), dtype=np.float32)
+    offsets = np.zeros((seq_len, 2), dtype=np.int64)
+    for i, (start, end, label) in enumerate(tokens, start=1):
+        logits[i, label] = 5.0
+        offsets[i] = (start, end)
+    return logits, offsets
+
+
+class DecodeEntitiesTest(unittest.TestCase):
+
+    def test_single_window(self):
+        logits, offsets = _window(_TOKENS, 16)
+        entities = decode_entities(logits[None], offsets[None], _TEXT, _ID2LABEL, np.array([_WORD_IDS]))
+        self.assertEqual(
+            [(entity["entity_group"], entity["word"]) for entity in entities],
+            [("O", "The primary outcome is"), ("PrimaryOutcome", "painscore at 12 months"), ("O", "and"),
+             ("SecondaryOutcome", "QoL"), ("O", ".")],
+        )
+        self.assertTrue(all(_TEXT[entity["start"]:entity["end"]] == entity["word"] for entity in entities))
+        self.assertEqual(filter_outcomes(entities), [("primary", "painscore at 12 months"), ("secondary", "QoL")])
+
+    def test_overlapping_windows(self):
+        logits, offsets = _window(_TOKENS, 16)
+        first_logits, first_offsets = _window(_TOKENS[:6], 10)
+        second_logits, second_offsets = _window(_TOKENS[3:], 10)
+        windows_entities = decode_entities(
+            np.stack([first_logits, second_logits]), np.stack([first_offsets, second_offsets]), _TEXT, _ID2LABEL
+        )
+        entities = decode_entities(logits[None], offsets[None], _TEXT, _ID2LABEL)
+        # "painscore" of the first window and "is" of the second window are replaced by the longer
+        # overlapping entities of the other window, as in the pipeline
+        self.assertEqual(windows_entities, entities)
+
+    def test_words_from_tokens(self):
+        logits, offsets = _window(_TOKENS, 16)
+        tokens = ["[CLS]", "the", "primary", "outcome", "is", "pain", "##score", "at", "12", "months", "and", "qol", ".",
+                  "[SEP]", "[PAD]", "[PAD]"]
+        tokens_to_string = lambda tokens: " ".join(tokens).replace(" ##", "")
+        entities = decode_entities(logits[None], offsets[None], _TEXT, _ID2LABEL, np.array([_WORD_IDS]),
+                                   np.array([tokens], dtype=object), tokens_to_string)
+        self.assertEqual([entity["word"] for entity in entities],
+                         ["the primary outcome is", "painscore at 12 months", "and", "qol", "."])
+
+    def test_words_from_offsets(self):
+        logits, offsets = _window(_TOKENS, 16)
+        entities = decode_entities(logits[None], offsets[None], _TEXT, _ID2LABEL)
+        # without word ids, "QoL." is a single word whose averaged scores tie between B-SecondaryOutcome and O
+        self.assertEqual(entities[-1]["word"], "and QoL.")
+        self.assertEqual(filter_outcomes(entities), [("primary", "painscore at 12 months")])
+
+    def test_subwords_averaged(self):
+        tokens = list(_TOKENS)
+        tokens[5] = (27, 32, 0)
+        logits, offsets = _window(tokens, 16)
+        # second subword of "painscore" predicted O with a lower score than the first subword
+        logits[6, 0] = 2.0
+        entities = decode_entities(logits[None], offsets[None], _TEXT, _ID2LABEL)
+        self.assertEqual(entities[1]["word"], "painscore at 12 months")
+
+    def test_empty(self):
+        logits, offsets = _window([], 4)
+        self.assertEqual(decode_entities(logits[None], offsets[None], "", _ID2LABEL), [])
@@ -0,0 +1,125 @@
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import torch
+from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast, TokenClassificationPipeline
+from outcome_switch.detector import _NER_STRIDE, OutcomeSwitchingDetector
+
+_TEXT = "Methods\nPatients were recruited in 3 centers. The primary outcome is pain at 12 months.\n"
+
+
+def _stub_detector(**attributes) -> OutcomeSwitchingDetector:
+    """detector without models, the methods running models are replaced by the tests"""
+    detector = OutcomeSwitchingDetector.__new__(OutcomeSwitchingDetector)
+    detector.__dict__.update(attributes)
+    return detector
+
+
+class NerPrefilterTest(unittest.TestCase):
+
+    def test_prefilter_requires_segments(self):
+        # raised before any model is loaded
+        with self.assertRaises(ValueError):
+            OutcomeSwitchingDetector("ner_path", "sim_path", {}, ner_mode="strided", ner_prefilter=1)
+
+    def test_prefiltered_segments_not_run(self):
+        ner_segments = []
+        def ner_batch(segments):
+            ner_segments.extend(segments)
+            return [[{"entity_group": "O", "score": 1.0, "word": segment, "start": 0, "end": len(segment)}]
+                    for segment in segments]
+        detector = _stub_detector(ner_mode="sentences", ner_decoding="vectorized", ner_prefilter=1,
+                                  ner_batch_size=16, _ner_executor=None, _ner_batch=ner_batch)
+        entities = detector._ner([_TEXT])[0]
+        self.assertEqual(ner_segments, ["The primary outcome is pain at 12 months."])
+        self.assertEqual("".join(entity["word"] for entity in entities), _TEXT)
+        detector.ner_prefilter = 0
+        ner_segments.clear()
+        detector._ner([_TEXT])
+        self.assertEqual(sorted(ner_segments), ["Methods", "Patients were recruited in 3 centers.",
+                                                "The primary outcome is pain at 12 months."])
+
+
+class NerDecodingTest(unittest.TestCase):
+    """the vectorized decoding returns the entities of the pipeline"""
+
+    _ID2LABEL = {0: "O", 1: "B-PrimaryOutcome", 2: "I-PrimaryOutcome", 3: "B-SecondaryOutcome", 4: "I-SecondaryOutcome"}
+    _VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "primary", "secondary", "outcome", "outcomes",
+              "was", "were", "is", "pain", "##score", "at", "12", "months", "and", "qol", "function", "-", ".", ","]
+
+    def setUp(self):
+        torch.manual_seed(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vocab_path = Path(tmp_dir) / "vocab.txt"
+            vocab_path.write_text("\n".join(self._VOCAB))
+            tokenizer = BertTokenizerFast(str(vocab_path), model_max_length=80)
+        config = BertConfig(vocab_size=len(self._VOCAB), hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+                            intermediate_size=32, max_position_embeddings=80, id2label=self._ID2LABEL,
+                            label2id={v: k for k, v in self._ID2LABEL.items()})
+        model = BertForTokenClassification(config).eval()
+        self.pipeline = TokenClassificationPipeline(model=model, tokenizer=tokenizer, ignore_labels=[],
+                                                    aggregation_strategy="average", stride=_NER_STRIDE)
+
+    def test_same_entities(self):
+        sentence = "The primary outcome was Painscore at 12-months, and QoL was a secondary outcome. "
+        # the last segment is split in overlapping windows
+        segments = [sentence, "Function at 12 months (xyzzy).", 8 * sentence]
+        detector = _stub_detector(ner_batch_size=2)
+        expected = self.pipeline(segments, batch_size=len(segments))
+        for entities, segment_expected in zip(detector._ner_decode(self.pipeline, segments), expected):
+            self.assertEqual([(entity["entity_group"], entity["word"], entity["start"], entity["end"]) for entity in entities],
+                             [(entity["entity_group"], entity["word"], entity["start"], entity["end"])
+                              for entity in segment_expected])
+            for entity, entity_expected in zip(entities, segment_expected):
+                self.assertAlmostEqual(entity["score"], float(entity_expected["score"]), places=4)
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+        def detect(article_id, request_metrics):
+            self.calls.append(article_id)
+            self.started.set()
+            self.release.wait(timeout=5)
+            if self.error is not None:
+                raise self.error
+            return {"article_id": article_id, "article_outcomes": [("primary", "pain")]}
+        self.detector = _stub_detector(_inflight={}, _inflight_lock=threading.Lock(), _detect=detect)
+
+    def _concurrent_detect(self, n_calls:int) -> list:
+        """`n_calls` concurrent detections of the same id, released once the others wait for the first one"""
+        def call():
+            try:
+                return self.detector.detect("36473651")
+            except Exception as e:
+                return e
+        with ThreadPoolExecutor(max_workers=n_calls) as executor:
+            futures = [executor.submit(call)]
+            self.assertTrue(self.started.wait(timeout=5))
+            futures += [executor.submit(call) for _ in range(n_calls - 1)]
+            time.sleep(0.2)
+            self.release.set()
+            return [future.result() for future in futures]
+
+    def test_one_detection_per_id(self):
+        outputs = self._concurrent_detect(4)
+        self.assertEqual(self.calls, ["36473651"])
+        self.assertTrue(all(output == outputs[0] for output in outputs))
+        self.assertEqual(self.detector._inflight, {})
+        # outputs are copies, a caller modifying its output does not change the others
+        outputs[0]["article_outcomes"].append(("secondary", "function"))
+        self.assertEqual(outputs[1]["article_outcomes"], [("primary", "pain")])
+
+    def test_exception_raised_to_all_callers(self):
+        self.error = RuntimeError("registry unavailable")
+        outputs = self._concurrent_detect(4)
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(output is self.error for output in outputs))
+        self.assertEqual(self.detector._inflight, {})
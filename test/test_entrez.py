@@ -1,5 +1,9 @@
 import unittest
-from outcome_switch.entrez import _dl_article_xml, _parse_article, _reformat_article
+from entrez_server import EntrezStandInServer
+from outcome_switch import entrez
+from outcome_switch.ctgov import detect_nct_id
+from outcome_switch.entrez import (_dl_article_xml, _parse_article, _reformat_article, 
+                                   _group_ids_by_db, _article_to_xml, _normalize_article_id, parse_articleset)
 
 # Efetch tests
 _VALID_PMCID = "PMC6206648"
@@ -10,6 +14,8 @@ _INVALID_2 = "0123456789"
 _EMPTY = ""
 
 # XML Parsing tests files
+_PMC_XML_PATH = "outcome_switch/data/PMC11102686.xml"
+_PUBMED_XML_PATH = "outcome_switch/data/36473651.xml"
 # TODO :  tests for parsing XML files 
 
 
@@ -35,4 +41,78 @@ class EntrezEfetchTest(unittest.TestCase):
     
     def test_empty(self):
         self.assertIsNone(_dl_article_xml(_EMPTY)[0])
-        self.assertIsNone(_dl_article_xml(_EMPTY)[1])
\ No newline at end of file
+        self.assertIsNone(_dl_article_xml(_EMPTY)[1])
+
+class EntrezBulkTest(unittest.TestCase):
+
+    def test_group_ids_by_db(self):
+        groups = _group_ids_by_db([_VALID_PMCID, _VALID_PMID_1, _INVALID_1, _VALID_PMID_2])
+        self.assertEqual(groups["pmc"], [_VALID_PMCID])
+        self.assertEqual(groups["pubmed"], [_VALID_PMID_1, _VALID_PMID_2])
+        self.assertEqual(groups[None], [_INVALID_1])
+
+    def test_normalize_article_id(self):
+        self.assertEqual(_normalize_article_id(" pmc6206648\n"), _VALID_PMCID)
+        self.assertEqual(_normalize_article_id(_VALID_PMID_1 + " "), _VALID_PMID_1)
+
+    def test_parse_pmc_articleset(self):
+        parsers = parse_articleset(open(_PMC_XML_PATH).read(), "pmc")
+        self.assertEqual(list(parsers), ["PMC11102686"])
+        self.assertTrue(parsers["PMC11102686"].paragraphs)
+        article_xml = _article_to_xml(parsers["PMC11102686"].content, "pmc")
+        self.assertIsNotNone(_parse_article(article_xml, "pmc"))
+
+    def test_parse_pubmed_articleset(self):
+        xml_string = open(_PUBMED_XML_PATH).read()
+        start, end = xml_string.index("<PubmedArticle>"), xml_string.index("</PubmedArticle>") + len("</PubmedArticle>")
+        second_article = xml_string[start:end].replace(">36473651</PMID>", ">36473652</PMID>", 1)
+        xml_string = xml_string[:end] + second_article + xml_string[end:]
+        parsers = parse_articleset(xml_string, "pubmed")
+        self.assertEqual(list(parsers), ["36473651", "36473652"])
+        self.assertEqual(parsers["36473652"].title, parsers["36473651"].title)
+        article_xml = _article_to_xml(parsers["36473652"].content, "pubmed")
+        self.assertEqual(_parse_article(article_xml, "pubmed").title, "Efficacy and safety of COVID-19 vaccines.")
+
+
+class EntrezStandInTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EntrezStandInServer(nct_id="NCT04647656").__enter__()
+        self.default_url = entrez._ENTREZ_EFETCH_URL
+        entrez.set_entrez_efetch_url(self.server.url)
+
+    def tearDown(self):
+        entrez.set_entrez_efetch_url(self.default_url)
+        self.server.__exit__()
+
+    def test_dl_and_parse(self):
+        parse_output = entrez.dl_and_parse("12345678")
+        self.assertIsNone(parse_output["error"])
+        self.assertEqual(detect_nct_id(parse_output["article_xml"]), "NCT04647656")
+        self.assertEqual(entrez.dl_and_parse("PMC123")["db"], "pmc")
+
+    def test_dl_and_parse_many(self):
+        outputs = dict(entrez.dl_and_parse_many(["1", "2", "PMC3"]))
+        self.assertEqual(set(outputs), {"1", "2", "PMC3"})
+        self.assertTrue(all(output["article_sections"] for output in outputs.values()))
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class ArticleParserTest(unittest.TestCase):
+
+    def test_pmc_sections_memoized(self):
+        parser = _parse_article(open(_PMC_XML_PATH).read(), "pmc")
+        self.assertIs(parser.abstract, parser.abstract)
+        self.assertIs(parser.paragraphs, parser.paragraphs)
+
+    def test_pmc_captions_after_body(self):
+        parser = _parse_article(open(_PMC_XML_PATH).read(), "pmc")
+        sec_titles = [sec_title for sec_title, _ in parser.paragraphs]
+        n_captions = sum(sec_title in {"Figure Caption", "Table Caption"} for sec_title in sec_titles)
+        self.assertGreater(n_captions, 0)
+        self.assertTrue(all(sec_title in {"Figure Caption", "Table Caption"} for sec_title in sec_titles[-n_captions:]))
+
+    def test_pubmed_reformat(self):
+        article_sections = _reformat_article(_parse_article(open(_PUBMED_XML_PATH).read(), "pubmed"))
+        self.assertEqual(article_sections["Title"], ["Efficacy and safety of COVID-19 vaccines."])
+        self.assertIn("Abstract - BACKGROUND", article_sections)
@@ -1,5 +1,6 @@
 import unittest
-from outcome_switch import filter_sections, filter_outcomes, get_sections_text
+from outcome_switch import filter_sections, get_sections_text
+from outcome_switch.filter import normalize_text, outcome_cues_score, _text_segments, _merge_segments_entities
 
 _VALID_DICT_WITH_2_SECTIONS = {
     "Methods - Outcomes - Primary outcome": [
@@ -40,4 +41,74 @@ _FILTERED_SECTIONS = {
 }
 
 
-_EMPTY_DICT = {}
\ No newline at end of file
+_EMPTY_DICT = {}
+
+class FilterSectionsTest(unittest.TestCase):
+
+    def test_valid_dict(self):
+        self.assertEqual(filter_sections(_VALID_DICT_WITH_2_SECTIONS), _FILTERED_SECTIONS)
+
+    def test_empty_dict(self):
+        filter_output = filter_sections(_EMPTY_DICT)
+        self.assertIsNone(filter_output["filtered_sections"])
+        self.assertIsNone(filter_output["regex_priority_index"])
+
+    def test_no_match(self):
+        filter_output = filter_sections({"Introduction": ["Background of the trial."]})
+        self.assertEqual(filter_output["filtered_sections"], {})
+        self.assertIsNone(filter_output["regex_priority_name"])
+
+    def test_content_rule_before_lower_title_rule(self):
+        sections = {
+            "Study design": ["Patients were randomized."],
+            "Endpoints": ["The primary endpoint was mortality."],
+            "Analysis": ["The main outcome was analysed by intention to treat."],
+        }
+        filter_output = filter_sections(sections)
+        # "outcome" title rule (3) of "Endpoints" is found before the content rules
+        self.assertEqual(filter_output["regex_priority_index"], 3)
+        self.assertEqual(list(filter_output["filtered_sections"]), ["Endpoints"])
+        sections = {"Results" if title == "Endpoints" else title: content for title, content in sections.items()}
+        filter_output = filter_sections(sections)
+        self.assertEqual(filter_output["regex_priority_name"], "strict_prim_sec")
+        self.assertEqual(filter_output["check_type"], "content")
+        self.assertEqual(list(filter_output["filtered_sections"]), ["Results", "Analysis"])
+
+
+class TextSegmentsTest(unittest.TestCase):
+
+    def test_segments_offsets(self):
+        text = get_sections_text(_VALID_DICT_WITH_2_SECTIONS)
+        for by in ("sentences", "paragraphs"):
+            segments = _text_segments(text, by)
+            self.assertTrue(all(text[start:end].strip() for start, end in segments))
+            # segments are ordered and only whitespace is left out
+            self.assertTrue(all(end <= next_start for (_, end), (next_start, _) in zip(segments, segments[1:])))
+            self.assertEqual(" ".join(text[start:end] for start, end in segments).split(), text.split())
+
+    def test_merged_entities_cover_text(self):
+        texts = [get_sections_text(_VALID_DICT_WITH_2_SECTIONS), "", "  Trailing outcome text.\n\n"]
+        for by in ("sentences", "paragraphs"):
+            segments = [(i, start, end) for i, text in enumerate(texts) for start, end in _text_segments(text, by)]
+            segments_entities = [
+                [{"entity_group": "O", "score": 1.0, "word": texts[i][start:end], "start": 0, "end": end - start}]
+                for i, start, end in segments
+            ]
+            entities_lists = _merge_segments_entities(texts, segments, segments_entities)
+            for text, entities in zip(texts, entities_lists):
+                self.assertEqual("".join(entity["word"] for entity in entities), text)
+                self.assertTrue(all(text[entity["start"]:entity["end"]] == entity["word"] for entity in entities))
+
+    def test_sentences_split(self):
+        text = "Methods\nThe primary outcome is pain. Secondary outcomes include:\n\nHip function (HOS)."
+        sentences = [text[start:end] for start, end in _text_segments(text)]
+        self.assertEqual(sentences, ["Methods", "The primary outcome is pain.", "Secondary outcomes include:", "Hip function (HOS)."])
+        paragraphs = [text[start:end] for start, end in _text_segments(text, "paragraphs")]
+        self.assertEqual(paragraphs, ["Methods", "The primary outcome is pain. Secondary outcomes include:", "Hip function (HOS)."])
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  pain \n at 12  months "), "pain at 12 months")
+
+    def test_outcome_cues_score(self):
+        self.assertEqual(outcome_cues_score("Patients were recruited in 3 centers."), 0)
+        self.assertEqual(outcome_cues_score("The primary endpoint is the change of pain score."), 4)
@@ -0,0 +1,48 @@
+import itertools
+import unittest
+import numpy as np
+from outcome_switch.matching import CONNECTION_DTYPE, _linear_assignment, connections_array, match_outcomes
+
+# similarity of 3 registry outcomes (rows) and 4 article outcomes (columns)
+_SCORES = np.array([
+    [0.9, 0.8, 0.1, 0.2],
+    [0.85, 0.3, 0.2, 0.1],
+    [0.1, 0.2, 0.3, 0.6],
+], dtype=np.float32)
+
+
+class MatchOutcomesTest(unittest.TestCase):
+
+    def test_bidirectional(self):
+        connections = match_outcomes(_SCORES)
+        self.assertEqual(connections.dtype, CONNECTION_DTYPE)
+        # best column of each row, then best row of columns 1 and 2
+        self.assertEqual([(i, j) for i, j, _ in connections.tolist()], [(0, 0), (0, 1), (1, 0), (2, 2), (2, 3)])
+        np.testing.assert_allclose(connections["score"], [0.9, 0.8, 0.85, 0.3, 0.6])
+
+    def test_top_k_and_threshold(self):
+        connections = match_outcomes(_SCORES, top_k=2, threshold=0.5)
+        self.assertEqual([(i, j) for i, j, _ in connections.tolist()], [(0, 0), (0, 1), (1, 0), (2, 3)])
+
+    def test_assignment(self):
+        connections = match_outcomes(_SCORES, mode="assignment")
+        self.assertEqual([(i, j) for i, j, _ in connections.tolist()], [(0, 1), (1, 0), (2, 3)])
+
+    def test_assignment_is_optimal(self):
+        rng = np.random.default_rng(0)
+        for n_rows, n_cols in [(3, 5), (5, 3), (4, 4)]:
+            scores = rng.random((n_rows, n_cols))
+            rows, cols = _linear_assignment(scores)
+            self.assertEqual(len(set(rows.tolist())), min(n_rows, n_cols))
+            self.assertEqual(len(set(cols.tolist())), min(n_rows, n_cols))
+            best = max(
+                sum(scores[i, j] for i, j in zip(permutation, range(n_cols))) if n_rows > n_cols
+                else sum(scores[i, j] for i, j in zip(range(n_rows), permutation))
+                for permutation in itertools.permutations(range(max(n_rows, n_cols)), min(n_rows, n_cols))
+            )
+            self.assertAlmostEqual(scores[rows, cols].sum(), best)
+
+    def test_empty_and_from_tuples(self):
+        self.assertEqual(len(match_outcomes(np.zeros((0, 3), dtype=np.float32))), 0)
+        self.assertEqual(len(connections_array([])), 0)
+        self.assertEqual(connections_array([[1, 0, 0.5], [0, 2, 0.25]]).tolist(), [(0, 2, 0.25), (1, 0, 0.5)])
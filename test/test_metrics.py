@@ -0,0 +1,82 @@
+import json
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+from ctgov_server import CtgovStandInServer
+from outcome_switch import ctgov
+from outcome_switch.metrics import (MetricsRegistry, RequestProfiler, add_metrics_hook, 
+                                    remove_metrics_hook, serve_health, track_request)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        add_metrics_hook(self.records.append)
+
+    def tearDown(self):
+        remove_metrics_hook(self.records.append)
+
+    def test_track_request(self):
+        with track_request("36473651") as request_metrics:
+            with request_metrics.stage("filter_sections"):
+                pass
+            request_metrics.count("sections", 3)
+        self.assertEqual(self.records, [request_metrics])
+        self.assertEqual(set(request_metrics.stages), {"total", "filter_sections"})
+        self.assertEqual(request_metrics.counts, {"sections": 3})
+        self.assertIsNone(request_metrics.error)
+
+    def test_error_recorded(self):
+        with self.assertRaises(ValueError):
+            with track_request("36473651"):
+                raise ValueError()
+        self.assertEqual(self.records[0].error, "ValueError")
+
+    def test_http_calls_recorded(self):
+        with CtgovStandInServer() as server:
+            default_url = ctgov._CTGOV_API_URL
+            ctgov.set_ctgov_api_url(server.url)
+            try:
+                with track_request("36473651") as request_metrics:
+                    ctgov.extract_nct_outcomes("nct id is NCT04647656")
+            finally:
+                ctgov.set_ctgov_api_url(default_url)
+        self.assertEqual([(host, status) for host, status, _ in request_metrics.http], [("127.0.0.1", 200)])
+
+    def test_prometheus_text(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry = MetricsRegistry(Path(tmp_dir) / "metrics.prom")
+            with track_request("36473651") as request_metrics:
+                request_metrics.count("article_outcomes", 2)
+            registry(request_metrics)
+            text = (Path(tmp_dir) / "metrics.prom").read_text()
+        self.assertIn('osd_detect_requests_total{status="ok"} 1', text)
+        self.assertIn('osd_detect_items_total{item="article_outcomes"} 2', text)
+        self.assertIn('osd_stage_duration_seconds_count{stage="total"} 1', text)
+        self.assertIn('osd_stage_duration_seconds_bucket{stage="total",le="+Inf"} 1', text)
+
+    def test_profiler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = RequestProfiler(tmp_dir, sample_rate=1.0)
+            with profiler.profile("36473651"):
+                sum(range(1000))
+            self.assertEqual(len(list(Path(tmp_dir).glob("36473651-*.prof"))), 1)
+
+    def test_health(self):
+        status = {"status": "loading"}
+        server = serve_health(lambda: status, 0)
+        url = f"http://127.0.0.1:{server.server_port}/health"
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(url)
+            self.assertEqual(context.exception.code, 503)
+            context.exception.close()
+            status["status"] = "ready"
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(json.loads(response.read()), {"status": "ready"})
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,57 @@
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from outcome_switch.ctgov import detect_nct_id
+from outcome_switch.entrez import _parse_article, _reformat_article
+from outcome_switch.pmc_oa import iter_pmc_oa_articles
+
+_PMC_XML_PATH = Path("outcome_switch/data/PMC11102686.xml")
+_PMCID = "PMC11102686"
+
+
+class PmcOaArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.xml_string = _PMC_XML_PATH.read_text()
+        self.expected_sections = _reformat_article(_parse_article(self.xml_string, "pmc"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_tar_gz_archive(self):
+        archive_path = Path(self.tmp_dir.name) / "oa_comm_xml.tar.gz"
+        with tarfile.open(archive_path, "w:gz") as archive:
+            archive.add(_PMC_XML_PATH, arcname=f"PMC011xxxxxx/{_PMCID}.xml")
+            archive.add(_PMC_XML_PATH, arcname="PMC011xxxxxx/copy.nxml")
+        articles = list(iter_pmc_oa_articles(archive_path))
+        self.assertEqual([article_id for article_id, _ in articles], [_PMCID, _PMCID])
+        for _, parse_output in articles:
+            self.assertEqual(parse_output["db"], "pmc")
+            self.assertEqual(parse_output["article_sections"], self.expected_sections)
+
+    def test_directory_without_xml(self):
+        (Path(self.tmp_dir.name) / f"{_PMCID}.xml").write_text(self.xml_string)
+        [(article_id, parse_output)] = iter_pmc_oa_articles(self.tmp_dir.name, keep_xml=False)
+        self.assertEqual(article_id, _PMCID)
+        self.assertIsNone(parse_output["article_xml"])
+        self.assertEqual(parse_output["article_sections"], self.expected_sections)
+
+    def test_articleset_with_several_articles(self):
+        article = self.xml_string[self.xml_string.index("<article "):self.xml_string.rindex("</pmc-articleset>")]
+        (Path(self.tmp_dir.name) / "set.xml").write_text(f"<pmc-articleset>{article}{article}</pmc-articleset>")
+        articles = list(iter_pmc_oa_articles(self.tmp_dir.name))
+        self.assertEqual(len(articles), 2)
+        self.assertEqual(articles[1][1]["article_sections"], self.expected_sections)
+
+    def test_articleset_articles_own_xml(self):
+        article = self.xml_string[self.xml_string.index("<article "):self.xml_string.rindex("</pmc-articleset>")]
+        registered = [
+            article.replace("<abstract", f"<abstract><p>Trial registration {nct_id}.</p></abstract><abstract", 1)
+            for nct_id in ("NCT04647656", "NCT06562582")
+        ]
+        (Path(self.tmp_dir.name) / "set.xml").write_text(f"<pmc-articleset>{''.join(registered)}</pmc-articleset>")
+        articles = list(iter_pmc_oa_articles(self.tmp_dir.name))
+        self.assertEqual([detect_nct_id(parse_output["article_xml"]) for _, parse_output in articles], 
+                         ["NCT04647656", "NCT06562582"])
@@ -0,0 +1,69 @@
+import json
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from pathlib import Path
+from outcome_switch import registry_index
+from outcome_switch.registry_index import RegistryIndex, build_ivf_index
+
+_N_STUDIES = 200
+_N_OUTCOMES_PER_STUDY = 5
+_DIM = 32
+
+
+def _write_random_index(path:Path) -> np.ndarray:
+    """write an index of random normalized embeddings without encoding model"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(_N_STUDIES * _N_OUTCOMES_PER_STUDY, _DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(path / "embeddings.npy", embeddings.astype(np.float16))
+    studies = {f"NCT{i:08d}": [i * _N_OUTCOMES_PER_STUDY, (i + 1) * _N_OUTCOMES_PER_STUDY] for i in range(_N_STUDIES)}
+    sentences = [f"outcome {i}" for i in range(len(embeddings))]
+    index = {"model_id": "random", "dtype": "float16", "dim": _DIM, "studies": studies, "sentences": sentences}
+    (path / "index.json").write_text(json.dumps(index))
+    return embeddings
+
+
+class RegistryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.embeddings = _write_random_index(self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_embeddings(self):
+        index = RegistryIndex(self.path)
+        embeddings = index.get_embeddings("NCT00000001", [("primary", "outcome 5"), ("primary", "outcome 6"), 
+                                                          ("primary", "outcome 7"), ("secondary", "outcome 8"), 
+                                                          ("secondary", "outcome  9")])
+        np.testing.assert_allclose(embeddings, self.embeddings[5:10], atol=1e-3)
+        self.assertIsNone(index.get_embeddings("NCT00000001", [("primary", "updated outcome")]))
+        self.assertIsNone(index.get_embeddings("NCT99999999", [("primary", "outcome 5")]))
+
+    def test_exact_search(self):
+        index = RegistryIndex(self.path)
+        trials = index.search_trials(self.embeddings[10:15], top_k=3)
+        self.assertEqual(trials[0][0], "NCT00000002")
+        self.assertAlmostEqual(trials[0][1], 1.0, places=2)
+
+    def test_exact_search_scores(self):
+        queries = self.embeddings[[3, 10, 500]]
+        # mean over queries of the best similarity with the outcomes of each study
+        expected = (self.embeddings @ queries.T).reshape(_N_STUDIES, _N_OUTCOMES_PER_STUDY, -1).max(axis=1).mean(axis=1)
+        # chunks not aligned with studies
+        with mock.patch.object(registry_index, "_CHUNK_SIZE", 7):
+            trials = RegistryIndex(self.path).search_trials(queries, top_k=10)
+        for nct_id, score in trials:
+            self.assertAlmostEqual(score, expected[int(nct_id[3:])], places=2)
+        self.assertEqual({nct_id for nct_id, _ in trials[:3]}, {"NCT00000000", "NCT00000002", "NCT00000100"})
+
+    def test_ivf_search(self):
+        build_ivf_index(self.path, n_lists=16)
+        index = RegistryIndex(self.path)
+        self.assertEqual(len(index.ivf_rows), len(self.embeddings))
+        trials = index.search_trials(self.embeddings[10:15], top_k=3, n_probe=2)
+        self.assertEqual(trials[0][0], "NCT00000002")
@@ -0,0 +1,58 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from outcome_switch.matching import connections_array
+from outcome_switch.screen import (_checkpoint_path, _done_ids, _iter_chunks, _read_ids, _to_record,
+                                  _truncate_partial_line, _write_records)
+
+
+class ScreenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_ids(self):
+        (self.path / "ids.txt").write_text("# ids\n36473651\n\nPMC11102686 \n36473651\n")
+        self.assertEqual(_read_ids(self.path / "ids.txt"), ["36473651", "PMC11102686"])
+
+    def test_resume_skips_done_ids(self):
+        (self.path / "ids.txt").write_text("1\n2\n3\n4\n5\n")
+        checkpoint_path = _checkpoint_path(self.path / "out.parquet")
+        self.assertEqual(checkpoint_path.name, "out.parquet.checkpoint.jsonl")
+        # last line truncated by an interrupted write
+        checkpoint_path.write_text('{"article_id": "1"}\n{"article_id": "3"}\n{"article_id": "5", "db"')
+        done = _done_ids(checkpoint_path)
+        self.assertEqual(done, {"1", "3"})
+        self.assertEqual(list(_iter_chunks(self.path / "ids.txt", done, 2)), [("ids", ["2", "4"]), ("ids", ["5"])])
+        # records appended by the rerun start on a new line
+        _truncate_partial_line(checkpoint_path)
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            checkpoint.write('{"article_id": "5"}\n')
+        self.assertEqual(_done_ids(checkpoint_path), {"1", "3", "5"})
+        checkpoint_path.write_text('{"article_id": "1"')
+        _truncate_partial_line(checkpoint_path)
+        self.assertEqual(checkpoint_path.read_text(), "")
+
+    def test_parsed_chunks(self):
+        chunks = list(_iter_chunks(Path("outcome_switch/data"), set(), 32))
+        self.assertTrue(chunks)
+        self.assertTrue(all(kind == "parsed" for kind, _ in chunks))
+
+    def test_to_record(self):
+        output = {"db": "pubmed", "article_xml": "<xml/>", "error": None, "connections": connections_array([(1, 0, 0.5), (0, 0, 0.25)])}
+        record = _to_record("36473651", output)
+        self.assertEqual(record["connections"], [(0, 0, 0.25), (1, 0, 0.5)])
+        self.assertNotIn("article_xml", _to_record("36473651", output, full=True))
+
+    def test_failed_chunk_logged(self):
+        checkpoint = io.StringIO()
+        results = [[{"article_id": "1"}], "chunk of 1 articles failed : TimeoutError()", [{"article_id": "2"}]]
+        with self.assertLogs("outcome_switch.screen", level="WARNING") as logs:
+            self.assertEqual(_write_records(results, checkpoint), 2)
+        self.assertEqual(logs.output, ["WARNING:outcome_switch.screen:chunk of 1 articles failed : TimeoutError()"])
+        self.assertEqual(checkpoint.getvalue(), '{"article_id": "1"}\n{"article_id": "2"}\n')
@@ -0,0 +1,22 @@
+import unittest
+from outcome_switch.similarity import _token_budget_batches
+
+_LENGTHS = [12, 3, 50, 7, 7, 200, 5]
+
+
+class TokenBudgetBatchesTest(unittest.TestCase):
+
+    def test_all_indices_batched_once(self):
+        batches = list(_token_budget_batches(_LENGTHS, batch_size=3, max_tokens=64))
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(_LENGTHS))))
+
+    def test_batches_sorted_by_length(self):
+        batches = list(_token_budget_batches(_LENGTHS, batch_size=3, max_tokens=64))
+        lengths = [_LENGTHS[i] for batch in batches for i in batch]
+        self.assertEqual(lengths, sorted(_LENGTHS))
+
+    def test_batch_limits(self):
+        for batch in _token_budget_batches(_LENGTHS, batch_size=3, max_tokens=64):
+            self.assertLessEqual(len(batch), 3)
+            padded_tokens = len(batch) * max(_LENGTHS[i] for i in batch)
+            self.assertTrue(padded_tokens <= 64 or len(batch) == 1)
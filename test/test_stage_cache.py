@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from outcome_switch.cache import DiskCache
+from outcome_switch.entrez import dl_and_parse, set_xml_cache, _xml_cache_key
+from outcome_switch.stage_cache import StageCache, set_stage_cache
+
+_PUBMED_ID = "36473651"
+_PUBMED_XML_PATH = "outcome_switch/data/36473651.xml"
+_SECTIONS = {"Methods - Outcomes": ["The primary outcome is pain at 12 months."]}
+
+
+class StageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stage_cache = StageCache(DiskCache(self.tmp_dir.name + "/stages"))
+
+    def tearDown(self):
+        set_stage_cache(None)
+        set_xml_cache(None)
+        self.tmp_dir.cleanup()
+
+    def test_set_get(self):
+        self.assertIsNone(self.stage_cache.get("filter", [_SECTIONS]))
+        self.stage_cache.set("filter", [_SECTIONS], {"filtered_sections": _SECTIONS})
+        self.assertEqual(self.stage_cache.get("filter", [_SECTIONS]), {"filtered_sections": _SECTIONS})
+        self.assertEqual((self.stage_cache.hits["filter"], self.stage_cache.misses["filter"]), (1, 1))
+
+    def test_key_depends_on_inputs_and_stage(self):
+        self.stage_cache.set("ner", ["text", "model-a"], {"article_outcomes": []})
+        self.assertIsNone(self.stage_cache.get("ner", ["text", "model-b"]))
+        self.assertIsNone(self.stage_cache.get("ner", ["other text", "model-a"]))
+        self.assertIsNone(self.stage_cache.get("similarity", ["text", "model-a"]))
+
+    def test_parse_stage_cached(self):
+        xml_cache = DiskCache(self.tmp_dir.name + "/xml", offline=True)
+        xml_cache.set_text(_xml_cache_key(_PUBMED_ID, "pubmed"), open(_PUBMED_XML_PATH).read())
+        set_xml_cache(xml_cache)
+        set_stage_cache(self.stage_cache)
+        parse_output = dl_and_parse(_PUBMED_ID)
+        self.assertEqual(self.stage_cache.misses["parse"], 1)
+        self.assertEqual(dl_and_parse(_PUBMED_ID), parse_output)
+        self.assertEqual(self.stage_cache.hits["parse"], 1)